@@ -0,0 +1,61 @@
+"""unique and screener indexes
+
+Revision ID: eec17527f7c8
+Revises: 9eb275f2fe55
+Create Date: 2026-10-18 15:40:12.802316
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'eec17527f7c8'
+down_revision = '9eb275f2fe55'
+
+from alembic import op
+import sqlalchemy as sa
+
+# the stocks with the same symbol and market as an older one
+DUPLICATES = ('SELECT s.id FROM stock s WHERE EXISTS '
+              '(SELECT 1 FROM stock k WHERE k.symbol = s.symbol '
+              'AND k.market = s.market AND k.id < s.id)')
+
+def keeper(table):
+    ''' SQL for the oldest stock with the symbol and market of the one
+    table's row belongs to '''
+    return ('(SELECT min(k.id) FROM stock k JOIN stock s '
+            'ON k.symbol = s.symbol AND k.market = s.market '
+            'WHERE s.id = %s.stock_id)' % table)
+
+
+def upgrade():
+    # a stock added twice keeps its first row, which gets the others'
+    # points and signals (the points saved twice go below)
+    for table in ['stock_point', 'signal']:
+        op.execute('UPDATE %s SET stock_id = %s WHERE stock_id IN (%s)'
+                   % (table, keeper(table), DUPLICATES))
+    # and their indicator states, keeping the oldest stock's of each
+    op.execute('DELETE FROM indicator_state WHERE EXISTS '
+               '(SELECT 1 FROM indicator_state i '
+               'JOIN stock a ON a.id = i.stock_id '
+               'JOIN stock b ON b.symbol = a.symbol AND b.market = a.market '
+               'WHERE b.id = indicator_state.stock_id '
+               'AND i.stock_id < indicator_state.stock_id '
+               'AND i.indicator = indicator_state.indicator)')
+    op.execute('UPDATE indicator_state SET stock_id = %s WHERE stock_id IN (%s)'
+               % (keeper('indicator_state'), DUPLICATES))
+    op.execute('DELETE FROM stock WHERE id IN (%s)' % DUPLICATES)
+    # a point saved twice keeps its first row
+    op.execute('DELETE FROM stock_point WHERE id NOT IN '
+               '(SELECT min(id) FROM stock_point GROUP BY stock_id, date)')
+    op.drop_index('ix_stock_point_stock_id_date', table_name='stock_point')
+    op.create_index('ix_stock_point_stock_id_date', 'stock_point', ['stock_id', 'date'], unique=True)
+    op.create_index('ix_signal_screen', 'signal', ['is_buy_signal', 'expiration_date', 'stock_id'], unique=False)
+    op.create_index('ix_signal_stock_id_expiration_date', 'signal', ['stock_id', 'expiration_date'], unique=False)
+    op.create_index('ix_stock_symbol_market', 'stock', ['symbol', 'market'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_stock_symbol_market', table_name='stock')
+    op.drop_index('ix_signal_stock_id_expiration_date', table_name='signal')
+    op.drop_index('ix_signal_screen', table_name='signal')
+    op.drop_index('ix_stock_point_stock_id_date', table_name='stock_point')
+    op.create_index('ix_stock_point_stock_id_date', 'stock_point', ['stock_id', 'date'], unique=False)
@@ -0,0 +1,62 @@
+''' The nightly run's directory of stocks: the id, name and last point
+date of each symbol, loaded in a few bulk queries up front, so that
+looking a stock up, checking it exists and working out what it's missing
+don't cost a query per symbol. New listings are created in bulk by
+sync_symbols before the run, so a symbol that isn't in the directory
+isn't in the table either.
+'''
+from sqlalchemy import select, func
+from sqlalchemy.orm import make_transient_to_detached
+from app import db
+from app.models import Stock, StockPoint
+
+# Symbols per IN list when loading
+LOAD_CHUNK = 500
+
+class StockDirectory(object):
+    ''' The stocks of a market, by symbol. Every stock is kept under
+    NASDAQ, like create_or_update_stock does. '''
+
+    def __init__(self, market='NASDAQ'):
+        self.market = market
+        self.entries = {}   # symbol: (id, name, last point date or None)
+
+    def __contains__(self, symbol):
+        return symbol.upper() in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def load(self, symbols):
+        ''' Adds the stocks of symbols that are in the table, LOAD_CHUNK
+        symbols a query. Returns the directory. '''
+        stock = Stock.__table__
+        point = StockPoint.__table__
+        symbols = sorted(set(symbol.upper() for symbol in symbols))
+        for i in range(0, len(symbols), LOAD_CHUNK):
+            rows = db.session.execute(
+                select([stock.c.id, stock.c.symbol, stock.c.name,
+                        func.max(point.c.date)])
+                .select_from(stock.outerjoin(point,
+                                             point.c.stock_id == stock.c.id))
+                .where(stock.c.market == self.market)
+                .where(stock.c.symbol.in_(symbols[i:i+LOAD_CHUNK]))
+                .group_by(stock.c.id, stock.c.symbol, stock.c.name))
+            for stock_id, symbol, name, last_date in rows:
+                self.entries[symbol] = (stock_id, name, last_date)
+        return self
+
+    def last_date(self, symbol):
+        ''' The date of the stock's last point, None if it has none '''
+        return self.entries[symbol.upper()][2]
+
+    def stock(self, symbol):
+        ''' The Stock of symbol, in the session, without querying for
+        it (or for its refresh, if a commit expired it). Attributes the
+        directory doesn't have (like the points) load when they're first
+        used. '''
+        stock_id, name, last_date = self.entries[symbol.upper()]
+        stock = Stock(symbol=symbol, name=name, market=self.market)
+        stock.id = stock_id
+        make_transient_to_detached(stock)
+        return db.session.merge(stock, load=False)
@@ -0,0 +1,154 @@
+''' Concurrent OHLC downloads. DataReader makes one blocking request per
+symbol and opens a new connection for each. OHLCFetcher runs the requests
+from a pool of threads instead, each keeping its connection to the host
+alive between requests, with a cap on how many are in flight and on how
+many get sent to a host per second.
+'''
+import httplib
+import logging
+import socket
+import threading
+import time
+import urllib
+import urlparse
+from StringIO import StringIO
+from multiprocessing.pool import ThreadPool
+import pandas as pd
+from app import app
+
+# The CSV endpoint DataReader(symbol, 'yahoo', ...) reads from
+YAHOO_URL = 'http://ichart.finance.yahoo.com/table.csv'
+# Requests in flight at once
+MAX_IN_FLIGHT = app.config.get('FETCH_IN_FLIGHT', 8)
+# Requests sent to a host per second
+HOST_RATE = app.config.get('FETCH_HOST_RATE', 10)
+# Tries per symbol before giving up, like DataReader's retry_count
+RETRIES = 3
+TIMEOUT = 30
+
+class RateLimiter(object):
+    ''' Spaces out the requests to each host so no more than rate go out
+    per second. A rate of None (or 0) doesn't limit anything. '''
+
+    def __init__(self, rate):
+        self.interval = 1. / rate if rate else 0
+        self.next_slot = {}
+        self.lock = threading.Lock()
+
+    def wait(self, host):
+        ''' Blocks until the next request to host may go out '''
+        with self.lock:
+            now = time.time()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+class OHLCFetcher(object):
+    ''' Downloads daily OHLCV points in the CSV format of Yahoo's
+    historical prices. url defaults to the OHLC_URL setting, so a local
+    server can stand in for Yahoo. '''
+
+    def __init__(self, url=None, max_in_flight=MAX_IN_FLIGHT,
+                 host_rate=HOST_RATE):
+        url = urlparse.urlparse(url or app.config.get('OHLC_URL', YAHOO_URL))
+        self.host = url.hostname
+        self.port = url.port
+        self.path = url.path
+        self.max_in_flight = max_in_flight
+        self.limiter = RateLimiter(host_rate)
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def query(self, symbol, start_date, end_date):
+        ''' The path and query string for symbol's points between the
+        dates, with the same parameters DataReader sends '''
+        params = [('s', symbol),
+                  ('a', start_date.month - 1), ('b', start_date.day),
+                  ('c', start_date.year),
+                  ('d', end_date.month - 1), ('e', end_date.day),
+                  ('f', end_date.year),
+                  ('g', 'd'), ('ignore', '.csv')]
+        return '%s?%s' % (self.path, urllib.urlencode(params))
+
+    def fetch(self, symbol, start_date, end_date):
+        ''' Returns symbol's points between the dates as a DataFrame
+        shaped like DataReader's (oldest first, indexed by Date), or None
+        if the host doesn't know the symbol. Raises IOError when there's
+        no good response after RETRIES tries. '''
+        error = None
+        for attempt in range(RETRIES):
+            self.limiter.wait(self.host)
+            try:
+                status, body = self._get(self.query(symbol, start_date,
+                                                    end_date))
+            except (httplib.HTTPException, socket.error) as e:
+                self._close()
+                error = e
+                continue
+            if status == 200:
+                return parse_csv(body)
+            elif status == 404:
+                return None
+            error = 'HTTP status %s' % status
+        raise IOError('Fetching %s failed after %d tries: %s'
+                      % (symbol, RETRIES, error))
+
+    def fetch_many(self, jobs):
+        ''' Fetches each (symbol, start_date, end_date) of jobs, at most
+        max_in_flight at a time. Yields (job, result) pairs in the order
+        they finish, where result is what fetch returned or the exception
+        it raised. '''
+        pool = ThreadPool(self.max_in_flight)
+        try:
+            for result in pool.imap_unordered(self._fetch_job, jobs):
+                yield result
+        finally:
+            pool.close()
+            pool.join()
+            with self.lock:
+                for connection in self.connections:
+                    connection.close()
+                self.connections = []
+
+    def _fetch_job(self, job):
+        try:
+            return job, self.fetch(*job)
+        except Exception as e:
+            logging.warning('Error fetching %s: %s', job[0], e)
+            return job, e
+
+    def _get(self, path):
+        ''' GETs path over this thread's connection, opening one if it
+        doesn't have one. Returns the status and body. '''
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = httplib.HTTPConnection(self.host, self.port,
+                                                timeout=TIMEOUT)
+            self.local.connection = connection
+            with self.lock:
+                self.connections.append(connection)
+        connection.request('GET', path)
+        response = connection.getresponse()
+        body = response.read()  # has to be read before the next request
+        if response.getheader('connection', '').lower() == 'close':
+            self._close()
+        return response.status, body
+
+    def _close(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+
+def parse_csv(body):
+    ''' Parses a historical prices CSV the way DataReader does: newest
+    first in the file, oldest first in the DataFrame, '-' for missing '''
+    df = pd.read_csv(StringIO(body), index_col=0, parse_dates=True,
+                     na_values='-')[::-1]
+    # Yahoo sometimes repeats the most recent day
+    if len(df) > 2 and df.index[-1] == df.index[-2]:
+        df = df[:-1]
+    df.index.name = 'Date'
+    return df
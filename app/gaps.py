@@ -0,0 +1,138 @@
+''' Gap planner: the trading sessions missing from the middle of the
+stocks' histories. fetch_and_save_missing_ohlc only fetches what comes
+after a stock's last point, so a hole left by a failed night or a bad
+download stays there unless the whole history is fetched again. The plan
+gets the pairs of neighbouring points with days in between from one
+window query over the stock_point index, and compares those against the
+trading calendar. The sessions between them come out as one range per hole,
+which is the fewest ranges that fetch nothing but missing sessions (a
+hole running over a weekend or holiday is still one range). Only active
+stocks are planned, and the ranges the provider had nothing for before
+(see EmptyGap) are left out.
+'''
+import datetime as dt
+import numpy as np
+from sqlalchemy import select, func, and_, not_, cast, literal, Integer
+from app import db
+from app.models import Stock, StockPoint, EmptyGap, today
+from app.trading_calendar import trading_calendar
+
+# Days a (stock id, date) key leaves for the date, see gap_key
+KEY_DAYS = 1 << 20
+
+def gap_key(stock_ids, dates):
+    ''' stock_ids and dates as one sortable int64 per pair '''
+    return stock_ids * KEY_DAYS + dates.astype(np.int64)
+
+def day_number(date):
+    ''' SQL for date as days since 1970 '''
+    if db.engine.dialect.name == 'sqlite':
+        return cast(func.julianday(date) - 2440587.5, Integer)
+    return date - literal(dt.date(1970, 1, 1))
+
+class GapPlan(object):
+    ''' The missing ranges of the stocks, as arrays with a row per range:
+    the stock's id, the first and last missing sessions and how many
+    sessions that is '''
+
+    def __init__(self, calendar=trading_calendar):
+        self.calendar = calendar
+        self.stock_ids = np.empty(0, dtype=np.int64)
+        self.starts = np.empty(0, dtype='M8[D]')
+        self.ends = np.empty(0, dtype='M8[D]')
+        self.sessions = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.stock_ids)
+
+    def load(self, stock_ids=None):
+        ''' Finds the gaps of stock_ids, or of every active stock. Returns
+        the plan. '''
+        ids, after, before = self._holes(stock_ids)
+        busdaycal = self.calendar.busdaycal
+        starts = np.busday_offset(after + np.timedelta64(1, 'D'), 0,
+                                  roll='forward', busdaycal=busdaycal)
+        ends = np.busday_offset(before - np.timedelta64(1, 'D'), 0,
+                                roll='backward', busdaycal=busdaycal)
+        hole = starts <= ends
+        ids, starts, ends = ids[hole], starts[hole], ends[hole]
+        keep = ~self._empty(ids, starts, ends)
+        self.stock_ids = ids[keep]
+        self.starts = starts[keep]
+        self.ends = ends[keep]
+        self.sessions = self.calendar.sessions_between(self.starts, self.ends)
+        return self
+
+    def _holes(self, stock_ids=None):
+        ''' (stock ids, dates before, dates after) of the neighbouring
+        points with days in between, as arrays. The pairs are found in
+        SQL, so only those (and not every point) come back. Ones just
+        over a weekend are left out there as well, while holidays are
+        left for the calendar. '''
+        table = StockPoint.__table__
+        stocks = Stock.__table__
+        previous = func.lag(table.c.date, type_=db.Date).over(
+            partition_by=table.c.stock_id, order_by=table.c.date)
+        query = select([table.c.stock_id, previous.label('previous'),
+                        table.c.date])\
+            .where(table.c.stock_id.in_(select([stocks.c.id])
+                                        .where(stocks.c.active == True)))
+        if stock_ids is not None:
+            query = query.where(table.c.stock_id.in_(list(stock_ids)))
+        pairs = query.alias('pairs')
+        days = day_number(pairs.c.date) - day_number(pairs.c.previous)
+        # 1970-01-01 was a Thursday, so Mondays are 4 days on
+        monday = (day_number(pairs.c.date) + 3) % 7 == 0
+        rows = db.session.execute(
+            select([pairs.c.stock_id, pairs.c.previous, pairs.c.date])
+            .where(days > 1)
+            .where(not_(and_(days == 3, monday)))).fetchall()
+        if not rows:
+            return (np.empty(0, dtype=np.int64), np.empty(0, dtype='M8[D]'),
+                    np.empty(0, dtype='M8[D]'))
+        ids, previous, dates = zip(*rows)
+        return (np.array(ids, dtype=np.int64),
+                np.array(previous, dtype='M8[D]'),
+                np.array(dates, dtype='M8[D]'))
+
+    def _empty(self, ids, starts, ends):
+        ''' Mask of the gaps inside an EmptyGap that hasn't expired. The
+        EmptyGaps are sorted on (stock id, start), with the furthest end
+        reached so far alongside, so one searchsorted finds for every gap
+        how far its stock's EmptyGaps starting on or before it go. '''
+        table = EmptyGap.__table__
+        rows = db.session.execute(
+            select([table.c.stock_id, table.c.start_date, table.c.end_date])
+            .where(table.c.checked_on >= EmptyGap.cutoff())).fetchall()
+        if not rows or not len(ids):
+            return np.zeros(len(ids), dtype=bool)
+        empty_ids, empty_starts, empty_ends = [np.array(column) for column
+                                               in zip(*rows)]
+        empty_ids = empty_ids.astype(np.int64)
+        keys = gap_key(empty_ids, empty_starts.astype('M8[D]'))
+        order = np.argsort(keys)
+        # a key holds the stock, so the reach never runs into the next one
+        reach = np.maximum.accumulate(
+            gap_key(empty_ids, empty_ends.astype('M8[D]'))[order])
+        found = np.searchsorted(keys[order], gap_key(ids, starts),
+                                side='right') - 1
+        return (found >= 0) & \
+            (reach[np.maximum(found, 0)] >= gap_key(ids, ends))
+
+    def ranges(self):
+        ''' (stock_id, first session, last session) of every gap '''
+        return zip(self.stock_ids.tolist(), self.starts.astype(dt.date),
+                   self.ends.astype(dt.date))
+
+    def report(self):
+        ''' What fetching the plan takes next to the other ways of filling
+        the holes: a request per missing session, or fetching each
+        stock's whole history again like fetch_and_save_all_ohlc. '''
+        stocks = len(np.unique(self.stock_ids))
+        end_date = today()
+        history = int(self.calendar.sessions_between(
+            end_date - dt.timedelta(days=Stock.LOOKBACK_DAYS), end_date))
+        rows = int(self.sessions.sum())
+        return {'stocks': stocks, 'requests': len(self), 'rows': rows,
+                'daily_requests': rows,
+                'refetch_requests': stocks, 'refetch_rows': stocks * history}
@@ -1,29 +1,133 @@
-from pandas.io.data import DataReader
 import pandas as pd
+import numpy as np
 import datetime as dt
-from app import db
+from app import app, db
+from app.providers import get_provider
+from app.store import PointStore
+from app.trading_calendar import trading_calendar
 import logging
-from sqlalchemy import func
+import json
+from StringIO import StringIO
+from sqlalchemy import func, bindparam, select, and_, or_, type_coerce, \
+    case, true
 from sqlalchemy.sql.expression import asc, desc
 from sqlalchemy.ext.orderinglist import ordering_list
 
+# NUMERIC_ASDECIMAL = False makes the price, indicator and signal weight
+# columns come back as plain floats (ORM and Core) instead of Decimals.
+ASDECIMAL = app.config.get('NUMERIC_ASDECIMAL', True)
+
 def today():
     ''' datetime is implemented in C, which you can't patch.
         This is the easiest way (for me) to keep everything tested.
         Just replacing every call to dt.date.today with today() '''
     return dt.date.today()
 
+def wilder_smooth(values, period, seed):
+    ''' Wilder's smoothing of values, carrying on from a previous average
+    (seed): avg = (previous_avg * (period - 1) + value) / period.
+    That recursion is an exponential moving average with com=period-1,
+    so it runs through pd.ewma rather than a loop in Python. Returns
+    an array with one average per value.
+    '''
+    values = np.concatenate(([seed], np.asarray(values, dtype=float)))
+    smoothed = pd.ewma(values, com=period - 1, adjust=False)
+    return np.asarray(smoothed)[1:]
+
+def ewma_resume(values, span, last, points):
+    ''' Carries pd.ewma(span=span) on over values, given its last
+    average and how many points went into it. Each average is the
+    decayed sum of the values over the decayed sum of their weights,
+    and that weight sum only depends on the number of points, so the
+    last average is all the state there is. '''
+    decay = 1 - 2. / (span + 1)
+    weight = (1 - decay ** points) / (1 - decay)
+    averages = np.empty(len(values))
+    for i, value in enumerate(values):
+        weight = 1 + decay * weight
+        last = last + (value - last) / weight
+        averages[i] = last
+    return averages
+
+def rolling_buffer(previous, values, size):
+    ''' The last size values of previous followed by values '''
+    return np.concatenate((previous, values))[-size:]
+
+def fetch_arrays(result, count, dtypes):
+    ''' Reads the (at most count) rows of a result LOAD_CHUNK at a time
+    into one preallocated array per column, of the given dtypes. Returns
+    the arrays, cut down to the rows there were. '''
+    arrays = [np.empty(count, dtype=dtype) for dtype in dtypes]
+    filled = 0
+    while filled < count:
+        rows = result.fetchmany(Stock.LOAD_CHUNK)
+        if not rows:
+            break
+        end = filled + len(rows)
+        for array, values in zip(arrays, zip(*rows)):
+            array[filled:end] = np.array(values, dtype=array.dtype)
+        filled = end
+    result.close()
+    return [array[:filled] for array in arrays]
+
 class Stock(db.Model):
     ''' Stock class. It's the base class for all attributes about a company '''
     __tablename__ = 'stock'
+    # stocks are looked up by symbol and market, and there's one of each
+    __table_args__ = (db.Index('ix_stock_symbol_market', 'symbol', 'market',
+                               unique=True),)
     id = db.Column(db.Integer, primary_key=True)
     symbol = db.Column(db.String(8))
     name = db.Column(db.String(100))
     market = db.Column(db.String(10))    # could make this a category
+    # False once the stock isn't in the listing files any more
+    active = db.Column(db.Boolean, nullable=False, default=True,
+                       server_default=true())
+    # The date of the earliest point saved since the indicators were last
+    # calculated, None when they're up to date. The nightly run only
+    # calculates the stocks that have one.
+    pending_since = db.Column(db.Date, nullable=True)
+    # Goes up with every insert or update of the Stock's points, so the
+    # point store can tell when its copy is out of date
+    points_version = db.Column(db.Integer, nullable=False, default=0,
+                               server_default='0')
     stockpoints = db.relationship('StockPoint', order_by=asc('stock_point.date'))
     signals = db.relationship('Signal', order_by=desc('signal.expiration_date'))
+    indicator_states = db.relationship('IndicatorState',
+                                       cascade='all, delete-orphan')
 
     LOOKBACK_DAYS = 2000
+    # Points loaded ahead of the ones being calculated in incremental
+    # mode: a year for the 52 week high/low, which is also long enough
+    # for the MACD/RSI averages to forget where the window started.
+    INDICATOR_WARMUP = 365
+    # The most points any signal looks back over (SMA200PriceCross)
+    SIGNAL_WINDOW = 51
+    # The stock_point columns load_dataframe_from_db loads, in the order
+    # of the df columns they go into
+    LOAD_COLUMNS = [('open', 'Open'), ('adj_open', 'Adj Open'),
+                    ('high', 'High'), ('adj_high', 'Adj High'),
+                    ('low', 'Low'), ('adj_low', 'Adj Low'),
+                    ('close', 'Close'), ('adj_close', 'Adj Close'),
+                    ('volume', 'Volume'), ('rsi', 'RSI'), ('macd', 'MACD'),
+                    ('macd_signal', 'MACD-Signal'),
+                    ('high_52_weeks', '52-Week-High'),
+                    ('low_52_weeks', '52-Week-Low'),
+                    ('sma_50', 'SMA-50'), ('sma_200', 'SMA-200')]
+    LOAD_CHUNK = 500
+    # The stock_point columns _save_dataframe inserts, and the df
+    # columns they come from
+    SAVE_COLUMNS = [('open', 'Open'), ('high', 'High'), ('low', 'Low'),
+                    ('close', 'Close'), ('adj_close', 'Adj Close'),
+                    ('volume', 'Volume')]
+    # The stock_point columns update_dataframe writes, and the df
+    # columns they come from
+    UPDATE_COLUMNS = [('rsi', 'RSI'), ('macd', 'MACD'),
+                      ('macd_signal', 'MACD-Signal'), ('sma_50', 'SMA-50'),
+                      ('sma_200', 'SMA-200'), ('adj_open', 'Adj Open'),
+                      ('adj_high', 'Adj High'), ('adj_low', 'Adj Low'),
+                      ('high_52_weeks', '52-Week-High'),
+                      ('low_52_weeks', '52-Week-Low')]
 
     def __init__(self, symbol=symbol, name=name, market=market):
         self.symbol = symbol.upper()
@@ -65,15 +169,120 @@ class Stock(db.Model):
         df['Adj Open'] = df['Open'] * (df['Adj Close']/df['Close'])
         return df
 
-    def calculate_indicators(self):
-        df = self.load_dataframe_from_db()
+    def calculate_indicators(self, incremental=False):
+        ''' Calculates the indicators and evaluates the signals. With
+        incremental set, only the points that don't have indicators
+        yet get written. If the indicator states saved by the last run
+        still line up with the history, the new points are calculated
+        from them, loading only the points the signals look back over.
+        Otherwise only the tail of the history needed to calculate them
+        (INDICATOR_WARMUP extra points) gets loaded. If the history
+        changed underneath the states, everything is recalculated.
+        '''
+        seen = self.pending_since
+        states = {}
+        if incremental:
+            pending = self._pending_point_count()
+            if pending == 0:
+                if seen is not None:
+                    last_date = db.session.query(func.max(StockPoint.date))\
+                        .filter(StockPoint.stock_id == self.id).scalar()
+                    Stock.clear_pending({self.id: seen},
+                                        {self.id: last_date})
+                    db.session.commit()
+                return
+            states = dict((state.indicator, state)
+                          for state in self.indicator_states)
+            if states:
+                df = self.load_dataframe_from_db(
+                    limit=pending + Stock.SIGNAL_WINDOW)
+                if not self._states_match(states, df[:len(df)-pending]):
+                    logging.info('Indicator states of %s no longer match '
+                                 'its history. Recalculating everything.', self)
+                    return self.calculate_indicators()
+            else:
+                df = self.load_dataframe_from_db(
+                    limit=pending + Stock.INDICATOR_WARMUP)
+        else:
+            df = self.load_dataframe_from_db()
+            pending = len(df)
         df = self.calculate_adjusted_ohlc(df)
-        df = FiftyTwoWeek(df, 'High').calculate()
-        df = FiftyTwoWeek(df, 'Low').calculate()
-        df = RSI(df).calculate()
-        df = MACD(df).calculate()
-        df = SMA(df, 50).calculate()
-        df = SMA(df, 200).calculate() 
+        if states:
+            df, states = self._resume_indicators(df, pending, states)
+        else:
+            df, states = self._calculate_indicators(df)
+        self._evaluate_signals(df)
+        self._save_indicator_states(df.index[-1].date(), states)
+        if seen is not None:
+            Stock.clear_pending({self.id: seen},
+                                {self.id: df.index[-1].date()})
+        # saves new df columns, any new signals and the indicator states
+        self.update_dataframe(df[len(df)-pending:])
+
+    def _indicators(self, df):
+        ''' The indicator calculators, in the order they're applied '''
+        return [FiftyTwoWeek(df, 'High'), FiftyTwoWeek(df, 'Low'), RSI(df),
+                MACD(df), SMA(df, 50), SMA(df, 200)]
+
+    def _calculate_indicators(self, df):
+        ''' Calculates the indicators over all of df. Returns the df and
+        the state of each indicator at its last point. '''
+        indicators = self._indicators(df)
+        for indicator in indicators:
+            df = indicator.calculate()
+        return df, dict((indicator.name, indicator.state())
+                        for indicator in indicators)
+
+    def _resume_indicators(self, df, pending, states):
+        ''' Calculates the indicators for the last pending points of df
+        from the saved states. The earlier points already have theirs. '''
+        df = df.astype(float)
+        new = df[len(df)-pending:].copy()
+        indicators = self._indicators(new)
+        for indicator in indicators:
+            new = indicator.resume(states[indicator.name].values)
+        df = pd.concat([df[:len(df)-pending], new])
+        return df, dict((indicator.name,
+                         indicator.state(states[indicator.name].values))
+                        for indicator in indicators)
+
+    def _states_match(self, states, df):
+        ''' Whether the saved states pick up where df (the points before
+        the pending ones) leaves off: there's one for every indicator,
+        they end on df's last date, and the closes the 200 day SMA kept
+        are still the ones at the end of df (an adjusted close
+        restatement rewrites them all). '''
+        names = [indicator.name for indicator in self._indicators(df)]
+        if len(df) == 0 or sorted(states) != sorted(names):
+            return False
+        last_date = df.index[-1].date()
+        if any(state.last_date != last_date for state in states.values()):
+            return False
+        kept = states['SMA-200'].values['values']
+        overlap = min(len(kept), len(df))
+        return np.allclose(kept[len(kept)-overlap:],
+                           df['Adj Close'].values.astype(float)[-overlap:])
+
+    def _save_indicator_states(self, last_date, states):
+        ''' Saves the states to carry over to the next run. If any
+        indicator doesn't have one yet (too little data), none are kept
+        and the next run falls back to calculating from the history. '''
+        if any(values is None for values in states.values()):
+            self.indicator_states = []
+            return
+        existing = dict((state.indicator, state)
+                        for state in self.indicator_states)
+        for name, values in states.items():
+            if name in existing:
+                existing[name].last_date = last_date
+                existing[name].values = values
+            else:
+                self.indicator_states.append(
+                    IndicatorState(name, last_date, values))
+
+    def _evaluate_signals(self, df):
+        ''' Evaluates each signal against df and appends the ones that
+        fire to the Stock's signals. '''
         rsi_signal = RSISignal(df)
         rsi_signal.evaluate()
         if rsi_signal.triggered() == True:
@@ -102,28 +311,81 @@ class Stock(db.Model):
         fifty_two_low_signal.evaluate()
         if fifty_two_low_signal.triggered() == True:
             self.signals.append(fifty_two_high_signal)
-        self.update_dataframe(df) # saves new df columns and any new signals
-
-    def update_dataframe(self,df):
-        ''' Loops through the rows and saving off the values. This
-        method is sort of like _save_dataframe, except it doesn't
-        create anything new, just updates. '''
-        df = df.reset_index()
-        for row_index, row in df.iterrows():
-            self.stockpoints[row_index].rsi = df.loc[row_index]['RSI']
-            self.stockpoints[row_index].macd = df.loc[row_index]['MACD']
-            self.stockpoints[row_index].macd_signal = df.loc[row_index]['MACD-Signal']
-            self.stockpoints[row_index].sma_50 = df.loc[row_index]['SMA-50']
-            self.stockpoints[row_index].sma_200 = df.loc[row_index]['SMA-200']
-            self.stockpoints[row_index].adj_open = df.loc[row_index]['Adj Open']
-            self.stockpoints[row_index].adj_high = df.loc[row_index]['Adj High']
-            self.stockpoints[row_index].adj_low = df.loc[row_index]['Adj Low']
-            self.stockpoints[row_index].high_52_weeks = df.loc[row_index]['52-Week-High']
-            self.stockpoints[row_index].low_52_weeks = df.loc[row_index]['52-Week-Low']
+
+    def _pending_point_count(self):
+        ''' Number of points from the earliest one without indicators
+        (MACD is defined for every point once calculated) through the
+        end of the history. '''
+        first_date = db.session.query(func.min(StockPoint.date))\
+            .filter(StockPoint.stock_id == self.id)\
+            .filter(StockPoint.macd == None).scalar()
+        if first_date is None:
+            return 0
+        return StockPoint.query.filter(StockPoint.stock_id == self.id)\
+            .filter(StockPoint.date >= first_date).count()
+
+    def update_dataframe(self, df):
+        ''' Writes the indicator columns of df back to the Stock's points
+        with a single executemany UPDATE keyed by (stock_id, date), so no
+        StockPoints get loaded. This method is sort of like
+        _save_dataframe, except it doesn't create anything new, just
+        updates. Points are matched by date, so df may be just the tail
+        of the history. Missing values are written as NULL. The point
+        store gets the points from df's first one on. '''
+        if len(df) > 0:
+            columns = [col for col, df_col in Stock.UPDATE_COLUMNS]
+            values = df[[df_col for col, df_col in Stock.UPDATE_COLUMNS]]\
+                .astype(float)
+            values = values.astype(object).where(pd.notnull(values), None)
+            Stock.update_points(
+                [dict(zip(columns, row), b_stock_id=self.id, b_date=date)
+                 for date, row in zip(df.index.date, values.values.tolist())])
         try:
             db.session.commit() # commits new signals
         except:
             db.session.rollback()
+        if len(df) > 0:
+            self.save_to_store(df.index[0].date())
+
+    @staticmethod
+    def clear_pending(seen, last_dates):
+        ''' Marks the indicators of the stocks in seen up to date, in the
+        current transaction, so it's undone if their writes are rolled
+        back. seen has the pending_since each stock was calculated for,
+        and last_dates the last point it was calculated through. Points
+        can be saved while that runs: a stock whose pending_since has
+        moved back since is left pending, and one with points after its
+        last date stays pending from the first of those. '''
+        if not seen:
+            return
+        table = Stock.__table__
+        points = StockPoint.__table__
+        later = select([func.min(points.c.date)])\
+            .where(points.c.stock_id == table.c.id)\
+            .where(points.c.date > bindparam('b_last_date')).as_scalar()
+        db.session.execute(table.update()
+                           .where(table.c.id == bindparam('b_id'))
+                           .where(table.c.pending_since == bindparam('b_seen'))
+                           .values(pending_since=later),
+                           [dict(b_id=stock_id, b_seen=pending_since,
+                                 b_last_date=last_dates.get(stock_id))
+                            for stock_id, pending_since in seen.items()])
+
+    @staticmethod
+    def update_points(params):
+        ''' Runs one executemany UPDATE of stock_point for params: dicts
+        of the UPDATE_COLUMNS values for the point at b_stock_id, b_date.
+        The points_version of the stocks goes up. '''
+        table = StockPoint.__table__
+        db.session.execute(table.update()
+                           .where(table.c.stock_id == bindparam('b_stock_id'))
+                           .where(table.c.date == bindparam('b_date')),
+                           params)
+        stocks = Stock.__table__
+        db.session.execute(stocks.update()
+                           .where(stocks.c.id.in_(
+                               set(param['b_stock_id'] for param in params)))
+                           .values(points_version=stocks.c.points_version + 1))
 
     def get_dataframe(self):
         if not self.stockpoints:
@@ -132,132 +394,257 @@ class Stock(db.Model):
             self.fetch_and_save_missing_ohlc()
         return self.load_dataframe_from_db()
 
-    def load_dataframe_from_db(self):
-        df = pd.DataFrame(db.engine.execute("""SELECT date,open,adj_open,high,
-                                            adj_high,low,adj_low,close,
-                                            adj_close,volume,rsi,macd,
-                                            macd_signal,high_52_weeks,
-                                            low_52_weeks,sma_50,sma_200
-                                            FROM stock_point
-                                            WHERE stock_id = %s
-                                            ORDER BY date ASC"""\
-                                            % self.id).fetchall())
-
-        if len(df) > 0: # can't add columns when the DF is empty or you get
-                        # ValueError: Length mismatch
-            df.columns = ['Date','Open','Adj Open','High','Adj High','Low', \
-                          'Adj Low','Close','Adj Close','Volume','RSI','MACD',\
-                          'MACD-Signal','52-Week-High','52-Week-Low',
-                          'SMA-50','SMA-200']
-            df.set_index(pd.DatetimeIndex(df['Date']), inplace=True)
-            df.drop('Date', axis=1, inplace=True)
-        return df
+    def load_dataframe_from_db(self, limit=None, start_date=None,
+                               from_store=False):
+        ''' Loads the Stock's points into a DataFrame indexed by date,
+        oldest first. With limit set, only the most recent limit points
+        are loaded, and with start_date, only the points from that date
+        on. Rows are fetched LOAD_CHUNK at a time straight into float64
+        and int64 arrays, skipping the Decimal conversion of the ORM
+        columns. With from_store set, they're read from the point store
+        instead when it's up to date (see load_from_store). '''
+        if from_store:
+            df = self.load_from_store(limit, start_date)
+            if df is not None:
+                return df
+        table = StockPoint.__table__
+        where = table.c.stock_id == self.id
+        if start_date is not None:
+            where = and_(where, table.c.date >= start_date)
+        count = db.session.execute(
+            select([func.count()]).where(where)).scalar()
+        if limit is not None:
+            count = min(count, limit)
+        columns = [table.c[col] if col == 'volume'
+                   else type_coerce(table.c[col], db.Float)
+                   for col, df_col in Stock.LOAD_COLUMNS]
+        result = db.session.execute(select([table.c.date] + columns)
+                                    .where(where)
+                                    .order_by(table.c.date.desc())
+                                    .limit(count))
+        dtypes = [np.int64 if col == 'volume' else np.float64
+                  for col, df_col in Stock.LOAD_COLUMNS]
+        arrays = fetch_arrays(result, count, ['datetime64[D]'] + dtypes)
+        # the query runs newest first so that limit keeps the latest points
+        dates = arrays[0][::-1]
+        arrays = [array[::-1] for array in arrays[1:]]
+        df_columns = [df_col for col, df_col in Stock.LOAD_COLUMNS]
+        return pd.DataFrame(dict(zip(df_columns, arrays)),
+                            index=pd.DatetimeIndex(dates),
+                            columns=df_columns)
 
-    def _save_dataframe(self, df): 
+    @staticmethod
+    def point_store():
+        ''' The PointStore in the POINT_STORE directory, or None if that
+        isn't set '''
+        directory = app.config.get('POINT_STORE')
+        if not directory:
+            return None
+        return PointStore(directory,
+                          [df_col for col, df_col in Stock.LOAD_COLUMNS],
+                          int_columns=['Volume'])
+
+    def load_from_store(self, limit=None, start_date=None):
+        ''' Reads the Stock's points from the point store, memory mapped,
+        taking limit and start_date like load_dataframe_from_db. Returns
+        None when there's no store, or when it was written at another
+        points_version than the database's, since then it's behind. '''
+        store = Stock.point_store()
+        if store is None:
+            return None
+        return store.read(self.id, limit, start_date, self._points_version())
+
+    def save_to_store(self, since=None):
+        ''' Writes the Stock's points, as they are in the database, to
+        the point store if there is one. With since set, only the points
+        from that date on have changed, so just those are loaded and
+        patched into (or appended to) what the store has. '''
+        store = Stock.point_store()
+        if store is None:
+            return
+        # read ahead of the points, so a write in between leaves the
+        # store behind rather than ahead
+        version = self._points_version()
+        if since is not None:
+            table = StockPoint.__table__
+            head = db.session.execute(
+                select([func.count()]).where(and_(table.c.stock_id == self.id,
+                                                  table.c.date < since)))\
+                .scalar()
+            if store.update(self.id, since, head,
+                            self.load_dataframe_from_db(start_date=since),
+                            version):
+                return
+        store.write(self.id, self.load_dataframe_from_db(), version)
+
+    def _points_version(self):
+        ''' The Stock's points_version as the table has it now '''
+        table = Stock.__table__
+        return db.session.execute(select([table.c.points_version])
+                                  .where(table.c.id == self.id)).scalar()
+
+    def _save_dataframe(self, df, raise_errors=False):
         ''' Given a dataframe, saves all the rows as new StockPoints.
         Only the OHLCV data gets saved during this process.
         This method gets called during nightly processing.
+
+        Rows with a missing or non-numeric OHLCV value are logged and
+        skipped. The rest go in with one bulk insert (COPY on PostgreSQL)
+        rather than one StockPoint object at a time. Returns the number of
+        points saved, which is 0 if the transaction was rolled back. With
+        raise_errors set, the error is raised again after the rollback, so
+        the caller can count the stock as failed.
         '''
 
-        if Stock.query.filter(Stock.symbol==self.symbol,
-                              Stock.market==self.market).count() == 0:
+        if self.id is None:     # a new Stock, not saved yet
             db.session.add(self)
 
-        for index, row in df.iterrows():
-            try:
-                # Attempt to call float() on each value in the row.
-                # If that call errs for whatever reason, then don't save the row.
-                [float(val) for ix,val in enumerate(row)]
-            except:
-                logging.warning('Error with %s. Tried to save row %s with values %s, but the row has something invalid.' % (self, index, row))
-            else:
-                newPoint = StockPoint(date=index.date(), open=row['Open'],
-                                      high=row['High'], low=row['Low'],
-                                      close=row['Close'], adj_close=row['Adj Close'],
-                                      volume=row['Volume'])
-                self.stockpoints.append(newPoint)
+        points = self._valid_points(df)
         try:
+            if len(points) > 0:
+                db.session.flush() # gives a new Stock its id
+                self._insert_points(points)
+                self._mark_pending(min(points.index.date))
             db.session.commit()
         except Exception as e:
             logging.warning('%s: Error with %s. Tried to save dataframe, but the transaction was rolled back.' % (e, self))
             db.session.rollback()
+            if raise_errors:
+                raise
+            return 0
+        return len(points)
+
+    def _valid_points(self, df):
+        ''' Returns the OHLCV columns of df as floats, leaving out (and
+        logging) any row where one of them is missing or not a number. '''
+        if len(df) == 0:
+            return df
+        values = df[[df_col for col, df_col in Stock.SAVE_COLUMNS]]\
+            .convert_objects(convert_numeric=True).astype(float)
+        valid = np.isfinite(values.values).all(axis=1)
+        for index in df.index[~valid]:
+            logging.warning('Error with %s. Tried to save row %s with values %s, but the row has something invalid.' % (self, index, df.loc[index].to_dict()))
+        return values[valid]
+
+    def _mark_pending(self, first_date):
+        ''' Records that the Stock has points from first_date on that
+        need their indicators, keeping an earlier pending date, and bumps
+        its points_version. It's written straight to the table, so a Stock
+        from a StockDirectory doesn't get loaded for it. '''
+        table = Stock.__table__
+        pending_since = case([(or_(table.c.pending_since == None,
+                                   table.c.pending_since > first_date),
+                               first_date)],
+                             else_=table.c.pending_since)
+        db.session.execute(table.update()
+                           .where(table.c.id == self.id)
+                           .values(pending_since=pending_since,
+                                   points_version=table.c.points_version + 1))
+
+    def _insert_points(self, points):
+        ''' Inserts new StockPoints for the rows of points (as returned
+        by _valid_points) in bulk. '''
+        columns = ['stock_id', 'date'] + \
+                  [col for col, df_col in Stock.SAVE_COLUMNS]
+        rows = zip([self.id] * len(points), points.index.date,
+                   *[points[df_col].values.astype(np.int64).tolist()
+                     if col == 'volume' else points[df_col].values.tolist()
+                     for col, df_col in Stock.SAVE_COLUMNS])
+        if db.engine.dialect.name == 'postgresql':
+            data = StringIO()
+            data.writelines('%s\n' % ','.join(repr(val) if isinstance(val, float)
+                                              else str(val) for val in row)
+                            for row in rows)
+            data.seek(0)
+            cursor = db.session.connection().connection.cursor()
+            cursor.copy_expert('COPY stock_point (%s) FROM STDIN WITH CSV'
+                               % ','.join(columns), data)
+        else:
+            db.session.execute(StockPoint.__table__.insert(),
+                               [dict(zip(columns, row)) for row in rows])
 
     def _should_fetch(self):
-        ''' Checks if there are any weekdays between the last point
-        we have saved and today. It's a better method of determination
-        than just checking if it's currently the weekend or not as it
-        handles long periods of not grabbing data.
+        ''' Checks if a session has completed since the last point we
+        have saved, going by the trading calendar. It's a better method of
+        determination than just checking if it's currently the weekend or
+        not as it handles holidays and long periods of not grabbing data.
         '''
-        last_point_date = self.stockpoints[-1].date
-        difference = (today() - last_point_date).days
-        return any([(today() - dt.timedelta(days=x)).weekday() not
-                    in (5,6) for x in range(1,difference)])
+        return Stock.missing_ohlc_range(self.stockpoints[-1].date) is not None
+
+    @staticmethod
+    def missing_ohlc_range(last_point_date):
+        ''' The (start_date, end_date) get_dataframe fetches for a Stock
+        whose last point is on last_point_date (None if it has no points),
+        or None when there's nothing to fetch. That's the sessions after
+        the last point that have completed, see TradingCalendar. '''
+        if last_point_date is None:
+            end_date = today()
+            return end_date - dt.timedelta(days=Stock.LOOKBACK_DAYS), end_date
+        return trading_calendar.missing_range(last_point_date, today())
 
     def fetch_and_save_missing_ohlc(self):
         ''' Grabs the last point of the Stock's data to figure out for what 
         dates it needs to query. Then saves off the data in the Stock's table.
         '''
-        if not self._should_fetch():
+        date_range = Stock.missing_ohlc_range(self.stockpoints[-1].date)
+        if date_range is None:
             return
-        next_point_date = self.stockpoints[-1].date + dt.timedelta(days=1)
-        yesterday = today() - dt.timedelta(days=1) 
-        df = self.fetch_ohlc_from_yahoo(next_point_date, yesterday)
-        if df.shape[0] > 0: # save if there's at least one row
+        df = self.fetch_ohlc(*date_range)
+        if df is not None and df.shape[0] > 0: # save if there's at least one row
             self._save_dataframe(df)               
     
     def fetch_and_save_all_ohlc(self):
         ''' Fetches the model's maximum number of data points '''
         end_date = today()
         start_date  = end_date - dt.timedelta(days = Stock.LOOKBACK_DAYS)
-        df = self.fetch_ohlc_from_yahoo(start_date, end_date)
+        df = self.fetch_ohlc(start_date, end_date)
         if df is not None:
             self._save_dataframe(df)
 
-    def fetch_ohlc_from_yahoo(self,start_date,end_date):
-        ''' Fetches data for specified dates'''
+    def fetch_ohlc(self, start_date, end_date):
+        ''' Fetches data for specified dates from the configured provider.
+        Returns None if the symbol isn't found or the fetch fails. '''
         try:
-            df = DataReader(self.symbol, "yahoo", start_date, end_date)
-            ''' When using Google as a data source, the index name gets returned
-                prepended with a byte-order mark '\xef\xbb\xbfDate', so rename it '''
-        except IOError:   # Raised when symbol isn't found
+            return get_provider().fetch(self.symbol, start_date, end_date)
+        except IOError as e:
+            logging.warning('Error fetching %s: %s', self, e)
             return None
-        else:
-            ''' When using Google as a data source, the index name gets returned
-                prepended with a byte-order mark '\xef\xbb\xbfDate', so rename it '''
-            df.index.name = 'Date'
-            return df
 
 class StockPoint(db.Model):
     ''' This class holds the relevant data for any given day. '''
 
     __tablename__ = 'stock_point'
+    # every query on stock_point is for one Stock's points by date, and a
+    # Stock has one point a day
+    __table_args__ = (db.Index('ix_stock_point_stock_id_date',
+                               'stock_id', 'date', unique=True),)
 
     id = db.Column(db.Integer, primary_key=True, nullable=False)
     stock_id = db.Column(db.Integer, db.ForeignKey('stock.id'), nullable=False)
     date = db.Column(db.Date, nullable=False)
-    open = db.Column(db.Float(precision=2, asdecimal=True), nullable=False)
-    high = db.Column(db.Float(precision=2, asdecimal=True), nullable=False)
-    low =  db.Column(db.Float(precision=2, asdecimal=True), nullable=False)
-    close = db.Column(db.Float(precision=2 ,asdecimal=True), nullable=False)
-    adj_open = db.Column(db.Float(precision=2, asdecimal=True), nullable=True)
-    adj_high = db.Column(db.Float(precision=2, asdecimal=True), nullable=True)
-    adj_low =  db.Column(db.Float(precision=2, asdecimal=True), nullable=True)
-    adj_close = db.Column(db.Float(precision=2, asdecimal=True), nullable=False)
+    open = db.Column(db.Float(precision=2, asdecimal=ASDECIMAL), nullable=False)
+    high = db.Column(db.Float(precision=2, asdecimal=ASDECIMAL), nullable=False)
+    low =  db.Column(db.Float(precision=2, asdecimal=ASDECIMAL), nullable=False)
+    close = db.Column(db.Float(precision=2, asdecimal=ASDECIMAL), nullable=False)
+    adj_open = db.Column(db.Float(precision=2, asdecimal=ASDECIMAL), nullable=True)
+    adj_high = db.Column(db.Float(precision=2, asdecimal=ASDECIMAL), nullable=True)
+    adj_low =  db.Column(db.Float(precision=2, asdecimal=ASDECIMAL), nullable=True)
+    adj_close = db.Column(db.Float(precision=2, asdecimal=ASDECIMAL), nullable=False)
     volume = db.Column(db.Integer, nullable=False)
     avg_volume_3_months = db.Column(db.Integer, nullable=True)  
-    sma_50 = db.Column(db.Float(precision=2, asdecimal=True), nullable=True)
-    sma_200 = db.Column(db.Float(precision=2, asdecimal=True), nullable=True)
+    sma_50 = db.Column(db.Float(precision=2, asdecimal=ASDECIMAL), nullable=True)
+    sma_200 = db.Column(db.Float(precision=2, asdecimal=ASDECIMAL), nullable=True)
 
     
     # 52 week high/low is the intra-day high/low, not the closing prices
-    high_52_weeks = db.Column(db.Float(precision=2, asdecimal=True), nullable=True)
-    low_52_weeks = db.Column(db.Float(precision=2, asdecimal=True), nullable=True)
+    high_52_weeks = db.Column(db.Float(precision=2, asdecimal=ASDECIMAL), nullable=True)
+    low_52_weeks = db.Column(db.Float(precision=2, asdecimal=ASDECIMAL), nullable=True)
     
-    rsi = db.Column(db.Float(precision=2, asdecimal=True), nullable=True)
+    rsi = db.Column(db.Float(precision=2, asdecimal=ASDECIMAL), nullable=True)
 
     # stores the current MACD values (MACD and the MACD-Signal line)
-    macd = db.Column(db.Float(precision=2, asdecimal=True))
-    macd_signal = db.Column(db.Float(precision=2, asdecimal=True))
+    macd = db.Column(db.Float(precision=2, asdecimal=ASDECIMAL))
+    macd_signal = db.Column(db.Float(precision=2, asdecimal=ASDECIMAL))
         
     def __init__(self, date, open, high, low, close, adj_close, volume,
                  rsi=None, macd=None, macd_signal=None, adj_open=None,
@@ -294,10 +681,307 @@ class StockPoint(db.Model):
              self.low, self.close, self.adj_close, self.volume, self.rsi)
 
 
+class IndicatorState(db.Model):
+    ''' Where an indicator left off at the end of a Stock's history (its
+    running averages, or the prices its window still overlaps), so the
+    next points can be calculated without replaying the whole series.
+    The state itself is stored as JSON. '''
+
+    __tablename__ = 'indicator_state'
+    __table_args__ = (db.UniqueConstraint('stock_id', 'indicator'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    stock_id = db.Column(db.Integer, db.ForeignKey('stock.id'), nullable=False)
+    indicator = db.Column(db.String(32), nullable=False)
+    last_date = db.Column(db.Date, nullable=False)
+    state = db.Column(db.Text, nullable=False)
+
+    def __init__(self, indicator, last_date, values):
+        self.indicator = indicator
+        self.last_date = last_date
+        self.values = values
+
+    @property
+    def values(self):
+        return json.loads(self.state)
+
+    @values.setter
+    def values(self, values):
+        self.state = json.dumps(values)
+
+    def __repr__(self):
+        return "<IndicatorState(id='%s', stock_id='%s', indicator='%s', " \
+            "last_date='%s')>" % \
+            (self.id, self.stock_id, self.indicator, self.last_date)
+
+
+class EmptyGap(db.Model):
+    ''' A range of sessions missing from a Stock's history that the
+    provider had nothing for when repair_gaps asked (a halted stock, say).
+    The gap planner leaves these, and anything inside them, out, so they
+    aren't fetched again every week. After TTL_DAYS from checked_on the
+    range is asked for again, since a provider can backfill it later. '''
+
+    __tablename__ = 'empty_gap'
+    __table_args__ = (db.UniqueConstraint('stock_id', 'start_date',
+                                          'end_date'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    stock_id = db.Column(db.Integer, db.ForeignKey('stock.id'), nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    checked_on = db.Column(db.Date, nullable=False)
+
+    TTL_DAYS = 90
+
+    def __init__(self, stock_id, start_date, end_date, checked_on=None):
+        self.stock_id = stock_id
+        self.start_date = start_date
+        self.end_date = end_date
+        self.checked_on = checked_on or today()
+
+    @staticmethod
+    def cutoff():
+        ''' The rows checked before this date have expired '''
+        return today() - dt.timedelta(days=EmptyGap.TTL_DAYS)
+
+    @staticmethod
+    def prune():
+        ''' Deletes the expired rows. Returns how many there were. '''
+        table = EmptyGap.__table__
+        return db.session.execute(table.delete().where(
+            table.c.checked_on < EmptyGap.cutoff())).rowcount
+
+    def __repr__(self):
+        return "<EmptyGap(stock_id='%s', start_date='%s', end_date='%s', " \
+            "checked_on='%s')>" % \
+            (self.stock_id, self.start_date, self.end_date, self.checked_on)
+
+
+class ScreenerRow(db.Model):
+    ''' A stock's live signals summed up for the index page: how many buy
+    and sell signals it has, its score (the buy signals' weights less the
+    sell signals') and its last close. The nightly run rebuilds the table
+    once the signals are written, so the page reads these few hundred
+    rows instead of grouping the whole signal table per request. '''
+
+    __tablename__ = 'screener'
+
+    id = db.Column(db.Integer, primary_key=True)
+    stock_id = db.Column(db.Integer, db.ForeignKey('stock.id'), nullable=False)
+    symbol = db.Column(db.String(8), nullable=False)
+    name = db.Column(db.String(100))
+    buy_count = db.Column(db.Integer, nullable=False)
+    sell_count = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float(asdecimal=ASDECIMAL), nullable=False)
+    last_close = db.Column(db.Float(precision=2, asdecimal=ASDECIMAL))
+
+    # the most signals of one kind a stock can have and not be listed
+    # (like find_buy_stocks and find_sell_stocks)
+    MIN_SIGNALS = 1
+
+    @staticmethod
+    def refresh():
+        ''' Rebuilds the table from the signals that haven't expired with
+        one INSERT ... SELECT, in the same transaction as the delete of
+        the old rows, so readers get either the old rows or the new ones.
+        Returns how many rows there are now. '''
+        signal = Signal.__table__
+        stock = Stock.__table__
+        point = StockPoint.__table__
+        table = ScreenerRow.__table__
+        buy = case([(signal.c.is_buy_signal == True, 1)], else_=0)
+        last_close = select([point.c.close])\
+            .where(point.c.stock_id == stock.c.id)\
+            .order_by(point.c.date.desc()).limit(1).as_scalar()
+        rows = select([stock.c.id, stock.c.symbol, stock.c.name,
+                       func.sum(buy), func.sum(1 - buy),
+                       func.sum(case([(signal.c.is_buy_signal == True,
+                                       signal.c.weight)],
+                                     else_=-signal.c.weight)),
+                       last_close])\
+            .where(signal.c.stock_id == stock.c.id)\
+            .where(signal.c.expiration_date >= today())\
+            .group_by(stock.c.id, stock.c.symbol, stock.c.name)
+        try:
+            db.session.execute(table.delete())
+            db.session.execute(table.insert().from_select(
+                ['stock_id', 'symbol', 'name', 'buy_count', 'sell_count',
+                 'score', 'last_close'], rows))
+            db.session.commit()
+        except:
+            db.session.rollback()
+            raise
+        return ScreenerRow.query.count()
+
+    @staticmethod
+    def buy_stocks():
+        ''' The rows with more than MIN_SIGNALS buy signals, best score
+        first '''
+        return ScreenerRow.query\
+            .filter(ScreenerRow.buy_count > ScreenerRow.MIN_SIGNALS)\
+            .order_by(ScreenerRow.score.desc(), ScreenerRow.symbol).all()
+
+    @staticmethod
+    def sell_stocks():
+        ''' The rows with more than MIN_SIGNALS sell signals, worst score
+        first '''
+        return ScreenerRow.query\
+            .filter(ScreenerRow.sell_count > ScreenerRow.MIN_SIGNALS)\
+            .order_by(ScreenerRow.score, ScreenerRow.symbol).all()
+
+    def __repr__(self):
+        return "<ScreenerRow(symbol='%s', buy_count='%s', sell_count='%s', " \
+            "score='%s')>" % \
+            (self.symbol, self.buy_count, self.sell_count, self.score)
+
+
+class StockSnapshot(db.Model):
+    ''' A stock's last point, with its indicators, and the signals that
+    were live when the nightly run rebuilt the table, for the chart page.
+    It's one indexed lookup by symbol, where going through the Stock
+    loads the whole stockpoints relationship to get the last one. '''
+
+    __tablename__ = 'stock_snapshot'
+    __table_args__ = (db.Index('ix_stock_snapshot_symbol', 'symbol'),)
+
+    stock_id = db.Column(db.Integer, db.ForeignKey('stock.id'),
+                         primary_key=True, autoincrement=False)
+    symbol = db.Column(db.String(8), nullable=False)
+    name = db.Column(db.String(100))
+    date = db.Column(db.Date, nullable=False)
+    open = db.Column(db.Float(precision=2, asdecimal=ASDECIMAL), nullable=False)
+    high = db.Column(db.Float(precision=2, asdecimal=ASDECIMAL), nullable=False)
+    low =  db.Column(db.Float(precision=2, asdecimal=ASDECIMAL), nullable=False)
+    close = db.Column(db.Float(precision=2, asdecimal=ASDECIMAL), nullable=False)
+    adj_close = db.Column(db.Float(precision=2, asdecimal=ASDECIMAL), nullable=False)
+    volume = db.Column(db.Integer, nullable=False)
+    avg_volume_3_months = db.Column(db.Integer)
+    high_52_weeks = db.Column(db.Float(precision=2, asdecimal=ASDECIMAL))
+    low_52_weeks = db.Column(db.Float(precision=2, asdecimal=ASDECIMAL))
+    rsi = db.Column(db.Float(precision=2, asdecimal=ASDECIMAL))
+    macd = db.Column(db.Float(precision=2, asdecimal=ASDECIMAL))
+    macd_signal = db.Column(db.Float(precision=2, asdecimal=ASDECIMAL))
+    sma_50 = db.Column(db.Float(precision=2, asdecimal=ASDECIMAL))
+    sma_200 = db.Column(db.Float(precision=2, asdecimal=ASDECIMAL))
+    # JSON list of [is_buy_signal, description, expiration date] for each
+    # live signal, latest to expire first
+    signals = db.Column(db.Text, nullable=False, server_default='[]')
+
+    # the stock_point columns copied from the last point
+    POINT_COLUMNS = ['date', 'open', 'high', 'low', 'close', 'adj_close',
+                     'volume', 'avg_volume_3_months', 'high_52_weeks',
+                     'low_52_weeks', 'rsi', 'macd', 'macd_signal', 'sma_50',
+                     'sma_200']
+
+    @staticmethod
+    def refresh():
+        ''' Rebuilds the table: the last points with one INSERT ...
+        SELECT, then the live signals, in the same transaction as the
+        delete of the old rows. Returns how many rows there are now. '''
+        stock = Stock.__table__
+        point = StockPoint.__table__
+        signal = Signal.__table__
+        table = StockSnapshot.__table__
+        later = point.alias()
+        last_date = select([func.max(later.c.date)])\
+            .where(later.c.stock_id == stock.c.id).as_scalar()
+        rows = select([stock.c.id, stock.c.symbol, stock.c.name] +
+                      [point.c[col] for col in StockSnapshot.POINT_COLUMNS])\
+            .where(point.c.stock_id == stock.c.id)\
+            .where(point.c.date == last_date)
+        live = db.session.execute(
+            select([signal.c.stock_id, signal.c.is_buy_signal,
+                    signal.c.description, signal.c.expiration_date])
+            .where(signal.c.expiration_date >= today())
+            .order_by(signal.c.stock_id, signal.c.expiration_date.desc()))
+        signals = {}
+        for stock_id, is_buy, description, expiration_date in live:
+            signals.setdefault(stock_id, []).append(
+                [bool(is_buy), description, expiration_date.isoformat()])
+        try:
+            db.session.execute(table.delete())
+            db.session.execute(table.insert().from_select(
+                ['stock_id', 'symbol', 'name'] +
+                StockSnapshot.POINT_COLUMNS, rows))
+            if signals:
+                db.session.execute(
+                    table.update()
+                    .where(table.c.stock_id == bindparam('_stock_id'))
+                    .values(signals=bindparam('signals')),
+                    [{'_stock_id': stock_id, 'signals': json.dumps(values)}
+                     for stock_id, values in signals.items()])
+            db.session.commit()
+        except:
+            db.session.rollback()
+            raise
+        return StockSnapshot.query.count()
+
+    def live_signals(self):
+        ''' The signals that haven't expired since the refresh, as
+        {'Buy': [...], 'Sell': [...]}, each a dict with a description '''
+        live = {'Buy': [], 'Sell': []}
+        now = today().isoformat()
+        for is_buy, description, expiration_date in json.loads(self.signals):
+            if expiration_date >= now:
+                live['Buy' if is_buy else 'Sell'].append(
+                    {'description': description})
+        return live
+
+    def __repr__(self):
+        return "<StockSnapshot(symbol='%s', date='%s', close='%s')>" % \
+            (self.symbol, self.date, self.close)
+
+
+class Publication(db.Model):
+    ''' A row for each time the nightly run finished publishing new
+    data. Its id is the data generation the response cache keys pages
+    by, so adding one makes every cached page stale. session is the last
+    completed trading session the run fetched, when it fetched. '''
+
+    __tablename__ = 'publication'
+
+    id = db.Column(db.Integer, primary_key=True)
+    published_at = db.Column(db.DateTime, nullable=False)
+    session = db.Column(db.Date, nullable=True)
+
+    @staticmethod
+    def current():
+        ''' The latest Publication, or None before the first one '''
+        return Publication.query.order_by(Publication.id.desc()).first()
+
+    @staticmethod
+    def fetched_through():
+        ''' The latest session a run has fetched, or None '''
+        return db.session.query(func.max(Publication.session)).scalar()
+
+    @staticmethod
+    def bump(session=None):
+        ''' Records that new data is out, fetched through session if
+        it's given. Returns the new generation. '''
+        publication = Publication()
+        publication.published_at = dt.datetime.utcnow().replace(microsecond=0)
+        publication.session = session
+        db.session.add(publication)
+        db.session.commit()
+        return publication.id
+
+    def __repr__(self):
+        return "<Publication(id='%s', published_at='%s', session='%s')>" % \
+            (self.id, self.published_at, self.session)
+
+
 class Signal(db.Model):
     ''' This is a base class for all of the different types of signals a stock can have '''
     
     __tablename__ = 'signal'
+    # ix_signal_screen covers find_buy_stocks/find_sell_stocks, which
+    # filter on the first two columns and count by the third, and the
+    # other one Stock.signals
+    __table_args__ = (db.Index('ix_signal_screen', 'is_buy_signal',
+                               'expiration_date', 'stock_id'),
+                      db.Index('ix_signal_stock_id_expiration_date',
+                               'stock_id', 'expiration_date'))
     
     WEIGHT = 0.5
     EXPIRATION_DAYS = 5
@@ -307,7 +991,7 @@ class Signal(db.Model):
     created_date = db.Column(db.Date, nullable=False, default=dt.date.today())
 
     # A number between 0 and 1
-    weight = db.Column(db.Float(asdecimal=True), nullable=False)
+    weight = db.Column(db.Float(asdecimal=ASDECIMAL), nullable=False)
 
     # this variable only gets set if the signal fires, otherwise it's None
     is_buy_signal = db.Column(db.Boolean, nullable=False)
@@ -350,20 +1034,40 @@ class Signal(db.Model):
 
 class FiftyTwoWeek(object):
     ''' Class to calculate the 52 Week High/Low prices '''
+
+    WINDOW = 365
      
     def __init__(self, df, col):
         ''' col = Column to calculate (High or Low) '''
         self.df = df
         self.col = col
+        self.name = '52-Week-%s' % col
 
-    def calculate(self):
-        col = '52-Week-%s' % self.col
+    def _rolling(self, values):
         if self.col == 'High':
-            self.df[col] = pd.rolling_max(self.df['Adj High'], 365)
+            return pd.rolling_max(values, FiftyTwoWeek.WINDOW)
         elif self.col == 'Low':
-            self.df[col] = pd.rolling_min(self.df['Adj Low'], 365)
+            return pd.rolling_min(values, FiftyTwoWeek.WINDOW)
+
+    def calculate(self):
+        self.df[self.name] = self._rolling(self.df['Adj %s' % self.col])
         return self.df
 
+    def resume(self, state):
+        ''' Calculates the column for a df holding only the points after
+        the ones the state was saved from. '''
+        values = np.concatenate((state['values'],
+                                 self.df['Adj %s' % self.col].values))
+        self.df[self.name] = self._rolling(values)[-len(self.df):]
+        return self.df
+
+    def state(self, previous=None):
+        ''' The prices the next point's window overlaps with '''
+        previous = previous['values'] if previous else []
+        return {'values': list(rolling_buffer(previous,
+                    self.df['Adj %s' % self.col].values.astype(float),
+                    FiftyTwoWeek.WINDOW - 1))}
+
 class FiftyTwoWeekSignal(Signal):
 
     __mapper_args__ = {'polymorphic_identity' : 'Fifty-Two-Week'}
@@ -399,12 +1103,28 @@ class SMA(object):
     def __init__(self, df, span):
         self.df = df
         self.span = span
+        self.name = 'SMA-%s' % span
 
     def calculate(self):
-        col = 'SMA-%s' % self.span
-        self.df[col] = pd.rolling_mean(self.df['Adj Close'], self.span)
+        self.df[self.name] = pd.rolling_mean(self.df['Adj Close'], self.span)
+        return self.df
+
+    def resume(self, state):
+        ''' Calculates the column for a df holding only the points after
+        the ones the state was saved from. '''
+        values = np.concatenate((state['values'],
+                                 self.df['Adj Close'].values))
+        self.df[self.name] = pd.rolling_mean(values,
+                                             self.span)[-len(self.df):]
         return self.df
 
+    def state(self, previous=None):
+        ''' The closes the next point's average overlaps with '''
+        previous = previous['values'] if previous else []
+        return {'values': list(rolling_buffer(previous,
+                    self.df['Adj Close'].values.astype(float),
+                    self.span - 1))}
+
 class SMA50PriceCross(Signal):
 
     __mapper_args__ = {'polymorphic_identity' : 'SMA50-Price-Cross'}
@@ -483,49 +1203,82 @@ class RSI(object):
 
     def __init__(self, df):
         self.df = df
+        self.name = 'RSI'
 
     def calculate(self):
-        rsi_df = pd.DataFrame( {'Change' : self.df['Adj Close'].diff(),
-                               'Gain' : 0,
-                               'Loss' : 0,
-                               'Avg Gain': 0,
-                               'Avg Loss': 0,
-                               })
-        rsi_df.index.name='Date'
-        rsi_df.reset_index(inplace=True)
+        self.close = self.df['Adj Close'].values.astype(float)
+        self.avg_gain, self.avg_loss = RSI.average_gain_loss(self.close)
+        self.df['RSI'] = RSI.from_averages(self.avg_gain, self.avg_loss)
+        return self.df
+
+    def resume(self, state):
+        ''' Calculates RSI for a df holding only the points after the
+        ones the state was saved from, carrying on their averages. '''
+        self.close = self.df['Adj Close'].values.astype(float)
+        gain, loss = RSI.gains_losses(
+            np.concatenate(([state['close']], self.close)))
+        self.avg_gain = wilder_smooth(gain, RSI.LOOKBACK, state['avg_gain'])
+        self.avg_loss = wilder_smooth(loss, RSI.LOOKBACK, state['avg_loss'])
+        self.df['RSI'] = RSI.from_averages(self.avg_gain, self.avg_loss)
+        return self.df
+
+    def state(self, previous=None):
+        ''' The last close and averages, or None until the first
+        averages exist '''
+        if len(self.df) == 0 or np.isnan(self.avg_gain[-1]) or \
+                np.isnan(self.avg_loss[-1]):
+            return None
+        return {'close': self.close[-1], 'avg_gain': self.avg_gain[-1],
+                'avg_loss': self.avg_loss[-1]}
+
+    @staticmethod
+    def gains_losses(close):
+        ''' Returns the (Gain, Loss) arrays for each day with a Change,
+        so element 0 belongs to row 1. Losses are expressed as positive
+        values and a missing Change counts as neither.
+        '''
+        change = np.diff(close)
+        gain = np.where(change > 0, change, 0.)
+        loss = np.where(change < 0, -change, 0.)
+        return gain, loss
+
+    @staticmethod
+    def average_gain_loss(close):
         ''' Calculate the first Average Gain and Average Loss, which is
         the simple mean of Gains and Losses for the first 14 datapoints
-        with a Change (so, rows 1 thru 15). The Average Loss is
-        expressed as a positive value
+        with a Change (so, rows 1 thru 15). The rest of the points use
+        Wilder's smoothing:
+        Average Gain = (previous_Avg_Gain * 13 + current_Gain) / 14
+        Average Loss = (previous_Avg_Loss * 13 + current_Loss) / 14
+
+        Returns two arrays the length of close, NaN until the first
+        average exists.
         '''
-        rsi_df['Gain'] = rsi_df['Change'][rsi_df['Change'] > 0]
-        rsi_df['Loss'] = rsi_df['Change'][rsi_df['Change'] < 0] * -1
-        rsi_df.fillna(value=0, inplace=True)
-        rsi_df.loc[RSI.LOOKBACK,'Avg Gain'] = \
-            rsi_df['Gain'][1:RSI.LOOKBACK+1].mean()
-        rsi_df.loc[RSI.LOOKBACK,'Avg Loss'] = \
-            rsi_df['Loss'][1:RSI.LOOKBACK+1].mean()
-
-        ''' The rest of the Avg Gain/Avg Loss points use the following
-        formula:
-        Average Gain = (previous_Avg_Gain * 13 + current_Gain) / 14 
-        Average Loss = (previous_Avg_Loss * 13 + current_Loss) /14
-
-        Note: I spent a good 2 hours trying to figure out a way to do
-        this by pure dataframe manipulation, to no avail. Eventually,
-        you just have to move on.
+        avg_gain = np.empty(len(close))
+        avg_loss = np.empty(len(close))
+        avg_gain.fill(np.nan)
+        avg_loss.fill(np.nan)
+        if len(close) <= RSI.LOOKBACK:
+            return avg_gain, avg_loss
+        gain, loss = RSI.gains_losses(close)
+        avg_gain[RSI.LOOKBACK] = gain[:RSI.LOOKBACK].mean()
+        avg_loss[RSI.LOOKBACK] = loss[:RSI.LOOKBACK].mean()
+        avg_gain[RSI.LOOKBACK+1:] = wilder_smooth(gain[RSI.LOOKBACK:],
+                                                  RSI.LOOKBACK,
+                                                  avg_gain[RSI.LOOKBACK])
+        avg_loss[RSI.LOOKBACK+1:] = wilder_smooth(loss[RSI.LOOKBACK:],
+                                                  RSI.LOOKBACK,
+                                                  avg_loss[RSI.LOOKBACK])
+        return avg_gain, avg_loss
+
+    @staticmethod
+    def from_averages(avg_gain, avg_loss):
+        ''' RSI = 100 - 100 / (1 + RS), where RS = Avg Gain / Avg Loss.
+        No losses at all gives an RS of infinity, and so an RSI of 100.
         '''
-        for index, row in rsi_df.iterrows():
-            ''' Using .ix[index] accesses the actual dataframe, using 
-            [index] just accesses a copy 
-            '''
-            if index > RSI.LOOKBACK:  
-                rsi_df.loc[index,'Avg Gain'] = (rsi_df['Avg Gain'][index-1] * (RSI.LOOKBACK - 1) + rsi_df['Gain'][index]) / RSI.LOOKBACK
-                rsi_df.loc[index,'Avg Loss'] = (rsi_df['Avg Loss'][index-1] * (RSI.LOOKBACK - 1) + rsi_df['Loss'][index]) / RSI.LOOKBACK 
-        rsi_df['RS'] = rsi_df['Avg Gain'] / rsi_df['Avg Loss']
-        rsi_df.set_index(keys='Date', drop=True, inplace=True)
-        self.df['RSI'] = 100 - (100 / (1 + rsi_df['RS']))
-        return self.df
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rs = np.asarray(avg_gain) / np.asarray(avg_loss)
+            return 100 - (100 / (1 + rs))
 
 class RSISignal(Signal):
 
@@ -589,18 +1342,41 @@ class MACD(object):
 
     def __init__(self, df):
         self.df = df
+        self.name = 'MACD'
 
     def calculate(self):
-        tempDF= pd.DataFrame({ 'Adj Close' : self.df['Adj Close']})
-        tempDF['FAST'] = pd.ewma(tempDF['Adj Close'],
-                                  span=MACD.FAST_SPAN)
-        tempDF['SLOW'] = pd.ewma(tempDF['Adj Close'],
-                                  span=MACD.SLOW_SPAN)
-        tempDF['MACD'] = tempDF['FAST'] - tempDF['SLOW']
-        self.df['MACD-Signal'] = pd.ewma(tempDF['MACD'], span=MACD.SMOOTHING_SPAN)
-        self.df['MACD'] = tempDF['MACD']
+        close = self.df['Adj Close'].values.astype(float)
+        self.fast = pd.ewma(close, span=MACD.FAST_SPAN)
+        self.slow = pd.ewma(close, span=MACD.SLOW_SPAN)
+        self.signal = pd.ewma(self.fast - self.slow,
+                              span=MACD.SMOOTHING_SPAN)
+        self.df['MACD'] = self.fast - self.slow
+        self.df['MACD-Signal'] = self.signal
         return self.df
 
+    def resume(self, state):
+        ''' Calculates MACD for a df holding only the points after the
+        ones the state was saved from, carrying on their averages. '''
+        close = self.df['Adj Close'].values.astype(float)
+        self.fast = ewma_resume(close, MACD.FAST_SPAN, state['fast'],
+                                state['points'])
+        self.slow = ewma_resume(close, MACD.SLOW_SPAN, state['slow'],
+                                state['points'])
+        self.signal = ewma_resume(self.fast - self.slow,
+                                  MACD.SMOOTHING_SPAN, state['signal'],
+                                  state['points'])
+        self.df['MACD'] = self.fast - self.slow
+        self.df['MACD-Signal'] = self.signal
+        return self.df
+
+    def state(self, previous=None):
+        ''' The last averages and how many points went into them '''
+        if len(self.df) == 0:
+            return None
+        points = len(self.df) + (previous['points'] if previous else 0)
+        return {'fast': self.fast[-1], 'slow': self.slow[-1],
+                'signal': self.signal[-1], 'points': points}
+
 class MACDSignalCross(Signal):
     
     __mapper_args__ = {'polymorphic_identity': 'MACD-Signal-Line-Crossover'}
@@ -0,0 +1,387 @@
+''' Panel engine: calculates the indicators for a batch of stocks at once
+instead of one Stock at a time. The points of every stock in the batch
+get loaded with one query into dates x stocks arrays, and each indicator
+is a handful of column-wise pandas passes over those. The signal classes
+still decide the signals, but only for the stocks a quick vectorized
+screen says could have one.
+'''
+import datetime as dt
+import json
+import logging
+import time
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select, and_, or_, type_coerce
+from sqlalchemy.orm import subqueryload
+from app import db
+from app.models import Stock, StockPoint, IndicatorState, RSI, MACD, \
+    FiftyTwoWeek, RSISignal, MACDCenterCross, MACDSignalCross, \
+    SMA50PriceCross, SMA200PriceCross, fetch_arrays
+
+# Stocks per panel. A batch of 1000 with the full LOOKBACK_DAYS of history
+# takes a few hundred MB of arrays.
+PANEL_BATCH = 1000
+
+# Calendar days loaded before the first pending point in incremental mode.
+# At about 252 trading days a year that's a few more than the
+# INDICATOR_WARMUP points that get used.
+WARMUP_DAYS = Stock.INDICATOR_WARMUP * 3 // 2
+
+# (db column, panel column) pairs loaded for every point
+PANEL_COLUMNS = [('open', 'Open'), ('high', 'High'), ('low', 'Low'),
+                 ('close', 'Close'), ('adj_close', 'Adj Close'),
+                 ('macd', 'MACD')]
+
+class IndicatorPanel(object):
+    ''' The points of a batch of stocks as dates x stocks arrays. Each
+    stock's history is aligned to the last row, and the rows before its
+    first point are NaN, which the rolling windows and moving averages
+    treat the same as no data at all. So every column comes out exactly
+    as the stock's own calculate_indicators would have it.
+    '''
+
+    def __init__(self, stock_ids, incremental=False, start_dates=None):
+        ''' Loads the points of stock_ids, each from its date in
+        start_dates on if that's given. With incremental set, only the
+        points from each stock's first one without indicators on are
+        pending, and only INDICATOR_WARMUP points before those are used.
+        Otherwise every point is. '''
+        table = StockPoint.__table__
+        if start_dates is None:
+            where = table.c.stock_id.in_(stock_ids)
+        else:
+            # one condition per date, for the stocks starting on it
+            starting = {}
+            for stock_id in stock_ids:
+                starting.setdefault(start_dates[stock_id], []).append(stock_id)
+            where = or_(*[and_(table.c.stock_id.in_(ids),
+                               table.c.date >= start_date)
+                          for start_date, ids in sorted(starting.items())])
+        count = db.session.execute(
+            select([func.count()]).where(where)).scalar()
+        result = db.session.execute(
+            select([table.c.stock_id, table.c.date] +
+                   [type_coerce(table.c[col], db.Float)
+                    for col, name in PANEL_COLUMNS])
+            .where(where)
+            .order_by(table.c.stock_id, table.c.date))
+        arrays = fetch_arrays(result, count,
+                              [np.int64, 'datetime64[D]'] +
+                              [np.float64] * len(PANEL_COLUMNS))
+        self._pivot(arrays[0], arrays[1], arrays[2:])
+        if incremental:
+            pending = np.isnan(self.columns['MACD']) & self.valid()
+        else:
+            pending = self.valid()
+        # like Stock.calculate_indicators, everything from the first
+        # pending point on gets (re)written
+        first = np.where(pending.any(axis=0), pending.argmax(axis=0),
+                         self.depth)
+        self.pending = self.rows() >= first
+        if incremental:
+            self._trim(np.maximum(self.starts,
+                                  first - Stock.INDICATOR_WARMUP))
+        self.indicators = {}
+        # the last row of the averages the indicator states carry on
+        self.averages = {}
+
+    def _pivot(self, ids, dates, arrays):
+        ''' Spreads the rows (ordered by stock, then date) out into one
+        column per stock, right aligned '''
+        self.stock_ids, first, counts = np.unique(ids, return_index=True,
+                                                  return_counts=True)
+        self.depth = counts.max() if len(counts) else 0
+        self.starts = self.depth - counts
+        col = np.repeat(np.arange(len(counts)), counts)
+        row = np.arange(len(ids)) - first[col] + self.starts[col]
+        shape = (self.depth, len(counts))
+        self.dates = np.full(shape, np.datetime64('NaT'),
+                             dtype='datetime64[D]')
+        self.dates[row, col] = dates
+        self.columns = {}
+        for (col_name, name), values in zip(PANEL_COLUMNS, arrays):
+            self.columns[name] = np.full(shape, np.nan)
+            self.columns[name][row, col] = values
+
+    def _trim(self, starts):
+        ''' Drops each stock's points before its row in starts '''
+        dropped = self.rows() < starts
+        for values in self.columns.values():
+            values[dropped] = np.nan
+        self.starts = starts
+
+    def rows(self):
+        ''' Row numbers as a column, to broadcast against the arrays '''
+        return np.arange(self.depth)[:, np.newaxis]
+
+    def valid(self):
+        ''' Mask of the cells holding a point '''
+        return self.rows() >= self.starts
+
+    def nbytes(self):
+        ''' Size of all the arrays '''
+        return self.dates.nbytes + self.pending.nbytes + \
+            sum(values.nbytes for values in self.columns.values()) + \
+            sum(values.nbytes for values in self.indicators.values())
+
+    def calculate(self):
+        ''' Calculates every indicator column for the whole panel '''
+        close = self.columns['Adj Close']
+        factor = close / self.columns['Close']
+        for name in ['Open', 'High', 'Low']:
+            self.indicators['Adj %s' % name] = self.columns[name] * factor
+        self.indicators['52-Week-High'] = _panel(
+            pd.rolling_max, self.indicators['Adj High'], FiftyTwoWeek.WINDOW)
+        self.indicators['52-Week-Low'] = _panel(
+            pd.rolling_min, self.indicators['Adj Low'], FiftyTwoWeek.WINDOW)
+        self.indicators['SMA-50'] = _panel(pd.rolling_mean, close, 50)
+        self.indicators['SMA-200'] = _panel(pd.rolling_mean, close, 200)
+        fast = _panel(pd.ewma, close, span=MACD.FAST_SPAN)
+        slow = _panel(pd.ewma, close, span=MACD.SLOW_SPAN)
+        self.indicators['MACD'] = fast - slow
+        self.indicators['MACD-Signal'] = _panel(
+            pd.ewma, fast - slow, span=MACD.SMOOTHING_SPAN)
+        self.averages['fast'], self.averages['slow'] = fast[-1], slow[-1]
+        self.indicators['RSI'] = self._rsi(close)
+        self.indicators['Adj Close'] = close
+
+    def _rsi(self, close):
+        ''' RSI.average_gain_loss for every column: the first average is
+        the mean of the 14 changes after a stock's first point, and the
+        rest is Wilder's smoothing on from there. '''
+        with np.errstate(invalid='ignore'):
+            change = np.diff(close, axis=0)
+            gain = np.where(change > 0, change, 0.)
+            loss = np.where(change < 0, -change, 0.)
+        # row i of gain/loss is the change into row i + 1 of the panel
+        rows = self.rows()[1:]
+        seed_rows = self.starts + RSI.LOOKBACK
+        seeded = np.nonzero(seed_rows < self.depth)[0]
+        window = (rows > self.starts) & (rows <= seed_rows)
+        averages = []
+        for values in (gain, loss):
+            seed = np.where(window, values, 0.).sum(axis=0) / RSI.LOOKBACK
+            values = np.where(rows > seed_rows, values, np.nan)
+            values = np.vstack((np.full((1, len(self.starts)), np.nan),
+                                values))
+            values[seed_rows[seeded], seeded] = seed[seeded]
+            averages.append(_panel(pd.ewma, values, com=RSI.LOOKBACK - 1,
+                                   adjust=False))
+        self.averages['gain'], self.averages['loss'] = \
+            averages[0][-1], averages[1][-1]
+        return RSI.from_averages(*averages)
+
+    def screen(self):
+        ''' Mask of the stocks a signal could fire for: the vectorized
+        version of each signal's condition, so the signal classes only
+        get run for those. The 52 week check is the same as
+        FiftyTwoWeekSignal's, and the rest are a line sitting on one side
+        of a level for BEFORE points and then crossing it on the last.
+        Only stocks with pending points and at least two of them are
+        considered. '''
+        candidates = np.zeros(len(self.starts), dtype=bool)
+        if self.depth < 2:
+            return candidates
+        # (line, level it drops under, level it rises over, BEFORE)
+        crosses = [('RSI', RSISignal.OVERBOUGHT, RSISignal.OVERSOLD,
+                    RSISignal.BEFORE),
+                   ('MACD', 0, 0, MACDCenterCross.BEFORE),
+                   ('MACD', 'MACD-Signal', 'MACD-Signal',
+                    MACDSignalCross.BEFORE),
+                   ('SMA-50', 'Adj Close', 'Adj Close',
+                    SMA50PriceCross.BEFORE),
+                   ('SMA-200', 'Adj Close', 'Adj Close',
+                    SMA200PriceCross.BEFORE)]
+        with np.errstate(invalid='ignore'):
+            for line, high, low, before in crosses:
+                if self.depth > before:
+                    candidates |= self._crossed(line, high, low, before)
+            highs = self.indicators['52-Week-High']
+            lows = self.indicators['52-Week-Low']
+            candidates |= highs[-2] < highs[-1]
+            candidates |= lows[-2] > lows[-1]
+        return candidates & self.pending[-1] & (self.starts < self.depth - 1)
+
+    def _crossed(self, line, high, low, before):
+        ''' Mask of the stocks where line was at or above high for the
+        before points ahead of the last one and then dropped below it, or
+        at or below low and then rose above it. Levels are either a
+        number or another indicator. '''
+        window = self.indicators[line][-before-1:]
+        high, low = [self.indicators[level][-before-1:]
+                     if isinstance(level, str) else level
+                     for level in (high, low)]
+        dropped = (window >= high)[:-1].all(axis=0) & (window < high)[-1]
+        rose = (window <= low)[:-1].all(axis=0) & (window > low)[-1]
+        return dropped | rose
+
+    def frame(self, col):
+        ''' DataFrame of the last SIGNAL_WINDOW points of column col, in
+        the shape Stock._evaluate_signals takes '''
+        start = max(self.starts[col], self.depth - Stock.SIGNAL_WINDOW)
+        return pd.DataFrame(
+            dict((name, values[start:, col])
+                 for name, values in self.indicators.items()),
+            index=pd.DatetimeIndex(self.dates[start:, col]))
+
+    def evaluate_signals(self):
+        ''' Evaluates the signals for the stocks that pass the screen.
+        Returns how many fired. '''
+        cols = dict((int(self.stock_ids[col]), col)
+                    for col in np.nonzero(self.screen())[0])
+        if not cols:
+            return 0
+        fired = 0
+        for stock in Stock.query.options(subqueryload(Stock.signals))\
+                .filter(Stock.id.in_(cols.keys())):
+            before = len(stock.signals)
+            stock._evaluate_signals(self.frame(cols[stock.id]))
+            fired += len(stock.signals) - before
+        return fired
+
+    def last_dates(self):
+        ''' {stock id: date of its last point} '''
+        return dict(zip(self.stock_ids.tolist(),
+                        self.dates[-1].astype(dt.date)))
+
+    def written_since(self):
+        ''' {stock id: date of the first point save writes} for the stocks
+        it writes any of '''
+        cols = np.nonzero(self.pending.any(axis=0))[0]
+        rows = self.pending.argmax(axis=0)[cols]
+        return dict(zip(self.stock_ids[cols].tolist(),
+                        self.dates[rows, cols].astype(dt.date)))
+
+    def states(self):
+        ''' {stock id: (last date, {indicator: state})} with the state
+        each of Stock's indicators would save at the stock's last point,
+        for the stocks they all have one for '''
+        last = self.depth - 1
+        states = {}
+        for col, stock_id in enumerate(self.stock_ids.tolist()):
+            if np.isnan(self.averages['gain'][col]) or \
+                    np.isnan(self.averages['loss'][col]):
+                continue    # too few points for RSI
+            start = self.starts[col]
+            def kept(name, size):
+                return self.indicators[name][max(start, last + 1 - size):,
+                                             col].tolist()
+            states[stock_id] = (self.dates[last, col].tolist(), {
+                '52-Week-High': {'values': kept('Adj High',
+                                                FiftyTwoWeek.WINDOW - 1)},
+                '52-Week-Low': {'values': kept('Adj Low',
+                                               FiftyTwoWeek.WINDOW - 1)},
+                'RSI': {'close': self.indicators['Adj Close'][last, col],
+                        'avg_gain': self.averages['gain'][col],
+                        'avg_loss': self.averages['loss'][col]},
+                'MACD': {'fast': self.averages['fast'][col],
+                         'slow': self.averages['slow'][col],
+                         'signal': self.indicators['MACD-Signal'][last, col],
+                         'points': int(self.depth - start)},
+                'SMA-50': {'values': kept('Adj Close', 50 - 1)},
+                'SMA-200': {'values': kept('Adj Close', 200 - 1)}})
+        return states
+
+    def save(self):
+        ''' Writes the pending points' indicators with one executemany
+        UPDATE for the whole panel, and the stocks' indicator states (see
+        states) in place of the ones they had, so a Stock's own
+        calculate_indicators can carry on from them. Returns how many
+        points were written. '''
+        rows, cols = np.nonzero(self.pending)
+        columns = [col for col, name in Stock.UPDATE_COLUMNS]
+        values = np.column_stack([self.indicators[name][rows, cols]
+                                  for col, name in Stock.UPDATE_COLUMNS])
+        missing = np.isnan(values)
+        values = values.astype(object)
+        values[missing] = None
+        if len(rows) > 0:
+            Stock.update_points(
+                [dict(zip(columns, row), b_stock_id=stock_id, b_date=date)
+                 for stock_id, date, row in
+                 zip(self.stock_ids[cols].tolist(),
+                     self.dates[rows, cols].tolist(), values.tolist())])
+        table = IndicatorState.__table__
+        db.session.execute(table.delete().where(
+            table.c.stock_id.in_(self.stock_ids.tolist())))
+        states = [dict(stock_id=stock_id, indicator=name, last_date=last_date,
+                       state=json.dumps(values))
+                  for stock_id, (last_date, indicators) in self.states().items()
+                  for name, values in indicators.items()]
+        if states:
+            db.session.execute(table.insert(), states)
+        return len(rows)
+
+def _panel(function, values, *args, **kwargs):
+    ''' Applies a pandas moving window/average function to each column '''
+    return function(pd.DataFrame(values), *args, **kwargs).values
+
+def calculate_indicators(incremental=True, batch_size=PANEL_BATCH):
+    ''' Calculates the indicators and evaluates the signals of every
+    stock, batch_size stocks per panel. With incremental set, only the
+    stocks the ingestion marked pending (see Stock.pending_since) are
+    loaded, and only their points without indicators are written. Each
+    batch is committed on its own, along with clearing the pending dates
+    it was loaded for (see Stock.clear_pending), then the points it wrote
+    are patched into the point store if there is one. Returns a summary
+    of the run: the stocks processed and skipped, and the size of the
+    arrays per 1000 stocks. '''
+    start = time.time()
+    table = Stock.__table__
+    total = db.session.execute(select([func.count()])
+                               .select_from(table)).scalar()
+    first_pending = dict(tuple(row) for row in db.session.execute(
+        select([table.c.id, table.c.pending_since])
+        .where(table.c.pending_since != None)))
+    if incremental:
+        stock_ids = sorted(first_pending)
+    else:
+        stock_ids = [stock_id for stock_id, in
+                     db.session.query(Stock.id).order_by(Stock.id)]
+    summary = {'stocks': 0, 'skipped': total - len(stock_ids), 'points': 0,
+               'signals': 0, 'bytes_per_1000': 0}
+    for i in range(0, len(stock_ids), batch_size):
+        batch = stock_ids[i:i+batch_size]
+        start_dates = None
+        if incremental:
+            # Each stock's own warm-up, rounded down to the month so a
+            # batch only has a few dates to filter on. The panel drops
+            # the points it doesn't need.
+            start_dates = dict(
+                (stock_id, (first_pending[stock_id] -
+                            dt.timedelta(days=WARMUP_DAYS)).replace(day=1))
+                for stock_id in batch)
+        try:
+            panel = IndicatorPanel(batch, incremental, start_dates)
+            panel.calculate()
+            signals = panel.evaluate_signals()
+            points = panel.save()
+            Stock.clear_pending(dict((stock_id, first_pending[stock_id])
+                                     for stock_id in batch
+                                     if stock_id in first_pending),
+                                panel.last_dates())
+            db.session.commit()
+        except Exception as e:
+            logging.warning('%s: Error calculating the indicators of stocks '
+                            '%s to %s. The batch was rolled back.',
+                            e, batch[0], batch[-1])
+            db.session.rollback()
+            continue
+        if Stock.point_store() is not None:
+            written = panel.written_since()
+            for stock in Stock.query.filter(Stock.id.in_(written.keys())):
+                stock.save_to_store(written[stock.id])
+        summary['stocks'] += len(panel.stock_ids)
+        summary['points'] += points
+        summary['signals'] += signals
+        if len(panel.stock_ids) > 0:
+            summary['bytes_per_1000'] = max(summary['bytes_per_1000'],
+                panel.nbytes() * 1000 // len(panel.stock_ids))
+    summary['seconds'] = time.time() - start
+    logging.info('Calculated indicators for %d stocks (%d points, %d '
+                 'signals), skipped %d with no new data, in %.1f seconds, '
+                 '%.1f MB of arrays per 1000 stocks.', summary['stocks'],
+                 summary['points'], summary['signals'], summary['skipped'],
+                 summary['seconds'],
+                 summary['bytes_per_1000'] / 1e6)
+    return summary
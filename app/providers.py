@@ -0,0 +1,375 @@
+''' Where the OHLCV points come from. Every provider returns the points of
+a symbol between two dates as a DataFrame shaped like DataReader's
+(indexed by Date, oldest first, with Open, High, Low, Close, Volume and
+Adj Close columns), or None when it doesn't know the symbol.
+
+The OHLC_PROVIDER setting picks the one get_provider returns: 'yahoo'
+(the default) downloads from Yahoo, and 'local' reads from the directory
+in OHLC_DIRECTORY, so a whole universe can be replayed at disk speed.
+Either can sit behind a CachedProvider.
+'''
+import abc
+import datetime as dt
+import logging
+import os
+import time
+import urllib
+import numpy as np
+import pandas as pd
+from app import app
+from app.fetcher import OHLCFetcher, parse_csv
+
+# Seconds a cached range is good for
+CACHE_TTL = app.config.get('OHLC_CACHE_TTL', 7 * 24 * 60 * 60)
+# Bytes the cache may take up before the least recently used ranges go
+CACHE_MAX_BYTES = app.config.get('OHLC_CACHE_MAX_BYTES', 1 << 30)
+# Requests the cache served whole, ones it served but for a few days it
+# fetched, and ones it had nothing for, in this process
+CACHE_COUNTERS = {'hits': 0, 'partial': 0, 'misses': 0}
+ONE_DAY = dt.timedelta(days=1)
+
+class Provider(object):
+    ''' Base class for the providers. A provider has to implement fetch,
+    or it can't be created. '''
+    __metaclass__ = abc.ABCMeta
+
+    @abc.abstractmethod
+    def fetch(self, symbol, start_date, end_date):
+        ''' Returns symbol's points between the dates (inclusive), or None
+        if the provider doesn't have the symbol. Raises IOError when it
+        can't get them. '''
+
+    def fetch_many(self, jobs):
+        ''' Fetches each (symbol, start_date, end_date) of jobs. Yields
+        (job, result) pairs as they're done, where result is what fetch
+        returned or the exception it raised. '''
+        for job in jobs:
+            try:
+                yield job, self.fetch(*job)
+            except Exception as e:
+                logging.warning('Error fetching %s: %s', job[0], e)
+                yield job, e
+
+class YahooProvider(Provider):
+    ''' Yahoo's historical prices, downloaded through an OHLCFetcher, so
+    fetch_many runs the downloads concurrently '''
+
+    def __init__(self, **kwargs):
+        self.fetcher = OHLCFetcher(**kwargs)
+
+    def fetch(self, symbol, start_date, end_date):
+        return self.fetcher.fetch(symbol, start_date, end_date)
+
+    def fetch_many(self, jobs):
+        return self.fetcher.fetch_many(jobs)
+
+class LocalProvider(Provider):
+    ''' Points stored one file per symbol in directory: SYMBOL.npy (see
+    save_points), which gets memory mapped so only the rows asked for are
+    read, or else SYMBOL.csv in Yahoo's format (parsed whole, so slower).
+    save writes the .npy files. '''
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, symbol, extension):
+        return os.path.join(self.directory, '%s.%s' % (symbol, extension))
+
+    def fetch(self, symbol, start_date, end_date):
+        if os.path.exists(self.path(symbol, 'npy')):
+            return load_points(self.path(symbol, 'npy'), start_date, end_date)
+        elif os.path.exists(self.path(symbol, 'csv')):
+            return self._fetch_csv(symbol, start_date, end_date)
+        return None
+
+    def _fetch_csv(self, symbol, start_date, end_date):
+        with open(self.path(symbol, 'csv'), 'rb') as f:
+            df = parse_csv(f.read())
+        return df[(df.index >= pd.Timestamp(start_date)) &
+                  (df.index <= pd.Timestamp(end_date))]
+
+    def save(self, symbol, df):
+        ''' Writes the points of df (shaped like what fetch returns) to
+        SYMBOL.npy '''
+        save_points(self.path(symbol, 'npy'), df)
+
+class CachedProvider(Provider):
+    ''' Keeps what provider fetches in directory, so reruns and rebuilds
+    of stock_point are read from disk instead of downloaded again.
+
+    Each symbol gets a folder holding a START_END.npy file per date range
+    it has cached. Ranges that overlap or touch get merged into one file,
+    and a request that's only partly cached only fetches the days around
+    what is. A range is never cached past the last day that came back, so
+    a day that wasn't published yet gets asked for again. Files older than
+    ttl seconds are dropped, since adjusted closes change with dividends
+    and splits, and once the files add up to more than max_bytes the
+    least recently used go. Requests are counted in CACHE_COUNTERS. '''
+
+    # Bytes in each cache directory, as this process counts them
+    sizes = {}
+
+    def __init__(self, provider, directory, max_bytes=CACHE_MAX_BYTES,
+                 ttl=CACHE_TTL):
+        self.provider = provider
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:     # made by another worker in the meantime
+                pass
+        if directory not in CachedProvider.sizes:
+            CachedProvider.sizes[directory] = \
+                sum(size for path, size, used in self._files())
+
+    def folder(self, symbol):
+        return os.path.join(self.directory, urllib.quote(symbol, safe=''))
+
+    def fetch(self, symbol, start_date, end_date):
+        entries, gaps = self._plan(symbol, start_date, end_date)
+        results = [(gap, self.provider.fetch(symbol, *gap)) for gap in gaps]
+        return self._finish(symbol, start_date, end_date, entries, results)
+
+    def fetch_many(self, jobs):
+        ''' Yields the jobs served from the cache straight away, then
+        hands the gaps of the rest to provider.fetch_many in one batch '''
+        plans = {}
+        gap_jobs = {}
+        for job in jobs:
+            entries, gaps = self._plan(*job)
+            if not gaps:
+                yield job, self._finish_job(job, entries, [])
+                continue
+            plans[job] = (entries, len(gaps), [])
+            for gap in gaps:
+                gap_jobs.setdefault((job[0],) + gap, []).append(job)
+        for gap_job, df in self.provider.fetch_many(gap_jobs.keys()):
+            for job in gap_jobs[gap_job]:
+                entries, gaps, results = plans[job]
+                results.append((gap_job[1:], df))
+                if len(results) == gaps:
+                    yield job, self._finish_job(job, entries, results)
+
+    def _finish_job(self, job, entries, results):
+        try:
+            return self._finish(job[0], job[1], job[2], entries, results)
+        except Exception as e:
+            logging.warning('Error fetching %s: %s', job[0], e)
+            return e
+
+    def _entries(self, symbol):
+        ''' (start, end, path) of each of symbol's cached ranges, oldest
+        first, dropping the ones past their ttl '''
+        folder = self.folder(symbol)
+        if not os.path.isdir(folder):
+            return []
+        entries = []
+        now = time.time()
+        for name in os.listdir(folder):
+            if not name.endswith('.npy'):
+                continue
+            path = os.path.join(folder, name)
+            try:
+                created = os.path.getmtime(path)
+            except OSError:     # evicted by another worker
+                continue
+            if now - created > self.ttl:
+                self._remove(path)
+                continue
+            start, end = [dt.datetime.strptime(date, '%Y%m%d').date()
+                          for date in name[:-4].split('_')]
+            entries.append((start, end, path))
+        return sorted(entries)
+
+    def _plan(self, symbol, start_date, end_date):
+        ''' The cached entries that overlap or touch the range, and the
+        (start, end) gaps of the range they don't cover '''
+        entries = [entry for entry in self._entries(symbol)
+                   if entry[0] <= end_date + ONE_DAY and
+                   entry[1] >= start_date - ONE_DAY]
+        gaps = []
+        day = start_date
+        for start, end, path in entries:
+            if start > day:
+                gaps.append((day, min(start - ONE_DAY, end_date)))
+            day = max(day, end + ONE_DAY)
+        if day <= end_date:
+            gaps.append((day, end_date))
+        return entries, gaps
+
+    def _finish(self, symbol, start_date, end_date, entries, results):
+        ''' Returns the points between the dates from the cached entries
+        and the fetched gaps, caching what was fetched '''
+        if not results:
+            CACHE_COUNTERS['hits'] += 1
+            df = pd.concat([load_points(path, start_date, end_date)
+                            for start, end, path in entries])
+            now = time.time()
+            for start, end, path in entries:
+                try:
+                    os.utime(path, (now, os.path.getmtime(path)))
+                except OSError:     # evicted by another worker since
+                    pass
+            return df
+        CACHE_COUNTERS['partial' if entries else 'misses'] += 1
+        for gap, df in results:
+            if isinstance(df, Exception):
+                raise df
+        fetched = [df for gap, df in results if df is not None]
+        if not entries and not fetched:
+            return None
+        df = pd.concat([load_points(path) for start, end, path in entries] +
+                       fetched).sort_index()
+        for start, end, run in self._covered(entries, results):
+            points = df[(df.index >= pd.Timestamp(start)) &
+                        (df.index <= pd.Timestamp(end))]
+            if len(points) > 0:
+                self._save(symbol, run, points, start, end)
+        return df[(df.index >= pd.Timestamp(start_date)) &
+                  (df.index <= pd.Timestamp(end_date))]
+
+    def _covered(self, entries, results):
+        ''' The (start, end, entries) runs of days the cached entries and
+        the fetched gaps now cover, for the gaps that changed anything. A
+        gap only counts if rows came back for it, and one with nothing
+        cached after it only up to its last row, so a span that failed or
+        wasn't published yet gets asked for again. '''
+        ranges = [(start, end, [(start, end, path)])
+                  for start, end, path in entries]
+        for (start, end), df in results:
+            if df is None or len(df) == 0:
+                continue
+            if not any(entry[0] > end for entry in entries):
+                end = min(end, df.index[-1].date())
+            ranges.append((start, end, []))
+        runs = []
+        for start, end, merged in sorted(ranges):
+            if runs and start <= runs[-1][1] + ONE_DAY:
+                last = runs[-1]
+                runs[-1] = (last[0], max(last[1], end), last[2] + merged,
+                            last[3] + (0 if merged else 1))
+            else:
+                runs.append((start, end, merged, 0 if merged else 1))
+        return [(start, end, merged) for start, end, merged, gaps in runs
+                if gaps]
+
+    def _save(self, symbol, entries, df, start_date, end_date):
+        ''' Writes df as the entry for the range, replacing the entries it
+        was merged from. It keeps the oldest creation time of those, so
+        merging doesn't hold off the ttl. '''
+        folder = self.folder(symbol)
+        path = os.path.join(folder, '%s_%s.npy' % (
+            start_date.strftime('%Y%m%d'), end_date.strftime('%Y%m%d')))
+        created = time.time()
+        for start, end, old_path in entries:
+            try:
+                created = min(created, os.path.getmtime(old_path))
+            except OSError:
+                pass
+        if not os.path.isdir(folder):
+            try:
+                os.makedirs(folder)
+            except OSError:
+                pass
+        # written aside then renamed, so no reader sees half a file
+        temp = '%s.%s.tmp' % (path, os.getpid())
+        with open(temp, 'wb') as f:
+            save_points(f, df)
+        os.utime(temp, (time.time(), created))
+        if os.path.exists(path):
+            CachedProvider.sizes[self.directory] -= os.path.getsize(path)
+        os.rename(temp, path)
+        CachedProvider.sizes[self.directory] += os.path.getsize(path)
+        for start, end, old_path in entries:
+            if old_path != path:
+                self._remove(old_path)
+        if CachedProvider.sizes[self.directory] > self.max_bytes:
+            self._evict()
+
+    def _files(self):
+        ''' (path, bytes, last used) of every cached file '''
+        files = []
+        for folder, names, filenames in os.walk(self.directory):
+            for name in filenames:
+                if name.endswith('.npy'):
+                    try:
+                        stat = os.stat(os.path.join(folder, name))
+                    except OSError:
+                        continue
+                    files.append((os.path.join(folder, name), stat.st_size,
+                                  stat.st_atime))
+        return files
+
+    def _evict(self):
+        ''' Removes the least recently used files until they're down to
+        9/10 of max_bytes, so the next few saves don't evict again '''
+        files = sorted(self._files(), key=lambda f: f[2])
+        size = sum(f[1] for f in files)
+        for path, bytes, used in files:
+            if size <= self.max_bytes * 9 // 10:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size -= bytes
+        CachedProvider.sizes[self.directory] = size
+
+    def _remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        CachedProvider.sizes[self.directory] -= size
+
+POINT_DTYPE = [('date', 'datetime64[D]'), ('open', 'f8'), ('high', 'f8'),
+               ('low', 'f8'), ('close', 'f8'), ('volume', 'i8'),
+               ('adj_close', 'f8')]
+# (.npy field, DataFrame column) pairs
+COLUMNS = [('open', 'Open'), ('high', 'High'), ('low', 'Low'),
+           ('close', 'Close'), ('volume', 'Volume'),
+           ('adj_close', 'Adj Close')]
+
+def save_points(path, df):
+    ''' Writes the points of df to path (a filename or an open file) as
+    a structured array of POINT_DTYPE, sorted by date '''
+    points = np.empty(len(df), dtype=POINT_DTYPE)
+    points['date'] = df.index.values.astype('datetime64[D]')
+    for field, name in COLUMNS:
+        points[field] = df[name].values
+    points.sort(order='date')
+    np.save(path, points)
+
+def load_points(path, start_date=None, end_date=None):
+    ''' Reads the points save_points wrote, between the dates if
+    they're given, as a DataFrame shaped like what providers return. The
+    file is memory mapped, so only the rows in the range are read. '''
+    points = np.load(path, mmap_mode='r')
+    dates = points['date']
+    if start_date is not None:
+        points = points[np.searchsorted(dates, np.datetime64(start_date)):
+                        np.searchsorted(dates, np.datetime64(end_date),
+                                        side='right')]
+    df = pd.DataFrame(dict((name, np.array(points[field]))
+                           for field, name in COLUMNS),
+                      index=pd.DatetimeIndex(np.array(points['date'])),
+                      columns=[name for field, name in COLUMNS])
+    df.index.name = 'Date'
+    return df
+
+PROVIDERS = {'yahoo': YahooProvider, 'local': LocalProvider}
+
+def get_provider(cached=True):
+    ''' The provider the OHLC_PROVIDER setting names, behind a cache in
+    the OHLC_CACHE directory if that's set and cached is on '''
+    name = app.config.get('OHLC_PROVIDER', 'yahoo')
+    if name == 'local':
+        provider = LocalProvider(app.config['OHLC_DIRECTORY'])
+    else:
+        provider = PROVIDERS[name]()
+    if cached and app.config.get('OHLC_CACHE'):
+        provider = CachedProvider(provider, app.config['OHLC_CACHE'])
+    return provider
@@ -0,0 +1,155 @@
+''' Caches rendered pages. The pages only change when the nightly run
+publishes new data, or when the day changes and signals expire (see
+StockSnapshot.live_signals), so a page is cached under the data
+generation (see Publication) and the date plus its path and query string.
+Bumping the generation makes every cached page stale at once, and so does
+midnight. Responses carry an ETag and a Last-Modified of the publication
+(or midnight, if that's later), so browsers revalidate and get a 304
+instead of the page again.
+
+The RESPONSE_CACHE setting picks the backend: 'memory' (the default
+outside of tests), an LRU of RESPONSE_CACHE_SIZE pages in each process,
+'memcached', shared by every process through the servers in
+RESPONSE_CACHE_SERVERS (needs python-memcached), or None for no caching.
+'''
+import datetime as dt
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import request, make_response
+from app import app
+
+# Seconds the data generation is trusted for before it's read again
+GENERATION_CHECK = app.config.get('RESPONSE_CACHE_CHECK', 10)
+
+class LRUBackend(object):
+    ''' Keeps the size most recently used pages in this process '''
+
+    def __init__(self, size):
+        self.size = size
+        self.pages = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            page = self.pages.pop(key, None)
+            if page is not None:
+                self.pages[key] = page
+            return page
+
+    def set(self, key, page):
+        with self.lock:
+            self.pages.pop(key, None)
+            self.pages[key] = page
+            while len(self.pages) > self.size:
+                self.pages.popitem(last=False)
+
+class MemcacheBackend(object):
+    ''' Keeps the pages in memcached, through client (anything with
+    python-memcached's get and set), so every process shares them. Keys
+    are hashed, since memcached only takes short keys without spaces. '''
+
+    def __init__(self, client, prefix='cf2:page:'):
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, key):
+        # request paths are unicode, and md5 only takes bytes
+        return self.prefix + hashlib.md5(key.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        return self.client.get(self._key(key))
+
+    def set(self, key, page):
+        self.client.set(self._key(key), page)
+
+class ResponseCache(object):
+    ''' Serves the views it wraps from backend, keeping count of hits,
+    misses and 304s. A backend of None turns it off. '''
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.checked = 0
+        self.publication = (0, None)
+        self.counts = {'hits': 0, 'misses': 0, 'not_modified': 0}
+
+    def cached(self, view):
+        ''' Decorates view so its 200 responses get cached '''
+        @wraps(view)
+        def cached_view(*args, **kwargs):
+            if self.backend is None:
+                return view(*args, **kwargs)
+            return self.respond(view, *args, **kwargs)
+        return cached_view
+
+    def current_publication(self):
+        ''' The data generation and when it was published, read from the
+        database at most every GENERATION_CHECK seconds '''
+        if time.time() - self.checked >= GENERATION_CHECK:
+            from app.models import Publication
+            publication = Publication.current()
+            if publication is not None:
+                self.publication = (publication.id, publication.published_at)
+            self.checked = time.time()
+        return self.publication
+
+    def respond(self, view, *args, **kwargs):
+        from app.models import today
+        generation, published_at = self.current_publication()
+        day = today()
+        key = '%s:%s:%s' % (generation, day.isoformat(), request.full_path)
+        page = self.backend.get(key)
+        if page is None:
+            self.counts['misses'] += 1
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            body = response.get_data()
+            page = (body, response.headers['Content-Type'],
+                    hashlib.md5(body).hexdigest())
+            try:
+                self.backend.set(key, page)
+            except Exception as e:
+                logging.warning('Could not cache %s: %s', key, e)
+            status = 'MISS'
+        else:
+            self.counts['hits'] += 1
+            status = 'HIT'
+        body, content_type, etag = page
+        response = app.response_class(body, content_type=content_type)
+        response.set_etag('%s-%s' % (generation, etag))
+        midnight = dt.datetime.combine(day, dt.time())
+        response.last_modified = max(published_at or midnight, midnight)
+        # cached by browsers, but only used after they revalidate
+        response.cache_control.no_cache = True
+        response.headers['X-Cache'] = status
+        response.make_conditional(request)
+        if response.status_code == 304:
+            self.counts['not_modified'] += 1
+        return response
+
+    def invalidate(self):
+        ''' Makes the next request read the data generation again '''
+        self.checked = 0
+
+    def stats(self):
+        ''' The counts, and hits over all lookups '''
+        stats = dict(self.counts)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = float(stats['hits']) / lookups if lookups else 0.
+        return stats
+
+def make_backend(name):
+    if name == 'memory':
+        return LRUBackend(app.config.get('RESPONSE_CACHE_SIZE', 1000))
+    elif name == 'memcached':
+        import memcache
+        return MemcacheBackend(memcache.Client(
+            app.config.get('RESPONSE_CACHE_SERVERS', ['127.0.0.1:11211'])))
+    return None
+
+response_cache = ResponseCache(make_backend(
+    app.config.get('RESPONSE_CACHE', None if app.testing else 'memory')))
@@ -0,0 +1,89 @@
+''' A stock's points as columns of plain arrays, for /api/series. They're
+read from the point store when it's up to date, otherwise straight from
+the stock_point columns asked for into arrays, never as StockPoints, and
+can be downsampled to a number of points for charting a long range.
+'''
+import numpy as np
+from sqlalchemy import select, and_, type_coerce
+from app import db
+from app.models import Stock, StockPoint, fetch_arrays
+
+# The columns a series can have, and the df columns of them
+COLUMNS = dict(Stock.LOAD_COLUMNS)
+DEFAULT_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+# How a bucket of points is combined when downsampling. Anything not
+# listed takes the bucket's last value.
+FIRST = set(['open', 'adj_open'])
+HIGHEST = set(['high', 'adj_high', 'high_52_weeks'])
+LOWEST = set(['low', 'adj_low', 'low_52_weeks'])
+SUMMED = set(['volume'])
+
+def load_series(stock, columns, start_date=None, end_date=None):
+    ''' The stock's points from start_date to end_date (both included),
+    oldest first, as an array of datetime64[D] dates and a dict of an
+    array per column. Missing values are NaN. '''
+    df = stock.load_from_store(start_date=start_date)
+    if df is not None:
+        dates = df.index.values.astype('datetime64[D]')
+        end = len(dates)
+        if end_date is not None:
+            end = np.searchsorted(dates, np.datetime64(end_date, 'D'),
+                                  side='right')
+        return dates[:end], dict((col, df[COLUMNS[col]].values[:end])
+                                 for col in columns)
+    table = StockPoint.__table__
+    where = table.c.stock_id == stock.id
+    if start_date is not None:
+        where = and_(where, table.c.date >= start_date)
+    if end_date is not None:
+        where = and_(where, table.c.date <= end_date)
+    count = db.session.execute(select([db.func.count()]).where(where))\
+        .scalar()
+    selected = [table.c[col] if col == 'volume'
+                else type_coerce(table.c[col], db.Float) for col in columns]
+    result = db.session.execute(select([table.c.date] + selected)
+                                .where(where).order_by(table.c.date))
+    dtypes = [np.int64 if col == 'volume' else np.float64 for col in columns]
+    arrays = fetch_arrays(result, count, ['datetime64[D]'] + dtypes)
+    return arrays[0], dict(zip(columns, arrays[1:]))
+
+def downsample(dates, series, points):
+    ''' Cuts dates and series down to at most points buckets of
+    consecutive points, each dated by its first point. Prices combine
+    like a candle over the bucket (first open, highest high, lowest low,
+    last close), volumes add up and the rest take the last value. '''
+    if points <= 0 or len(dates) <= points:
+        return dates, series
+    starts = (np.arange(points) * len(dates)) // points
+    ends = np.append(starts[1:], len(dates)) - 1
+    combined = {}
+    for col, values in series.items():
+        if col in FIRST:
+            combined[col] = values[starts]
+        elif col in HIGHEST:
+            combined[col] = np.fmax.reduceat(values, starts)
+        elif col in LOWEST:
+            combined[col] = np.fmin.reduceat(values, starts)
+        elif col in SUMMED:
+            combined[col] = np.add.reduceat(values, starts)
+        else:
+            combined[col] = values[ends]
+    return dates[starts], combined
+
+def to_json(symbol, dates, series, decimals=4):
+    ''' The series as a dict ready for json.dumps: dates as YYYY-MM-DD
+    strings and each column as a list, NaNs as nulls '''
+    data = {'symbol': symbol,
+            'dates': dates.astype(str).tolist(),
+            'columns': {}}
+    for col, values in series.items():
+        if values.dtype.kind == 'f':
+            missing = np.isnan(values)
+            values = values.round(decimals).tolist()
+            if missing.any():
+                for i in np.nonzero(missing)[0]:
+                    values[i] = None
+        else:
+            values = values.tolist()
+        data['columns'][col] = values
+    return data
@@ -0,0 +1,173 @@
+''' A columnar copy of each stock's points on disk, so reads skip the SQL
+query and the row by row conversion load_dataframe_from_db does.
+
+Each stock's points are one float64 .npy file: a header row holding the
+version of the points it was written at, then a row per point, oldest
+first, with the date (as days since 1970) in the first column and the
+float columns, then the int ones, after it. Reads memory map the file
+copy-on-write and hand the float columns to pandas as one block without
+copying them, so only the rows a caller touches get read, and changing
+the DataFrame never changes the file.
+
+New points at the end are appended to the file in place: the rows go in
+past the end any reader has mapped, then the header's shape and the
+version are changed. Anything else gets a new file.
+'''
+import io
+import os
+import numpy as np
+import pandas as pd
+
+# First column of the header row. The dates in the others are days since
+# 1970, which don't go that far back.
+HEADER = -1e9
+
+class PointStore(object):
+    ''' The points of each stock id under directory. columns are the
+    DataFrame columns kept, in the order read returns them, and
+    int_columns the ones of them that are ints. '''
+
+    def __init__(self, directory, columns, int_columns=()):
+        self.directory = directory
+        self.columns = list(columns)
+        self.float_columns = [col for col in columns
+                              if col not in int_columns]
+        self.int_columns = [col for col in columns if col in int_columns]
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:     # made by another worker in the meantime
+                pass
+
+    def path(self, stock_id):
+        return os.path.join(self.directory, '%s.npy' % stock_id)
+
+    def write(self, stock_id, df, version=0):
+        ''' Replaces the stock's points with the rows of df, which has to
+        be oldest first, as of version '''
+        self._write(stock_id, self._rows(df), version)
+
+    def update(self, stock_id, since, head, df, version):
+        ''' Replaces the stock's points from since on with the rows of df,
+        as of version, keeping the ones before. head is how many of those
+        there should be. Returns False, changing nothing, if the store
+        doesn't have the stock or has another number of points before
+        since. '''
+        opened = self._open(stock_id)
+        if opened is None:
+            return False
+        points = opened[1]
+        keep = np.searchsorted(points[:, 0], date_to_days(since))
+        if keep != head:
+            return False
+        rows = self._rows(df)
+        if keep < len(points) or not self._append(stock_id, len(points),
+                                                  rows, version):
+            self._write(stock_id, np.vstack((points[:keep], rows)), version)
+        return True
+
+    def _rows(self, df):
+        ''' The store's rows for the points in df '''
+        points = np.empty((len(df), len(self.columns) + 1))
+        points[:, 0] = df.index.values.astype('datetime64[D]')\
+            .astype(np.int64)
+        for i, col in enumerate(self.float_columns + self.int_columns, 1):
+            points[:, i] = df[col].values
+        return points
+
+    def _write(self, stock_id, points, version):
+        header = np.zeros((1, len(self.columns) + 1))
+        header[0, :2] = HEADER, version
+        # written aside then renamed, so no reader sees half a file
+        temp = '%s.%s.tmp' % (self.path(stock_id), os.getpid())
+        with open(temp, 'wb') as f:
+            np.save(f, np.vstack((header, points)))
+        os.rename(temp, self.path(stock_id))
+
+    def _append(self, stock_id, count, rows, version):
+        ''' Adds rows after the count points in the stock's file. Returns
+        False if the file's header can't take the new shape in place. '''
+        with open(self.path(stock_id), 'r+b') as f:
+            if np.lib.format.read_magic(f) != (1, 0):
+                return False
+            np.lib.format.read_array_header_1_0(f)
+            offset = f.tell()
+            header = io.BytesIO()
+            np.lib.format.write_array_header_1_0(header, {
+                'descr': np.lib.format.dtype_to_descr(np.dtype(np.float64)),
+                'fortran_order': False,
+                'shape': (count + len(rows) + 1, len(self.columns) + 1)})
+            if len(header.getvalue()) != offset:
+                return False
+            row_bytes = (len(self.columns) + 1) * 8
+            f.seek(offset + (count + 1) * row_bytes)
+            f.write(rows.tobytes())
+            f.flush()
+            f.seek(0)
+            f.write(header.getvalue())
+            f.flush()
+            f.seek(offset + 8)
+            f.write(np.float64(version).tobytes())
+        return True
+
+    def remove(self, stock_id):
+        if os.path.exists(self.path(stock_id)):
+            os.remove(self.path(stock_id))
+
+    def _open(self, stock_id):
+        ''' (version, points) of the stock, memory mapped, or None if
+        there aren't any (or they were written with different columns) '''
+        try:
+            points = np.load(self.path(stock_id), mmap_mode='c')
+        except (IOError, ValueError):   # not there, or not an array
+            return None
+        if points.ndim != 2 or points.shape[1] != len(self.columns) + 1 \
+                or len(points) == 0 or points[0, 0] != HEADER:
+            return None
+        return int(points[0, 1]), points[1:]
+
+    def version(self, stock_id):
+        ''' The version the stock's points were written at, or None '''
+        opened = self._open(stock_id)
+        return opened[0] if opened is not None else None
+
+    def last_date(self, stock_id):
+        ''' The date of the stock's last point, or None '''
+        opened = self._open(stock_id)
+        if opened is None or len(opened[1]) == 0:
+            return None
+        return days_to_date(opened[1][-1, 0])
+
+    def read(self, stock_id, limit=None, start_date=None, version=None):
+        ''' The stock's points as a DataFrame indexed by date, oldest
+        first, like load_dataframe_from_db returns, or None if the store
+        doesn't have them, or if version is given and they were written
+        at another one. limit and start_date cut it down the same way
+        they do there. '''
+        opened = self._open(stock_id)
+        if opened is None:
+            return None
+        if version is not None and opened[0] != version:
+            return None
+        points = opened[1]
+        if start_date is not None:
+            points = points[np.searchsorted(points[:, 0],
+                                            date_to_days(start_date)):]
+        if limit is not None:
+            points = points[max(len(points) - limit, 0):]
+        floats = len(self.float_columns)
+        df = pd.DataFrame(points[:, 1:floats+1],
+                          index=pd.DatetimeIndex(points[:, 0]
+                                                 .astype(np.int64)
+                                                 .astype('datetime64[D]')),
+                          columns=self.float_columns)
+        for i, col in enumerate(self.int_columns, floats + 1):
+            df.insert(self.columns.index(col), col,
+                      points[:, i].astype(np.int64))
+        return df
+
+def date_to_days(date):
+    return np.datetime64(date, 'D').astype(np.int64)
+
+def days_to_date(days):
+    return np.datetime64(int(days), 'D').astype(object)
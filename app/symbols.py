@@ -0,0 +1,166 @@
+''' The symbol search behind /api/symbols: a prefix index over every
+stock's symbol and the words of its name, kept in this process so a
+keystroke never touches the database. The index is sorted lists of
+symbols and name words searched with bisect. It's built on the first search
+and built again once the nightly run has published a new universe (a new
+data generation, see Publication), which is checked at most every
+SYMBOL_INDEX_CHECK seconds.
+'''
+import bisect
+import re
+import threading
+import time
+from sqlalchemy import select
+from app import app, db
+
+GENERATION_CHECK = app.config.get('SYMBOL_INDEX_CHECK', 60)
+# words of company names that match nearly everything
+STOP_WORDS = set(['inc', 'corp', 'corporation', 'co', 'company', 'ltd',
+                  'the', 'of', 'and', 'group', 'holdings', 'plc', 'llc',
+                  'lp', 'trust', 'fund', 'common', 'stock', 'shares'])
+
+def name_words(name):
+    return [word for word in re.split(r'[^a-z0-9]+', (name or '').lower())
+            if word and word not in STOP_WORDS]
+
+def query_words(query):
+    ''' The words of a query to match names by. The last one is still
+    being typed, so it stays as a prefix even if it's a stop word so far
+    ("co" on the way to Coca-Cola). Only after other words is a stop word
+    dropped, since "tesla inc" can't narrow anything down when the names'
+    stop words aren't indexed. '''
+    tokens = [word for word in re.split(r'[^a-z0-9]+', query.lower())
+              if word]
+    if not tokens:
+        return []
+    words = [word for word in tokens[:-1] if word not in STOP_WORDS]
+    if not (words and tokens[-1] in STOP_WORDS):
+        words.append(tokens[-1])
+    return words
+
+class SymbolIndex(object):
+    ''' Finds stocks whose symbol, or a word of whose name, starts with a
+    query. Symbol matches come first, shortest symbol first (so an exact
+    match leads), then name matches, by the word matched and then the
+    symbol. Both are kept sorted in that order, so a search reads the
+    first few entries of a range instead of sorting all of it. '''
+
+    def __init__(self):
+        self.stocks = []
+        self.lengths = []
+        self.symbols = {}
+        self.word_keys = []
+        self.word_ids = []
+        self.words = []
+        self.generation = None
+        self.checked = 0
+        self.lock = threading.Lock()
+
+    def build(self, stocks):
+        ''' Indexes stocks, a list of (symbol, name, market). They're
+        numbered shortest symbol first, and the lists hold the numbers,
+        which sort in that order and hash faster than the tuples. '''
+        stocks = sorted(stocks, key=lambda stock: (len(stock[0]),
+                                                   stock[0].lower(), stock))
+        symbols = {}
+        words = []
+        entries = []
+        for i, (symbol, name, market) in enumerate(stocks):
+            symbols.setdefault(len(symbol), []).append((symbol.lower(), i))
+            words.append(set(name_words(name)))
+            entries.extend((word, i) for word in words[i])
+        for length in symbols:
+            symbols[length].sort()
+            symbols[length] = ([key for key, i in symbols[length]],
+                               [i for key, i in symbols[length]])
+        entries.sort()
+        # swapped in together, so searches in other threads see the old
+        # index or the new one
+        (self.stocks, self.lengths, self.symbols, self.word_keys,
+         self.word_ids, self.words) = (stocks, sorted(symbols), symbols,
+                                       [word for word, i in entries],
+                                       [i for word, i in entries], words)
+
+    def load(self):
+        ''' Builds the index from the active stocks of the stock table '''
+        from app.models import Stock
+        table = Stock.__table__
+        self.build([tuple(row) for row in db.session.execute(
+            select([table.c.symbol, table.c.name, table.c.market])
+            .where(table.c.active == True))])
+
+    def refresh(self):
+        ''' Loads the stock table again if a new data generation was
+        published since it was last loaded '''
+        if time.time() - self.checked < GENERATION_CHECK:
+            return
+        with self.lock:
+            if time.time() - self.checked < GENERATION_CHECK:
+                return
+            from app.models import Publication
+            publication = Publication.current()
+            generation = publication.id if publication is not None else 0
+            if generation != self.generation:
+                self.load()
+                self.generation = generation
+            self.checked = time.time()
+
+    def search(self, query, limit=10):
+        ''' Up to limit (symbol, name, market) tuples matching query '''
+        query = query.strip().lower()
+        if not query:
+            return []
+        stocks = self.stocks
+        found = []
+        for length in self.lengths:
+            if length < len(query):
+                continue
+            keys, ids = self.symbols[length]
+            start, end = prefix_range(keys, query)
+            found.extend(ids[start:min(end, start + limit - len(found))])
+            if len(found) >= limit:
+                return [stocks[i] for i in found]
+        words = query_words(query)
+        if words:
+            seen = set(found)
+            for i in self._name_matches(words):
+                if i not in seen:
+                    seen.add(i)
+                    found.append(i)
+                    if len(found) >= limit:
+                        break
+        return [stocks[i] for i in found]
+
+    def _name_matches(self, words):
+        ''' The stocks with a word of their name for each of words, the
+        last one by prefix since it's still being typed, in order '''
+        keys, ids = self.word_keys, self.word_ids
+        start, end = prefix_range(keys, words[-1])
+        if len(words) == 1:
+            return (ids[j] for j in xrange(start, end))
+        candidates = None
+        for word in words[:-1]:
+            matched = set(ids[bisect.bisect_left(keys, word):
+                              bisect.bisect_right(keys, word)])
+            candidates = matched if candidates is None \
+                else candidates & matched
+        # reading the range is cheaper per stock than checking the words
+        # of each candidate, unless the range is much bigger
+        if end - start <= 10 * len(candidates):
+            return (ids[j] for j in xrange(start, end)
+                    if ids[j] in candidates)
+        last = words[-1]
+        ranked = []
+        for i in candidates:
+            prefixed = [word for word in self.words[i]
+                        if word.startswith(last)]
+            if prefixed:
+                ranked.append((min(prefixed), i))
+        return (i for word, i in sorted(ranked))
+
+def prefix_range(keys, prefix):
+    ''' The start and end of the keys that start with prefix '''
+    start = bisect.bisect_left(keys, prefix)
+    return start, bisect.bisect_left(keys, prefix + u'\uffff', start)
+
+symbol_index = SymbolIndex()
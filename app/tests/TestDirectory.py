@@ -0,0 +1,97 @@
+import unittest
+import datetime as dt
+import shutil
+import tempfile
+import tasks
+from mock import patch
+from sqlalchemy import event
+from app.directory import StockDirectory
+from app.providers import LocalProvider
+from app.models import Stock, StockPoint
+from app import app, db
+import StockFactory as SF
+
+class TestDirectory(unittest.TestCase):
+
+    def setUp(self):
+        db.create_all()
+        self.yesterday = dt.date.today() - dt.timedelta(days=1)
+        self.ids = []
+        for i in range(5):
+            stock = SF.build_stock('S%s' % i, 'Stock %s' % i)
+            stock._save_dataframe(SF.build_dataframe(
+                days=5, end_date=self.yesterday - dt.timedelta(days=i)))
+            self.ids.append(stock.id)
+        db.session.add(SF.build_stock('EMPTY', 'No points'))
+        db.session.commit()
+        self.statements = []
+        event.listen(db.engine, 'before_cursor_execute', self._record)
+
+    def tearDown(self):
+        event.remove(db.engine, 'before_cursor_execute', self._record)
+        db.session.remove()
+        db.drop_all()
+
+    def _record(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def test_load_has_ids_names_and_last_dates(self):
+        with patch('app.directory.LOAD_CHUNK', 2):
+            directory = StockDirectory().load(
+                ['s%s' % i for i in range(5)] + ['EMPTY', 'UNKNOWN'])
+        assert(len(self.statements) == 4)
+        assert(len(directory) == 6)
+        assert('s3' in directory and 'UNKNOWN' not in directory)
+        assert(directory.entries['S3'][:2] == (self.ids[3], 'Stock 3'))
+        assert(directory.last_date('S3') ==
+               self.yesterday - dt.timedelta(days=3))
+        assert(directory.last_date('EMPTY') is None)
+
+    def test_stock_is_attached_without_a_query(self):
+        directory = StockDirectory().load(['S1'])
+        db.session.expunge_all()
+        self.statements = []
+        stock = directory.stock('S1')
+        assert(self.statements == [])
+        assert(stock in db.session)
+        assert((stock.id, stock.symbol, stock.name) ==
+               (self.ids[1], 'S1', 'Stock 1'))
+        assert(directory.stock('S1') is stock)
+        # the rest loads when it's used
+        assert(len(stock.stockpoints) == 5)
+        assert(stock.active)
+
+    def test_run_shard_looks_the_stocks_up_once(self):
+        provider = tempfile.mkdtemp()
+        app.config['OHLC_PROVIDER'] = 'local'
+        app.config['OHLC_DIRECTORY'] = provider
+        symbols = [('S%s' % i, 'Stock %s' % i, 'NASDAQ') for i in range(5)] \
+            + [('NEW', 'New Listing', 'NASDAQ')]
+        source = SF.build_dataframe(days=10, end_date=self.yesterday)
+        for symbol, name, market in symbols:
+            LocalProvider(provider).save(symbol, source)
+        try:
+            self.statements = []
+            result = tasks.run_shard((0, symbols), calculate=False)
+        finally:
+            del app.config['OHLC_PROVIDER']
+            del app.config['OHLC_DIRECTORY']
+            shutil.rmtree(provider)
+        assert(result['errors'] == [])
+        lookups = [s for s in self.statements
+                   if 'FROM stock ' in s or 'FROM stock\n' in s]
+        # the directory, and the refresh of the new listing after its
+        # commit (sync_symbols would have created it before the run)
+        assert(len(lookups) == 2), lookups
+        assert(not [s for s in self.statements
+                    if s.startswith('SELECT count(*)') and 'stock.' in s])
+        # the new points of the old stocks (the sessions since their last
+        # ones) and all of the new one's
+        fetched = 0
+        for i in range(5):
+            date_range = Stock.missing_ohlc_range(
+                self.yesterday - dt.timedelta(days=i))
+            if date_range is not None:
+                fetched += len(source[date_range[0]:date_range[1]])
+        assert(StockPoint.query.count() == 5 * 5 + fetched + 10)
+        assert(Stock.query.filter(Stock.symbol == 'NEW').count() == 1)
@@ -0,0 +1,135 @@
+import unittest
+import datetime as dt
+import threading
+import time
+import urlparse
+import BaseHTTPServer
+import SocketServer
+import tasks
+from app.fetcher import OHLCFetcher, RETRIES
+from app.models import Stock, StockPoint
+from app import app, db
+
+CSV = '''Date,Open,High,Low,Close,Volume,Adj Close
+2014-12-01,10.5,11.0,10.0,10.8,1200,10.8
+2014-11-28,10.0,10.6,9.9,10.5,1100,10.5
+2014-11-27,9.8,10.1,9.7,10.0,1000,10.0
+'''
+
+class StandInServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    ''' Serves CSV for every symbol but MISSING (404) and ERR (500),
+    keeping track of the connections and requests it sees '''
+    daemon_threads = True
+
+    def __init__(self, delay=0):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), Handler)
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'   # keep-alive
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        query = urlparse.parse_qs(urlparse.urlparse(self.path).query)
+        symbol = query['s'][0]
+        with self.server.lock:
+            self.server.requests.append((time.time(), symbol))
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight,
+                                            self.server.in_flight)
+        time.sleep(self.server.delay)
+        with self.server.lock:
+            self.server.in_flight -= 1
+        status, body = {'MISSING': (404, ''), 'ERR': (500, '')}\
+            .get(symbol, (200, CSV))
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class TestFetcher(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StandInServer()
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  args=(0.05,))
+        thread.daemon = True
+        thread.start()
+        self.url = 'http://127.0.0.1:%s/table.csv' % self.server.server_port
+        self.start, self.end = dt.date(2014,11,1), dt.date(2014,12,1)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_fetch_parses_like_datareader(self):
+        df = OHLCFetcher(self.url).fetch('TSLA', self.start, self.end)
+        assert(df.index.name == 'Date')
+        assert(list(df.columns) == ['Open', 'High', 'Low', 'Close',
+                                    'Volume', 'Adj Close'])
+        assert(df.index[0].date() == dt.date(2014,11,27))
+        assert(df['Close'][-1] == 10.8)
+
+    def test_query_matches_datareader(self):
+        query = OHLCFetcher(self.url).query('TSLA', self.start, self.end)
+        assert(query == '/table.csv?s=TSLA&a=10&b=1&c=2014&d=11&e=1'
+                        '&f=2014&g=d&ignore=.csv')
+
+    def test_fetch_unknown_symbol(self):
+        assert(OHLCFetcher(self.url).fetch('MISSING', self.start,
+                                           self.end) is None)
+
+    def test_fetch_gives_up_after_retries(self):
+        self.assertRaises(IOError, OHLCFetcher(self.url).fetch, 'ERR',
+                          self.start, self.end)
+        assert(len(self.server.requests) == RETRIES)
+
+    def test_fetch_many_limits_in_flight_and_reuses_connections(self):
+        self.server.delay = 0.02
+        fetcher = OHLCFetcher(self.url, max_in_flight=3, host_rate=None)
+        jobs = [('S%s' % i, self.start, self.end) for i in range(12)] + \
+               [('MISSING', self.start, self.end)]
+        results = dict(fetcher.fetch_many(jobs))
+        assert(sorted(results) == sorted(jobs))
+        assert(results[('MISSING', self.start, self.end)] is None)
+        assert(len(results[('S0', self.start, self.end)]) == 3)
+        assert(self.server.max_in_flight <= 3)
+        assert(self.server.connections <= 3)
+
+    def test_fetch_many_rate_limits_the_host(self):
+        fetcher = OHLCFetcher(self.url, max_in_flight=4, host_rate=20)
+        list(fetcher.fetch_many([('S%s' % i, self.start, self.end)
+                                 for i in range(5)]))
+        times = sorted(t for t, symbol in self.server.requests)
+        assert(times[-1] - times[0] >= 4 / 20. - 0.01)
+
+    def test_fetch_many_returns_errors(self):
+        results = dict(OHLCFetcher(self.url).fetch_many(
+            [('ERR', self.start, self.end)]))
+        assert(isinstance(results[('ERR', self.start, self.end)], IOError))
+
+    def test_run_shard_saves_prefetched_points(self):
+        db.create_all()
+        app.config['OHLC_URL'] = self.url
+        try:
+            result = tasks.run_shard((0, [('TSLA', 'Tesla', 'NASDAQ'),
+                                          ('MISSING', 'None', 'NASDAQ')]),
+                                     calculate=False)
+            assert(result['errors'] == [])
+            assert(StockPoint.query.count() == 3)
+            assert(Stock.query.count() == 1)
+        finally:
+            del app.config['OHLC_URL']
+            db.drop_all()
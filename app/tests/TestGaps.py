@@ -0,0 +1,195 @@
+import unittest
+import datetime as dt
+import shutil
+import tempfile
+import tasks
+from mock import patch
+from sqlalchemy import event
+from app.gaps import GapPlan
+from app.providers import LocalProvider, CachedProvider
+from app.trading_calendar import trading_calendar
+from app.models import Stock, StockPoint, EmptyGap
+from app import app, db
+import StockFactory as SF
+
+HOLES = [dt.date(2014,11,10), dt.date(2014,11,11),   # a Monday and Tuesday
+         dt.date(2014,11,21), dt.date(2014,11,24)]   # a Friday and Monday
+
+class TestGaps(unittest.TestCase):
+
+    def setUp(self):
+        db.create_all()
+        self.source = SF.build_dataframe(days=30,
+                                         end_date=dt.date(2014,11,30))
+        sessions = [trading_calendar.is_session(day)
+                    for day in self.source.index.date]
+        # holes, and no Thanksgiving, which isn't one
+        holey = SF.build_stock('HOLEY', 'Holey')
+        holey._save_dataframe(self.source[[
+            session and day not in HOLES for session, day
+            in zip(sessions, self.source.index.date)]])
+        # weekend points don't matter
+        whole = SF.build_stock('WHOLE', 'Whole')
+        whole._save_dataframe(self.source)
+        single = SF.build_stock('SINGLE', 'Single')
+        single._save_dataframe(self.source[-1:])
+        self.ids = [holey.id, whole.id, single.id]
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+
+    def test_holes_are_one_range_each(self):
+        plan = GapPlan().load()
+        holey = self.ids[0]
+        assert(plan.ranges() == [(holey, dt.date(2014,11,10),
+                                  dt.date(2014,11,11)),
+                                 (holey, dt.date(2014,11,21),
+                                  dt.date(2014,11,24))])
+        assert(plan.sessions.tolist() == [2, 2])
+        assert(len(GapPlan().load(self.ids[1:])) == 0)
+
+    def test_inactive_stocks_are_left_out(self):
+        Stock.query.get(self.ids[0]).active = False
+        db.session.commit()
+        assert(len(GapPlan().load()) == 0)
+
+    def test_empty_gaps_are_left_out(self):
+        holey = self.ids[0]
+        db.session.add(EmptyGap(holey, dt.date(2014,11,7),
+                                dt.date(2014,11,12)))
+        db.session.commit()
+        assert(GapPlan().load().ranges() ==
+               [(holey, dt.date(2014,11,21), dt.date(2014,11,24))])
+
+    def test_empty_gaps_inside_others(self):
+        holey = self.ids[0]
+        for start, end in [(dt.date(2014,11,1), dt.date(2014,11,25)),
+                           (dt.date(2014,11,20), dt.date(2014,11,21))]:
+            db.session.add(EmptyGap(holey, start, end))
+        db.session.commit()
+        assert(len(GapPlan().load()) == 0)
+
+    @patch('app.models.today')
+    def test_empty_gaps_expire(self, today):
+        today.return_value = dt.date(2014,12,1)
+        holey = self.ids[0]
+        db.session.add(EmptyGap(holey, dt.date(2014,11,7),
+                                dt.date(2014,11,12),
+                                checked_on=EmptyGap.cutoff() -
+                                dt.timedelta(days=1)))
+        db.session.add(EmptyGap(holey, dt.date(2014,11,21),
+                                dt.date(2014,11,24)))
+        db.session.commit()
+        assert(GapPlan().load().ranges() ==
+               [(holey, dt.date(2014,11,10), dt.date(2014,11,11))])
+        assert(EmptyGap.prune() == 1)
+        db.session.commit()
+        assert([gap.start_date for gap in EmptyGap.query] ==
+               [dt.date(2014,11,21)])
+
+    def test_only_pairs_with_days_between_come_back(self):
+        holey = self.ids[0]
+        # Thanksgiving, then weekends, which the calendar throws out
+        pairs = GapPlan()._holes([holey])
+        assert([(stock_id, previous.astype(dt.date), date.astype(dt.date))
+                for stock_id, previous, date in zip(*pairs)] ==
+               [(holey, dt.date(2014,11,7), dt.date(2014,11,12)),
+                (holey, dt.date(2014,11,20), dt.date(2014,11,25)),
+                (holey, dt.date(2014,11,26), dt.date(2014,11,28))])
+
+    def test_one_query(self):
+        statements = []
+        def record(conn, cursor, statement, parameters, *args):
+            statements.append((statement, parameters))
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            GapPlan().load()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        # the holes, then the empty gaps
+        assert(len(statements) == 2)
+        statement, parameters = statements[0]
+        assert('lag(' in statement.lower())
+        plan = ' '.join(str(row) for row in db.engine.execute(
+            'EXPLAIN QUERY PLAN ' + statement, parameters))
+        assert('COVERING INDEX ix_stock_point_stock_id_date' in plan), plan
+        assert('TEMP B-TREE' not in plan), plan
+
+    @patch('app.gaps.today')
+    def test_report(self, today):
+        today.return_value = dt.date(2014,12,1)
+        history = trading_calendar.sessions_between(
+            dt.date(2014,12,1) - dt.timedelta(days=Stock.LOOKBACK_DAYS),
+            dt.date(2014,12,1))
+        assert(GapPlan().load().report() ==
+               {'stocks': 1, 'requests': 2, 'rows': 4, 'daily_requests': 4,
+                'refetch_requests': 1, 'refetch_rows': history})
+
+    @patch('tasks.calculate_indicators')
+    def test_repair_gaps_fetches_only_the_holes(self, calculate_indicators):
+        provider = tempfile.mkdtemp()
+        app.config['OHLC_PROVIDER'] = 'local'
+        app.config['OHLC_DIRECTORY'] = provider
+        cache = tempfile.mkdtemp()
+        app.config['OHLC_CACHE'] = cache
+        for symbol in ['HOLEY', 'WHOLE', 'SINGLE']:
+            LocalProvider(provider).save(symbol, self.source)
+        try:
+            with patch.object(LocalProvider, 'fetch_many',
+                              wraps=LocalProvider(provider).fetch_many) \
+                    as fetch_many, \
+                    patch.object(CachedProvider, 'fetch_many') as cached:
+                report = tasks.repair_gaps()
+        finally:
+            del app.config['OHLC_PROVIDER']
+            del app.config['OHLC_DIRECTORY']
+            del app.config['OHLC_CACHE']
+            shutil.rmtree(provider)
+            shutil.rmtree(cache)
+        # the cache would give the holes back
+        assert(not cached.called)
+        assert(sorted(fetch_many.call_args[0][0]) ==
+               [('HOLEY', dt.date(2014,11,10), dt.date(2014,11,11)),
+                ('HOLEY', dt.date(2014,11,21), dt.date(2014,11,24))])
+        # whatever the provider has in the ranges is saved, which for the
+        # test data includes the weekend in the second one
+        assert(report['saved'] == 6)
+        assert(sorted(date for date, in db.session.query(StockPoint.date)
+                      .filter(StockPoint.stock_id == self.ids[0])
+                      .filter(StockPoint.date.in_(HOLES))) == HOLES)
+        assert(len(GapPlan().load()) == 0)
+        assert(calculate_indicators.called)
+
+    @patch('tasks.calculate_indicators')
+    def test_repair_gaps_counts_what_was_saved(self, calculate_indicators):
+        holey = self.ids[0]
+        provider = tempfile.mkdtemp()
+        app.config['OHLC_PROVIDER'] = 'local'
+        app.config['OHLC_DIRECTORY'] = provider
+        # nothing for the first hole, and a bad close in the second
+        source = self.source.drop([dt.date(2014,11,10), dt.date(2014,11,11)])
+        source.loc[dt.date(2014,11,21), 'Close'] = float('nan')
+        LocalProvider(provider).save('HOLEY', source)
+        try:
+            report = tasks.repair_gaps()
+        finally:
+            del app.config['OHLC_PROVIDER']
+            del app.config['OHLC_DIRECTORY']
+            shutil.rmtree(provider)
+        assert((report['saved'], report['empty']) == (3, 1))
+        assert([(gap.stock_id, gap.start_date, gap.end_date)
+                for gap in EmptyGap.query] ==
+               [(holey, dt.date(2014,11,10), dt.date(2014,11,11))])
+        assert(GapPlan().load().ranges() ==
+               [(holey, dt.date(2014,11,21), dt.date(2014,11,21))])
+
+    @patch('tasks.get_provider')
+    @patch('tasks.calculate_indicators')
+    def test_nothing_to_repair(self, calculate_indicators, get_provider):
+        StockPoint.query.filter(StockPoint.stock_id == self.ids[0]).delete()
+        db.session.commit()
+        report = tasks.repair_gaps()
+        assert((report['requests'], report['saved']) == (0, 0))
+        assert(not get_provider.called)
+        assert(not calculate_indicators.called)
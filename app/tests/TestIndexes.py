@@ -0,0 +1,87 @@
+import unittest
+import datetime as dt
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from app.models import Stock, StockPoint, Signal, RSISignal
+from app import app, db
+import StockFactory as SF
+
+class TestIndexes(unittest.TestCase):
+    ''' Checks the query plans SQLite picks for the hot queries, by
+    running EXPLAIN QUERY PLAN on the statements they really send '''
+
+    def setUp(self):
+        db.create_all()
+        self.stock = SF.build_stock()
+        self.stock._save_dataframe(SF.build_dataframe(days=30))
+        signal = RSISignal(SF.build_dataframe(values={'RSI': [20., 40.]}))
+        signal.is_buy_signal = True
+        signal.expiration_date = dt.date.today() + dt.timedelta(days=1)
+        signal.weight = 0.5
+        self.stock.signals.append(signal)
+        db.session.commit()
+        self.statements = []
+        event.listen(db.engine, 'before_cursor_execute', self._record)
+
+    def tearDown(self):
+        event.remove(db.engine, 'before_cursor_execute', self._record)
+        db.session.remove()
+        db.drop_all()
+
+    def _record(self, conn, cursor, statement, parameters, context,
+                executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            self.statements.append((statement, parameters))
+
+    def plans(self, table):
+        ''' The plan of each statement recorded that selects from table,
+        as one string '''
+        plans = [' | '.join(list(row)[-1] for row in
+                            db.engine.execute('EXPLAIN QUERY PLAN ' +
+                                              statement, parameters)
+                            .fetchall())
+                 for statement, parameters in self.statements
+                 if 'FROM %s' % table in statement]
+        self.statements = []
+        return plans
+
+    def test_loading_points_searches_the_stock_point_index(self):
+        self.stock.load_dataframe_from_db(limit=10)
+        self.stock.load_dataframe_from_db(start_date=dt.date.today())
+        plans = self.plans('stock_point')
+        assert(len(plans) == 4)
+        for plan in plans:
+            assert('USING COVERING INDEX ix_stock_point_stock_id_date' in plan
+                   or 'USING INDEX ix_stock_point_stock_id_date' in plan), plan
+            assert('TEMP B-TREE' not in plan), plan
+            assert('SCAN' not in plan), plan
+
+    def test_screener_is_covered_by_the_signal_index(self):
+        assert(len(Stock.find_buy_stocks()) == 0)
+        Stock.find_sell_stocks()
+        plans = self.plans('stock, signal')
+        assert(len(plans) == 2)
+        for plan in plans:
+            assert('USING COVERING INDEX ix_signal_screen' in plan), plan
+
+    def test_signals_of_a_stock_search_their_index(self):
+        db.session.expire_all()
+        self.stock.signals
+        plan, = self.plans('signal')
+        assert('ix_signal_stock_id_expiration_date' in plan), plan
+        assert('SCAN' not in plan), plan
+
+    def test_stock_lookup_searches_the_symbol_index(self):
+        Stock.query.filter(Stock.symbol == 'TSLA',
+                           Stock.market == 'NASDAQ').first()
+        plan, = self.plans('stock')
+        assert('USING INDEX ix_stock_symbol_market' in plan), plan
+
+    def test_a_point_is_only_saved_once(self):
+        self.stock._save_dataframe(SF.build_dataframe(days=2))
+        assert(StockPoint.query.count() == 30)
+
+    def test_a_stock_is_only_saved_once(self):
+        db.session.add(SF.build_stock())
+        self.assertRaises(IntegrityError, db.session.commit)
+        db.session.rollback()
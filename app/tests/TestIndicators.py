@@ -2,9 +2,10 @@ import unittest
 import datetime as dt
 from app.models import Stock, StockPoint, Signal, RSI, RSISignal, MACD
 from app.models import MACDSignalCross, MACDCenterCross, SMA50PriceCross
-from app.models import SMA200PriceCross, FiftyTwoWeekSignal
+from app.models import SMA200PriceCross, FiftyTwoWeekSignal, SMA, FiftyTwoWeek
+from app.models import ewma_resume
 from app import db
-from pandas import DataFrame, DatetimeIndex, isnull
+from pandas import DataFrame, DatetimeIndex, isnull, ewma
 from decimal import Decimal
 import StockFactory as SF
     
@@ -225,6 +226,27 @@ class TestRSI(unittest.TestCase):
         self.assertAlmostEqual(self.df['RSI'][14], 69.46, 2)
         self.assertAlmostEqual(self.df['RSI'][16], 58.18, 2)
 
+    def test_RSI_matches_row_by_row_smoothing(self):
+        ''' The vectorized averages should match the running
+        (prev * 13 + current) / 14 calculation over a long history. '''
+        closes = [50 + ((x * 7) % 11) - ((x * 3) % 5) * .5 for x in range(300)]
+        df = RSI(SF.build_dataframe(values={'Adj Close': closes})).calculate()
+        avg_gain = sum(max(closes[i] - closes[i-1], 0) for i in range(1, 15)) / 14.
+        avg_loss = sum(max(closes[i-1] - closes[i], 0) for i in range(1, 15)) / 14.
+        for i in range(15, len(closes)):
+            avg_gain = (avg_gain * 13 + max(closes[i] - closes[i-1], 0)) / 14
+            avg_loss = (avg_loss * 13 + max(closes[i-1] - closes[i], 0)) / 14
+            expected = 100 - (100 / (1 + avg_gain / avg_loss))
+            self.assertAlmostEqual(df['RSI'][i], expected, 8)
+
+    def test_RSI_with_too_little_data(self):
+        df = RSI(SF.build_dataframe(values={'Adj Close': [1, 2, 3]})).calculate()
+        assert(isnull(df['RSI']).all())
+
+    def test_RSI_with_no_losses_is_100(self):
+        df = RSI(SF.build_dataframe(values={'Adj Close': range(1, 21)})).calculate()
+        assert(df['RSI'][-1] == 100)
+
 class TestRSISignal(unittest.TestCase):
     
     def setUp(self):
@@ -256,3 +278,49 @@ class TestRSISignal(unittest.TestCase):
         signal = RSISignal(df)
         signal.evaluate()
         assert(signal.is_buy_signal == None)
+
+class TestIndicatorResume(unittest.TestCase):
+    ''' Calculating the last points from the state saved at the end of
+    the earlier ones should give the same values as calculating over
+    the whole history. '''
+
+    def setUp(self):
+        closes = [30 + (x % 23) * .4 - (x % 7) * .9 for x in range(420)]
+        self.df = SF.build_dataframe(values={'Adj Close': closes,
+                                             'Adj High': [c + 1 for c in closes],
+                                             'Adj Low': [c - 1 for c in closes]})
+
+    def assert_resumes(self, build, col):
+        full = build(self.df.copy()).calculate()
+        head = build(self.df[:400].copy())
+        head.calculate()
+        tail = build(self.df[400:].copy())
+        tail.resume(head.state())
+        for i in range(20):
+            self.assertAlmostEqual(tail.df[col][i], full[col][400 + i], 8)
+
+    def test_ewma_resume(self):
+        values = [float(x % 9) for x in range(60)]
+        full = ewma(DataFrame({'v': values})['v'], span=12)
+        resumed = ewma_resume(values[40:], 12, full[39], 40)
+        for i in range(20):
+            self.assertAlmostEqual(resumed[i], full[40 + i], 10)
+
+    def test_RSI_resumes(self):
+        self.assert_resumes(RSI, 'RSI')
+
+    def test_MACD_resumes(self):
+        self.assert_resumes(MACD, 'MACD')
+        self.assert_resumes(MACD, 'MACD-Signal')
+
+    def test_SMA_resumes(self):
+        self.assert_resumes(lambda df: SMA(df, 200), 'SMA-200')
+
+    def test_52_week_resumes(self):
+        self.assert_resumes(lambda df: FiftyTwoWeek(df, 'High'), '52-Week-High')
+        self.assert_resumes(lambda df: FiftyTwoWeek(df, 'Low'), '52-Week-Low')
+
+    def test_RSI_has_no_state_without_averages(self):
+        rsi = RSI(self.df[:10].copy())
+        rsi.calculate()
+        assert(rsi.state() is None)
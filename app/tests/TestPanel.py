@@ -0,0 +1,275 @@
+import unittest
+import datetime as dt
+import numpy as np
+from mock import patch
+from app.models import Stock, StockPoint, Signal, IndicatorState
+from app.models import fetch_arrays
+from app.panel import IndicatorPanel, calculate_indicators, WARMUP_DAYS
+from app import app, db
+import StockFactory as SF
+
+class TestIndicatorPanel(unittest.TestCase):
+
+    def setUp(self):
+        db.create_all()
+        self.stocks = []
+
+    def tearDown(self):
+        db.drop_all()
+
+    def _save_stock(self, symbol, closes, end_date=dt.date(2014,12,1)):
+        stock = SF.build_stock(symbol=symbol)
+        stock._save_dataframe(SF.build_dataframe(
+            values={'Adj Close': closes, 'Close': [c * 2 for c in closes],
+                    'High': [c * 2 + 1 for c in closes]},
+            end_date=end_date))
+        self.stocks.append(stock)
+        return stock
+
+    def _save_random_stocks(self):
+        random = np.random.RandomState(0)
+        for i, days in enumerate([450, 220, 30, 12]):
+            self._save_stock('R%s' % i,
+                             list(50 + random.randn(days).cumsum()))
+
+    def _indicators(self):
+        ''' Each stock's loaded points, by symbol '''
+        return dict((stock.symbol, stock.load_dataframe_from_db())
+                    for stock in Stock.query.all())
+
+    def assertSameIndicators(self, left, right):
+        assert(sorted(left) == sorted(right))
+        for symbol in left:
+            for col in left[symbol].columns:
+                x = left[symbol][col].values.astype(float)
+                y = right[symbol][col].values.astype(float)
+                assert((np.isnan(x) == np.isnan(y)).all()), (symbol, col)
+                assert(np.allclose(x[~np.isnan(x)], y[~np.isnan(y)])), \
+                    (symbol, col)
+
+    def test_panel_matches_calculate_indicators(self):
+        ''' Stocks of different lengths in one panel get the same
+        indicators as they do one at a time '''
+        self._save_random_stocks()
+        summary = calculate_indicators(incremental=False)
+        assert(summary['stocks'] == 4)
+        assert(summary['points'] == 450 + 220 + 30 + 12)
+        assert(summary['bytes_per_1000'] > 0)
+        panel = self._indicators()
+        for stock in Stock.query.all():
+            stock.calculate_indicators()
+        self.assertSameIndicators(panel, self._indicators())
+
+    def test_incremental_panel_only_writes_pending_points(self):
+        self._save_random_stocks()
+        calculate_indicators(incremental=False)
+        before = self._indicators()
+        stock = self.stocks[0]
+        stock._save_dataframe(SF.build_dataframe(
+            values={'Adj Close': [60., 61.], 'Close': [120., 122.]},
+            end_date=dt.date(2014,12,3)))
+        summary = calculate_indicators()
+        assert(summary['stocks'] == 1)
+        assert(summary['points'] == 2)
+        after = self._indicators()
+        for symbol in before:
+            assert(after[symbol][:len(before[symbol])]
+                   .equals(before[symbol]))
+        # the same warm-up window as an incremental run without states
+        panel = after['R0']
+        StockPoint.query.filter(StockPoint.stock_id == stock.id)\
+            .filter(StockPoint.date > dt.date(2014,12,1))\
+            .update({'macd': None})
+        db.session.commit()
+        stock.calculate_indicators(incremental=True)
+        assert(np.allclose(panel.values.astype(float)[-2:],
+            stock.load_dataframe_from_db().values.astype(float)[-2:]))
+
+    def test_incremental_panel_with_nothing_pending(self):
+        self._save_random_stocks()
+        calculate_indicators(incremental=False)
+        summary = calculate_indicators()
+        assert(summary['stocks'] == 0)
+        assert(summary['skipped'] == 4)
+        assert(summary['points'] == 0)
+
+    def test_saving_points_marks_the_stock_pending(self):
+        self._save_random_stocks()
+        assert(Stock.query.filter(Stock.pending_since != None).count() == 4)
+        calculate_indicators(incremental=False)
+        assert(Stock.query.filter(Stock.pending_since != None).count() == 0)
+        stock = self.stocks[1]
+        stock._save_dataframe(SF.build_dataframe(
+            days=1, end_date=dt.date(2014,12,5)))
+        # an older point (a repaired gap) moves the date back
+        StockPoint.query.filter(StockPoint.stock_id == stock.id)\
+            .filter(StockPoint.date == dt.date(2014,11,20)).delete()
+        db.session.commit()
+        stock._save_dataframe(SF.build_dataframe(
+            days=1, end_date=dt.date(2014,11,20)))
+        stock._save_dataframe(SF.build_dataframe(
+            days=1, end_date=dt.date(2014,12,6)))
+        assert(Stock.query.get(stock.id).pending_since == dt.date(2014,11,20))
+        summary = calculate_indicators()
+        assert((summary['stocks'], summary['skipped']) == (1, 3))
+        # everything from the repaired point on
+        assert(summary['points'] == 12 + 2), summary
+        assert(Stock.query.get(stock.id).pending_since is None)
+
+    def test_each_stock_loads_its_own_warm_up(self):
+        ''' A stock pending from far back doesn't make the rest of its
+        batch load that far back too '''
+        random = np.random.RandomState(0)
+        old = self._save_stock('OLD', list(50 + random.randn(1500).cumsum()))
+        new = self._save_stock('NEW', list(50 + random.randn(1500).cumsum()))
+        calculate_indicators(incremental=False)
+        repaired = dt.date(2011,1,5)
+        StockPoint.query.filter(StockPoint.stock_id == old.id)\
+            .filter(StockPoint.date == repaired).delete()
+        db.session.commit()
+        old._save_dataframe(SF.build_dataframe(days=1, end_date=repaired))
+        new._save_dataframe(SF.build_dataframe(days=1,
+                                               end_date=dt.date(2014,12,2)))
+        loaded = []
+        def fetch(*args):
+            arrays = fetch_arrays(*args)
+            loaded.append(arrays[0])
+            return arrays
+        with patch('app.panel.fetch_arrays', side_effect=fetch):
+            summary = calculate_indicators()
+        assert(summary['stocks'] == 2)
+        # the old one's warm-up goes back past its first point
+        assert((loaded[0] == old.id).sum() == 1500)
+        assert((loaded[0] == new.id).sum() <= WARMUP_DAYS + 32)
+
+    def _save_meanwhile(self, stock, end_date):
+        ''' Saves a point the way another run would while a calculation
+        is going, in its transaction but without committing it '''
+        df = SF.build_dataframe(days=1, end_date=end_date)
+        stock._insert_points(stock._valid_points(df))
+        stock._mark_pending(end_date)
+
+    def test_points_saved_meanwhile_stay_pending(self):
+        self._save_random_stocks()
+        calculate_indicators(incremental=False)
+        later, repaired = self.stocks[0], self.stocks[1]
+        StockPoint.query.filter(StockPoint.stock_id == repaired.id)\
+            .filter(StockPoint.date == dt.date(2014,11,20))\
+            .delete(synchronize_session=False)
+        for stock in (later, repaired):
+            stock._save_dataframe(SF.build_dataframe(
+                days=1, end_date=dt.date(2014,12,2)))
+        calculate = IndicatorPanel.calculate
+        def calculate_meanwhile(panel):
+            self._save_meanwhile(later, dt.date(2014,12,3))
+            self._save_meanwhile(repaired, dt.date(2014,11,20))
+            calculate(panel)
+        with patch.object(IndicatorPanel, 'calculate', autospec=True,
+                          side_effect=calculate_meanwhile):
+            assert(calculate_indicators()['stocks'] == 2)
+        assert(Stock.query.get(later.id).pending_since ==
+               dt.date(2014,12,3))
+        assert(Stock.query.get(repaired.id).pending_since ==
+               dt.date(2014,11,20))
+        summary = calculate_indicators()
+        assert((summary['stocks'], summary['points']) == (2, 1 + 13))
+        assert(Stock.query.filter(Stock.pending_since != None).count() == 0)
+
+    def test_stock_keeps_points_saved_meanwhile_pending(self):
+        stock = self._save_stock('R0', [50. + x % 7 for x in range(40)])
+        calculate = Stock._calculate_indicators
+        def calculate_meanwhile(self_, df):
+            self._save_meanwhile(stock, dt.date(2014,12,2))
+            return calculate(self_, df)
+        with patch.object(Stock, '_calculate_indicators', autospec=True,
+                          side_effect=calculate_meanwhile):
+            stock.calculate_indicators(incremental=True)
+        assert(Stock.query.get(stock.id).pending_since == dt.date(2014,12,2))
+        stock.calculate_indicators(incremental=True)
+        assert(Stock.query.get(stock.id).pending_since is None)
+
+    def test_unmarked_stocks_are_skipped(self):
+        ''' Only the pending date decides what's calculated, not a scan
+        for points without indicators '''
+        self._save_random_stocks()
+        Stock.query.filter(Stock.id != self.stocks[0].id)\
+            .update({'pending_since': None}, synchronize_session=False)
+        db.session.commit()
+        summary = calculate_indicators()
+        assert((summary['stocks'], summary['skipped']) == (1, 3))
+        assert(summary['points'] == 450)
+
+    def test_failed_batch_stays_pending(self):
+        self._save_random_stocks()
+        with patch('app.panel.IndicatorPanel.save',
+                   side_effect=ValueError('disk full')):
+            summary = calculate_indicators()
+        assert(summary['stocks'] == 0)
+        assert(Stock.query.filter(Stock.pending_since != None).count() == 4)
+
+    def _states(self):
+        ''' Each stock's indicator states, by symbol '''
+        return dict((stock.symbol, dict(
+            (state.indicator, (state.last_date, state.values))
+            for state in IndicatorState.query.filter(
+                IndicatorState.stock_id == stock.id)))
+            for stock in Stock.query.all())
+
+    def assertSameStates(self, left, right):
+        assert(sorted(left) == sorted(right))
+        for symbol in left:
+            assert(sorted(left[symbol]) == sorted(right[symbol])), symbol
+            for name, (last_date, values) in left[symbol].items():
+                other_date, other = right[symbol][name]
+                assert(last_date == other_date), (symbol, name)
+                assert(sorted(values) == sorted(other)), (symbol, name)
+                for key in values:
+                    assert(np.allclose(values[key], other[key])), \
+                        (symbol, name, key)
+
+    def test_panel_saves_indicator_states(self):
+        ''' The same states as calculate_indicators saves, and none for
+        the stock too short for RSI '''
+        self._save_random_stocks()
+        calculate_indicators(incremental=False)
+        panel = self._states()
+        assert(panel['R3'] == {})
+        for stock in Stock.query.all():
+            stock.calculate_indicators()
+        self.assertSameStates(panel, self._states())
+
+    def test_stock_carries_on_from_the_panel_states(self):
+        self._save_random_stocks()
+        calculate_indicators(incremental=False)
+        stock = self.stocks[1]
+        stock._save_dataframe(SF.build_dataframe(
+            values={'Adj Close': [60., 61.], 'Close': [120., 122.]},
+            end_date=dt.date(2014,12,3)))
+        with patch.object(Stock, '_calculate_indicators') as calculate:
+            stock.calculate_indicators(incremental=True)
+        assert(not calculate.called)
+        resumed = stock.load_dataframe_from_db()[-2:]
+        stock.calculate_indicators()
+        self.assertSameIndicators(
+            {stock.symbol: resumed},
+            {stock.symbol: stock.load_dataframe_from_db()[-2:]})
+
+    def test_panel_signals_match_calculate_indicators(self):
+        ''' A long slide then a jump on the last day fires the same
+        signals either way. A stock with nothing crossing doesn't make it
+        past the screen. '''
+        self._save_stock('JUMP', [100. - x for x in range(60)] + [200.])
+        self._save_stock('RISE', [10. + x for x in range(60)])
+        panel = IndicatorPanel([stock.id for stock in self.stocks])
+        panel.calculate()
+        assert(list(panel.screen()) == [True, False])
+        summary = calculate_indicators(incremental=False)
+        fired = sorted((s.stock_id, s.signal_type, s.is_buy_signal)
+                       for s in Signal.query.all())
+        assert(summary['signals'] == len(fired) > 0)
+        Signal.query.delete()
+        db.session.commit()
+        for stock in Stock.query.all():
+            stock.calculate_indicators()
+        assert(fired == sorted((s.stock_id, s.signal_type, s.is_buy_signal)
+                               for s in Signal.query.all()))
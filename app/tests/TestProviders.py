@@ -0,0 +1,241 @@
+import unittest
+import datetime as dt
+import shutil
+import tempfile
+import os
+import time
+import tasks
+from mock import patch
+from app.providers import Provider, LocalProvider, YahooProvider, \
+    CachedProvider, CACHE_COUNTERS, get_provider
+from app.models import Stock, StockPoint
+from app import app, db
+import StockFactory as SF
+
+CSV = '''Date,Open,High,Low,Close,Volume,Adj Close
+2014-12-01,10.5,11.0,10.0,10.8,1200,10.8
+2014-11-28,10.0,10.6,9.9,10.5,1100,10.5
+2014-11-27,9.8,10.1,9.7,10.0,1000,10.0
+'''
+
+class TestLocalProvider(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.provider = LocalProvider(self.directory)
+        self.df = SF.build_dataframe(values={'Close': range(1, 11)},
+                                     end_date=dt.date(2014,12,1))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_save_and_fetch_npy(self):
+        self.provider.save('TSLA', self.df)
+        df = self.provider.fetch('TSLA', self.df.index[2].date(),
+                                 self.df.index[6].date())
+        assert(list(df.columns) == ['Open', 'High', 'Low', 'Close',
+                                    'Volume', 'Adj Close'])
+        assert(df.index.name == 'Date')
+        assert((df.index == self.df.index[2:7]).all())
+        assert(list(df['Close']) == range(3, 8))
+
+    def test_fetch_csv(self):
+        with open(self.provider.path('TSLA', 'csv'), 'w') as f:
+            f.write(CSV)
+        df = self.provider.fetch('TSLA', dt.date(2014,11,28),
+                                 dt.date(2014,12,31))
+        assert(list(df['Close']) == [10.5, 10.8])
+
+    def test_fetch_unknown_symbol(self):
+        assert(self.provider.fetch('MISSING', dt.date(2014,11,1),
+                                   dt.date(2014,12,1)) is None)
+
+    def test_fetch_many(self):
+        self.provider.save('TSLA', self.df)
+        jobs = [('TSLA', dt.date(2014,1,1), dt.date(2014,12,1)),
+                ('MISSING', dt.date(2014,1,1), dt.date(2014,12,1))]
+        results = dict(self.provider.fetch_many(jobs))
+        assert(len(results[jobs[0]]) == 10)
+        assert(results[jobs[1]] is None)
+
+    def test_a_provider_has_to_fetch(self):
+        class NoFetch(Provider):
+            pass
+        self.assertRaises(TypeError, NoFetch)
+
+    def test_get_provider_reads_the_settings(self):
+        assert(isinstance(get_provider(), YahooProvider))
+        app.config['OHLC_PROVIDER'] = 'local'
+        app.config['OHLC_DIRECTORY'] = self.directory
+        try:
+            provider = get_provider()
+            assert(isinstance(provider, LocalProvider))
+            assert(provider.directory == self.directory)
+        finally:
+            del app.config['OHLC_PROVIDER']
+            del app.config['OHLC_DIRECTORY']
+
+    def test_run_shard_replays_local_points(self):
+        db.create_all()
+        self.provider.save('TSLA', SF.build_dataframe(
+            end_date=dt.date.today() - dt.timedelta(days=1)))
+        app.config['OHLC_PROVIDER'] = 'local'
+        app.config['OHLC_DIRECTORY'] = self.directory
+        try:
+            result = tasks.run_shard((0, [('TSLA', 'Tesla', 'NASDAQ'),
+                                          ('MISSING', 'None', 'NASDAQ')]),
+                                     calculate=False)
+            assert(result['errors'] == [])
+            assert(Stock.query.count() == 1)
+            assert(StockPoint.query.count() > 0)
+        finally:
+            del app.config['OHLC_PROVIDER']
+            del app.config['OHLC_DIRECTORY']
+            db.drop_all()
+
+class TestCachedProvider(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source = LocalProvider(os.path.join(self.directory, 'source'))
+        os.mkdir(self.source.directory)
+        self.end = dt.date(2014,12,1)
+        self.source.save('TSLA', SF.build_dataframe(
+            days=30, values={'Close': range(30)}, end_date=self.end))
+        self.cache = CachedProvider(self.source,
+                                    os.path.join(self.directory, 'cache'))
+        self.counters = dict(CACHE_COUNTERS)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def day(self, days_before_end):
+        return self.end - dt.timedelta(days=days_before_end)
+
+    def counted(self):
+        return dict((key, CACHE_COUNTERS[key] - self.counters[key])
+                    for key in CACHE_COUNTERS)
+
+    def files(self, symbol='TSLA'):
+        return sorted(os.listdir(self.cache.folder(symbol)))
+
+    @patch.object(LocalProvider, 'fetch', autospec=True,
+                  side_effect=LocalProvider.fetch)
+    def test_second_fetch_is_a_hit(self, fetch):
+        first = self.cache.fetch('TSLA', self.day(20), self.day(10))
+        second = self.cache.fetch('TSLA', self.day(18), self.day(12))
+        assert(fetch.call_count == 1)
+        assert(list(second['Close']) == list(first['Close'][2:9]))
+        assert(self.counted() == {'hits': 1, 'partial': 0, 'misses': 1})
+
+    @patch.object(LocalProvider, 'fetch', autospec=True,
+                  side_effect=LocalProvider.fetch)
+    def test_overlapping_ranges_merge(self, fetch):
+        self.cache.fetch('TSLA', self.day(20), self.day(10))
+        df = self.cache.fetch('TSLA', self.day(15), self.day(5))
+        # only the days past what was cached get fetched
+        assert(fetch.call_args[0][1:] == ('TSLA', self.day(9), self.day(5)))
+        assert(list(df['Close']) == range(14, 25))
+        assert(self.files() == ['20141111_20141126.npy'])
+        self.cache.fetch('TSLA', self.day(20), self.day(5))
+        assert(self.counted() == {'hits': 1, 'partial': 1, 'misses': 1})
+
+    @patch.object(LocalProvider, 'fetch', autospec=True,
+                  side_effect=LocalProvider.fetch)
+    def test_days_not_published_yet_are_fetched_again(self, fetch):
+        self.cache.fetch('TSLA', self.day(10), self.end + dt.timedelta(5))
+        assert(self.files() == ['20141121_20141201.npy'])
+        self.cache.fetch('TSLA', self.day(10), self.end + dt.timedelta(5))
+        assert(fetch.call_args[0][1:] == ('TSLA', self.end + dt.timedelta(1),
+                                          self.end + dt.timedelta(5)))
+
+    def test_gaps_that_failed_are_not_cached(self):
+        self.cache.fetch('TSLA', self.day(20), self.day(15))
+        self.cache.fetch('TSLA', self.day(5), self.end)
+        fetch = self.source.fetch
+        def nothing_in_the_middle(symbol, start_date, end_date):
+            if start_date == self.day(14):
+                return None
+            return fetch(symbol, start_date, end_date)
+        with patch.object(self.source, 'fetch',
+                          side_effect=nothing_in_the_middle):
+            df = self.cache.fetch('TSLA', self.day(25), self.end)
+        assert(len(df) == 6 + 11)
+        # the days before got cached, the failed ones didn't
+        assert(self.files() == ['20141106_20141116.npy',
+                                '20141126_20141201.npy'])
+        with patch.object(self.source, 'fetch', wraps=fetch) as again:
+            df = self.cache.fetch('TSLA', self.day(25), self.end)
+        assert(again.call_args[0] == ('TSLA', self.day(14), self.day(6)))
+        assert(len(df) == 26)
+        assert(self.files() == ['20141106_20141201.npy'])
+
+    def test_unknown_symbols_are_not_cached(self):
+        assert(self.cache.fetch('MISSING', self.day(10), self.end) is None)
+        assert(not os.path.exists(self.cache.folder('MISSING')))
+
+    @patch.object(LocalProvider, 'fetch', autospec=True,
+                  side_effect=LocalProvider.fetch)
+    def test_expired_ranges_are_fetched_again(self, fetch):
+        self.cache.fetch('TSLA', self.day(10), self.end)
+        self.cache.ttl = 60
+        path = os.path.join(self.cache.folder('TSLA'), self.files()[0])
+        os.utime(path, (time.time(), time.time() - 61))
+        self.cache.fetch('TSLA', self.day(10), self.end)
+        assert(fetch.call_count == 2)
+        assert(len(self.files()) == 1)
+
+    def test_least_recently_used_ranges_are_evicted(self):
+        for symbol in ['A', 'B']:
+            self.source.save(symbol, SF.build_dataframe(days=30,
+                                                        end_date=self.end))
+        self.cache.fetch('TSLA', self.day(10), self.end)
+        size = CachedProvider.sizes[self.cache.directory]
+        self.cache.max_bytes = size * 5 // 2
+        self.cache.fetch('A', self.day(10), self.end)
+        path = os.path.join(self.cache.folder('TSLA'), self.files()[0])
+        os.utime(path, (time.time() - 60, os.path.getmtime(path)))
+        self.cache.fetch('TSLA', self.day(10), self.end)    # used again
+        os.utime(os.path.join(self.cache.folder('A'), self.files('A')[0]),
+                 (time.time() - 30, time.time()))
+        self.cache.fetch('B', self.day(10), self.end)
+        assert(self.files() and self.files('B'))
+        assert(self.files('A') == [])
+        assert(CachedProvider.sizes[self.cache.directory] == size * 2)
+
+    def test_fetch_many_only_fetches_the_gaps(self):
+        self.cache.fetch('TSLA', self.day(20), self.day(10))
+        jobs = [('TSLA', self.day(15), self.day(12)),
+                ('TSLA', self.day(15), self.day(5)),
+                ('MISSING', self.day(15), self.day(5))]
+        with patch.object(LocalProvider, 'fetch_many',
+                          wraps=self.source.fetch_many) as fetch_many:
+            results = dict(self.cache.fetch_many(jobs))
+        assert(sorted(fetch_many.call_args[0][0]) ==
+               [('MISSING', self.day(15), self.day(5)),
+                ('TSLA', self.day(9), self.day(5))])
+        assert(len(results[jobs[0]]) == 4)
+        assert(len(results[jobs[1]]) == 11)
+        assert(results[jobs[2]] is None)
+
+    def test_rebuild_is_served_from_the_cache(self):
+        db.create_all()
+        self.source.save('TSLA', SF.build_dataframe(
+            end_date=dt.date.today() - dt.timedelta(days=1)))
+        app.config['OHLC_PROVIDER'] = 'local'
+        app.config['OHLC_DIRECTORY'] = self.source.directory
+        app.config['OHLC_CACHE'] = self.cache.directory
+        try:
+            symbols = [('TSLA', 'Tesla', 'NASDAQ')]
+            first = tasks.run_pipeline(symbols, workers=1)
+            StockPoint.query.delete()
+            db.session.commit()
+            second = tasks.run_pipeline(symbols, workers=1)
+            assert(first['cache'] == {'hits': 0, 'partial': 0, 'misses': 1})
+            # only today, which wasn't in yet, gets fetched again
+            assert(second['cache'] == {'hits': 0, 'partial': 1, 'misses': 0})
+            assert(StockPoint.query.count() > 0)
+        finally:
+            for key in ['OHLC_PROVIDER', 'OHLC_DIRECTORY', 'OHLC_CACHE']:
+                del app.config[key]
+            db.drop_all()
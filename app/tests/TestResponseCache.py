@@ -0,0 +1,154 @@
+import unittest
+import json
+import datetime as dt
+from mock import patch
+from app.models import Publication, StockSnapshot
+from app.response_cache import response_cache, LRUBackend, MemcacheBackend
+from app import app, db
+import StockFactory as SF
+
+class FakeMemcache(object):
+    ''' Stands in for a memcache.Client '''
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value):
+        assert(' ' not in key and len(key) < 250)
+        self.values[key] = value
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        db.create_all()
+        self.app = app.test_client()
+        self.stock = SF.build_stock()
+        self.stock._save_dataframe(SF.build_dataframe())
+        StockSnapshot.refresh()
+        Publication.bump()
+        self.backend = response_cache.backend
+        self.use(LRUBackend(10))
+
+    def tearDown(self):
+        response_cache.backend = self.backend
+        response_cache.invalidate()
+        db.drop_all()
+
+    def use(self, backend):
+        response_cache.backend = backend
+        response_cache.counts = dict.fromkeys(response_cache.counts, 0)
+        response_cache.invalidate()
+
+    def test_second_request_is_a_hit(self):
+        with patch('app.views.render_template',
+                   return_value='TSLA chart') as render:
+            first = self.app.get('/chart?symbol=TSLA')
+            second = self.app.get('/chart?symbol=TSLA')
+        assert(render.call_count == 1)
+        assert(first.headers['X-Cache'] == 'MISS')
+        assert(second.headers['X-Cache'] == 'HIT')
+        assert(first.data == second.data == 'TSLA chart')
+        assert(first.headers['ETag'] == second.headers['ETag'])
+
+    def test_query_string_is_part_of_the_key(self):
+        with patch('app.views.render_template', return_value='chart'):
+            self.app.get('/chart?symbol=TSLA')
+            rv = self.app.get('/chart?symbol=tsla')
+        assert(rv.headers['X-Cache'] == 'MISS')
+
+    def test_publishing_makes_the_pages_stale(self):
+        with patch('app.views.render_template', return_value='old'):
+            old = self.app.get('/chart?symbol=TSLA')
+        Publication.bump()
+        response_cache.invalidate()
+        with patch('app.views.render_template', return_value='new'):
+            new = self.app.get('/chart?symbol=TSLA')
+        assert(new.headers['X-Cache'] == 'MISS')
+        assert(new.data == 'new')
+        assert(new.headers['ETag'] != old.headers['ETag'])
+
+    def test_etag_revalidates_with_a_304(self):
+        first = self.app.get('/chart?symbol=TSLA')
+        rv = self.app.get('/chart?symbol=TSLA', headers={
+            'If-None-Match': first.headers['ETag']})
+        assert(rv.status_code == 304)
+        assert(rv.data == '')
+        assert(response_cache.counts['not_modified'] == 1)
+
+    def test_last_modified_revalidates_with_a_304(self):
+        first = self.app.get('/chart?symbol=TSLA')
+        assert(first.headers['Last-Modified'])
+        assert('no-cache' in first.headers['Cache-Control'])
+        rv = self.app.get('/chart?symbol=TSLA', headers={
+            'If-Modified-Since': first.headers['Last-Modified']})
+        assert(rv.status_code == 304)
+
+    def test_signals_expire_overnight(self):
+        today = dt.date.today()
+        snapshot = StockSnapshot.query.first()
+        snapshot.signals = json.dumps([[True, 'RSI', today.isoformat()]])
+        db.session.commit()
+        def render(template, **kwargs):
+            return '%d buy' % len(kwargs['signals']['Buy'])
+        with patch('app.views.render_template', side_effect=render):
+            with patch('app.models.today', return_value=today):
+                first = self.app.get('/chart?symbol=TSLA')
+                again = self.app.get('/chart?symbol=TSLA')
+            with patch('app.models.today',
+                       return_value=today + dt.timedelta(days=1)):
+                later = self.app.get('/chart?symbol=TSLA', headers={
+                    'If-Modified-Since': first.headers['Last-Modified']})
+        assert((first.data, again.headers['X-Cache']) == ('1 buy', 'HIT'))
+        # not a 304 off the publication's Last-Modified either
+        assert(later.status_code == 200)
+        assert((later.data, later.headers['X-Cache']) == ('0 buy', 'MISS'))
+
+    def test_404s_are_not_cached(self):
+        self.app.get('/chart?symbol=GOOG')
+        rv = self.app.get('/chart?symbol=GOOG')
+        assert(rv.status_code == 404)
+        assert('X-Cache' not in rv.headers)
+        assert(len(response_cache.backend.pages) == 0)
+
+    def test_shared_backend(self):
+        client = FakeMemcache()
+        self.use(MemcacheBackend(client))
+        with patch('app.views.render_template', return_value='chart'):
+            self.app.get('/chart?symbol=TSLA')
+        assert(len(client.values) == 1)
+        # another process sharing the servers gets the page from them
+        self.use(MemcacheBackend(client))
+        with patch('app.views.render_template') as render:
+            rv = self.app.get('/chart?symbol=TSLA')
+        assert(not render.called)
+        assert(rv.headers['X-Cache'] == 'HIT')
+        assert(rv.data == 'chart')
+
+    def test_shared_backend_with_a_non_ascii_query(self):
+        client = FakeMemcache()
+        self.use(MemcacheBackend(client))
+        with patch('app.views.render_template', return_value='chart'):
+            rv = self.app.get(u'/chart?symbol=TSLA&q=caf\xe9')
+            assert(rv.status_code == 200)
+            rv = self.app.get(u'/chart?symbol=TSLA&q=caf\xe9')
+        assert(rv.headers['X-Cache'] == 'HIT')
+
+    def test_lru_backend_drops_the_least_recently_used(self):
+        backend = LRUBackend(2)
+        backend.set('a', 1)
+        backend.set('b', 2)
+        backend.get('a')
+        backend.set('c', 3)
+        assert(backend.get('b') is None)
+        assert((backend.get('a'), backend.get('c')) == (1, 3))
+
+    def test_stats_has_the_hit_ratio(self):
+        with patch('app.views.render_template', return_value='chart'):
+            for i in range(4):
+                self.app.get('/chart?symbol=TSLA')
+        stats = json.loads(self.app.get('/cache-stats').data)
+        assert((stats['hits'], stats['misses']) == (3, 1))
+        self.assertAlmostEqual(stats['hit_ratio'], 0.75)
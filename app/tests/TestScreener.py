@@ -0,0 +1,77 @@
+import unittest
+import datetime as dt
+from app.models import Stock, Signal, ScreenerRow
+from app import app, db
+import StockFactory as SF
+
+class TestScreener(unittest.TestCase):
+
+    def setUp(self):
+        db.create_all()
+        self.app = app.test_client()
+        self.stocks = {}
+        for symbol, closes in [('TSLA', [10., 12.]), ('GOOG', [20., 21.]),
+                               ('AAPL', [30.])]:
+            stock = SF.build_stock(symbol, '%s Inc' % symbol)
+            stock._save_dataframe(SF.build_dataframe(
+                values={'Close': closes}))
+            self.stocks[symbol] = stock
+
+    def tearDown(self):
+        db.drop_all()
+
+    def add_signals(self, symbol, buys, sells, weight=0.5, days=1):
+        for is_buy in [True] * buys + [False] * sells:
+            signal = Signal()
+            signal.is_buy_signal = is_buy
+            signal.weight = weight
+            signal.expiration_date = dt.date.today() + dt.timedelta(days=days)
+            self.stocks[symbol].signals.append(signal)
+        db.session.commit()
+
+    def test_refresh_sums_up_the_live_signals(self):
+        self.add_signals('TSLA', buys=3, sells=1)
+        self.add_signals('TSLA', buys=2, sells=0, days=-1)   # expired
+        self.add_signals('GOOG', buys=0, sells=2, weight=0.25)
+        assert(ScreenerRow.refresh() == 2)
+        rows = dict((row.symbol, row) for row in ScreenerRow.query.all())
+        assert(sorted(rows) == ['GOOG', 'TSLA'])
+        tsla = rows['TSLA']
+        assert((tsla.buy_count, tsla.sell_count) == (3, 1))
+        self.assertAlmostEqual(float(tsla.score), 1.0)
+        self.assertAlmostEqual(float(tsla.last_close), 12.)
+        assert(tsla.name == 'TSLA Inc')
+        self.assertAlmostEqual(float(rows['GOOG'].score), -0.5)
+
+    def test_refresh_replaces_the_old_rows(self):
+        self.add_signals('TSLA', buys=2, sells=0)
+        ScreenerRow.refresh()
+        Signal.query.delete()
+        db.session.commit()
+        self.add_signals('GOOG', buys=2, sells=0)
+        ScreenerRow.refresh()
+        assert([row.symbol for row in ScreenerRow.query.all()] == ['GOOG'])
+
+    def test_buy_and_sell_stocks_match_the_signal_queries(self):
+        self.add_signals('TSLA', buys=2, sells=2)
+        self.add_signals('GOOG', buys=3, sells=1, weight=1.)
+        self.add_signals('AAPL', buys=1, sells=3)
+        ScreenerRow.refresh()
+        buy = ScreenerRow.buy_stocks()
+        sell = ScreenerRow.sell_stocks()
+        # best score first for buys, worst first for sells
+        assert([row.symbol for row in buy] == ['GOOG', 'TSLA'])
+        assert([row.symbol for row in sell] == ['AAPL', 'TSLA'])
+        assert(sorted(row.stock_id for row in buy) ==
+               sorted(stock.id for stock, count in Stock.find_buy_stocks()))
+        assert(sorted(row.stock_id for row in sell) ==
+               sorted(stock.id for stock, count in Stock.find_sell_stocks()))
+
+    def test_index_page_lists_the_screener(self):
+        self.add_signals('TSLA', buys=2, sells=0)
+        self.add_signals('GOOG', buys=0, sells=2)
+        ScreenerRow.refresh()
+        rv = self.app.get('/')
+        buying, selling = rv.data.split('Selling Recommendations')
+        assert('TSLA - TSLA Inc' in buying)
+        assert('GOOG - GOOG Inc' in selling)
@@ -0,0 +1,92 @@
+import unittest
+import datetime as dt
+import json
+import shutil
+import tempfile
+import numpy as np
+from app.series import load_series, downsample
+from app import app, db
+import StockFactory as SF
+
+class TestSeries(unittest.TestCase):
+
+    def setUp(self):
+        db.create_all()
+        self.app = app.test_client()
+        self.stock = SF.build_stock()
+        self.stock._save_dataframe(SF.build_dataframe(
+            values={'Open': [float(x) for x in range(1, 11)],
+                    'High': [float(x) + 1 for x in range(1, 11)],
+                    'Low': [float(x) - 1 for x in range(1, 11)],
+                    'Close': [float(x) + .5 for x in range(1, 11)],
+                    'Adj Close': [float(x) + .5 for x in range(1, 11)],
+                    'Volume': range(100, 110)},
+            end_date=dt.date(2014,12,10)))
+        self.stock.calculate_indicators()
+
+    def tearDown(self):
+        db.drop_all()
+
+    def get(self, url):
+        rv = self.app.get(url)
+        return rv.status_code, json.loads(rv.data)
+
+    def test_whole_series_has_ohlcv_by_default(self):
+        status, data = self.get('/api/series/tsla')
+        assert(status == 200)
+        assert(data['symbol'] == 'TSLA')
+        assert(data['dates'][0] == '2014-12-01')
+        assert(data['dates'][-1] == '2014-12-10')
+        assert(sorted(data['columns']) ==
+               ['close', 'high', 'low', 'open', 'volume'])
+        assert(data['columns']['open'] == [float(x) for x in range(1, 11)])
+        assert(data['columns']['volume'] == range(100, 110))
+
+    def test_range_and_columns(self):
+        status, data = self.get('/api/series/TSLA?start=2014-12-03'
+                                '&end=2014-12-05&columns=close,rsi')
+        assert(data['dates'] == ['2014-12-03', '2014-12-04', '2014-12-05'])
+        assert(data['columns']['close'] == [3.5, 4.5, 5.5])
+        # not enough points for an RSI yet
+        assert(data['columns']['rsi'] == [None] * 3)
+
+    def test_downsampling_combines_like_candles(self):
+        status, data = self.get('/api/series/TSLA?points=3')
+        assert(data['dates'] == ['2014-12-01', '2014-12-04', '2014-12-07'])
+        columns = data['columns']
+        assert(columns['open'] == [1., 4., 7.])
+        assert(columns['high'] == [4., 7., 11.])
+        assert(columns['low'] == [0., 3., 6.])
+        assert(columns['close'] == [3.5, 6.5, 10.5])
+        assert(columns['volume'] == [303, 312, 430])
+
+    def test_errors(self):
+        assert(self.get('/api/series/GOOG')[0] == 404)
+        status, data = self.get('/api/series/TSLA?columns=close,bogus')
+        assert(status == 400)
+        assert('bogus' in data['error'])
+        assert(self.get('/api/series/TSLA?start=12/1/2014')[0] == 400)
+        assert(self.get('/api/series/TSLA?points=many')[0] == 400)
+
+    def test_point_store_matches_the_database(self):
+        columns = ['open', 'high', 'close', 'volume', 'rsi', 'sma_50']
+        args = (self.stock, columns, dt.date(2014,12,2), dt.date(2014,12,8))
+        dates, values = load_series(*args)
+        directory = tempfile.mkdtemp()
+        app.config['POINT_STORE'] = directory
+        try:
+            self.stock.save_to_store()
+            stored_dates, stored = load_series(*args)
+        finally:
+            del app.config['POINT_STORE']
+            shutil.rmtree(directory)
+        assert((dates == stored_dates).all())
+        for col in columns:
+            assert(values[col].dtype == stored[col].dtype)
+            np.testing.assert_array_equal(values[col], stored[col])
+
+    def test_downsample_leaves_short_series_alone(self):
+        dates = np.arange(5).astype('datetime64[D]')
+        values = {'close': np.arange(5.)}
+        assert(downsample(dates, values, 10) == (dates, values))
+        assert(downsample(dates, values, 0) == (dates, values))
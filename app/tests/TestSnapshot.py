@@ -0,0 +1,90 @@
+import unittest
+import datetime as dt
+from mock import patch
+from sqlalchemy import event
+from app.models import Signal, StockSnapshot
+from app import app, db
+import StockFactory as SF
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        db.create_all()
+        self.app = app.test_client()
+        self.stock = SF.build_stock()
+        self.stock._save_dataframe(SF.build_dataframe(
+            days=300, values={'Close': [10. + x % 9 for x in range(300)],
+                              'Adj Close': [10. + x % 9 for x in range(300)],
+                              'Volume': range(300)}))
+        self.stock.calculate_indicators()
+
+    def tearDown(self):
+        db.drop_all()
+
+    def add_signal(self, is_buy, description, days=1):
+        signal = Signal()
+        signal.is_buy_signal = is_buy
+        signal.description = description
+        signal.expiration_date = dt.date.today() + dt.timedelta(days=days)
+        self.stock.signals.append(signal)
+        db.session.commit()
+
+    def test_refresh_copies_the_last_point(self):
+        assert(StockSnapshot.refresh() == 1)
+        snapshot = StockSnapshot.query.get(self.stock.id)
+        point = self.stock.stockpoints[-1]
+        assert(snapshot.symbol == 'TSLA')
+        assert(snapshot.name == 'Tesla Motors Inc')
+        for col in StockSnapshot.POINT_COLUMNS:
+            assert(getattr(snapshot, col) == getattr(point, col)), col
+        assert(snapshot.sma_200 is not None)
+
+    def test_refresh_keeps_the_live_signals(self):
+        self.add_signal(True, 'RSI is low')
+        self.add_signal(True, 'Crossed its SMA', days=3)
+        self.add_signal(False, 'Over its 52 week high')
+        self.add_signal(False, 'Expired', days=-1)
+        StockSnapshot.refresh()
+        signals = StockSnapshot.query.get(self.stock.id).live_signals()
+        assert([s['description'] for s in signals['Buy']] ==
+               ['Crossed its SMA', 'RSI is low'])
+        assert([s['description'] for s in signals['Sell']] ==
+               ['Over its 52 week high'])
+
+    def test_signals_expiring_after_the_refresh_are_dropped(self):
+        self.add_signal(True, 'RSI is low')
+        StockSnapshot.refresh()
+        snapshot = StockSnapshot.query.get(self.stock.id)
+        later = dt.date.today() + dt.timedelta(days=2)
+        with patch('app.models.today', return_value=later):
+            assert(snapshot.live_signals() == {'Buy': [], 'Sell': []})
+
+    def test_refresh_replaces_the_old_rows(self):
+        StockSnapshot.refresh()
+        self.stock._save_dataframe(SF.build_dataframe(
+            days=1, values={'Close': [42.]},
+            end_date=dt.date.today() + dt.timedelta(days=1)))
+        StockSnapshot.refresh()
+        snapshot, = StockSnapshot.query.all()
+        self.assertAlmostEqual(float(snapshot.close), 42.)
+
+    def test_chart_page_reads_only_the_snapshot(self):
+        self.add_signal(True, 'RSI is low')
+        StockSnapshot.refresh()
+        statements = []
+        def record(conn, cursor, statement, parameters, *args):
+            statements.append((statement, parameters))
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            rv = self.app.get('/chart?symbol=tsla')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert(rv.status_code == 200)
+        assert('RSI is low' in rv.data)
+        assert('Recommendation:&nbsp&nbspBuy' in rv.data)
+        assert(not [s for s, p in statements if 'stock_point' in s
+                    or 'FROM signal' in s])
+        statement, parameters = statements[-1]
+        plan = ' '.join(list(row)[-1] for row in db.engine.execute(
+            'EXPLAIN QUERY PLAN ' + statement, parameters).fetchall())
+        assert('ix_stock_snapshot_symbol' in plan), plan
@@ -1,7 +1,7 @@
 import unittest
 import datetime as dt
 from datetime import date
-from app.models import Stock, StockPoint, Signal
+from app.models import Stock, StockPoint, Signal, IndicatorState
 from app import app, db
 from mock import patch
 import pandas as pd
@@ -198,19 +198,44 @@ class TestStock(unittest.TestCase):
         assert(df.loc[today]['52-Week-High'] == 1)
         assert(df.loc[today]['52-Week-Low'] == 1)
 
-    @patch('app.models.Stock.fetch_ohlc_from_yahoo')
-    def test_fetch_all_ohlc_from_yahoo(self,mock_fetch):   
+    def test_load_dataframe_from_db_dtypes(self):
+        ''' Prices and indicators load as float64 (never Decimal), with
+        NULLs as NaN, and volume as int64 '''
+        self.stock._save_dataframe(SF.build_dataframe(days=3))
+        df = self.stock.load_dataframe_from_db()
+        assert(df['Volume'].dtype == 'int64')
+        assert(all(df[col].dtype == 'float64' for col in df.columns
+                   if col != 'Volume'))
+        assert(pd.isnull(df['RSI']).all())
+
+    def test_load_dataframe_from_db_with_start_date(self):
+        self.stock._save_dataframe(SF.build_dataframe(
+            days=700, end_date=dt.date(2014,12,1)))
+        df = self.stock.load_dataframe_from_db(start_date=dt.date(2014,11,1))
+        assert(len(df) == 31)
+        assert(df.index[0].date() == dt.date(2014,11,1))
+        df = self.stock.load_dataframe_from_db(start_date=dt.date(2014,11,1),
+                                               limit=5)
+        assert(df.index[0].date() == dt.date(2014,11,27))
+
+    def test_load_dataframe_from_db_without_points(self):
+        db.session.add(self.stock)
+        db.session.commit()
+        assert(len(self.stock.load_dataframe_from_db()) == 0)
+
+    @patch('app.models.Stock.fetch_ohlc')
+    def test_fetch_all_ohlc(self,mock_fetch):   
         df = self.stock.fetch_and_save_all_ohlc()
         end = dt.date.today()
         start = end - dt.timedelta(Stock.LOOKBACK_DAYS)
         mock_fetch.assert_called_with(start,end)
 
-    @patch('app.models.DataReader')
-    def test_fetch_ohlc_from_yahoo(self, MockDataReader):
+    @patch('app.providers.YahooProvider.fetch')
+    def test_fetch_ohlc(self, mock_fetch):
         end = dt.date.today()
         start = end - dt.timedelta(days=1)
-        df = self.stock.fetch_ohlc_from_yahoo(start, end)
-        MockDataReader.assert_called_with("TSLA","yahoo",start,end)
+        df = self.stock.fetch_ohlc(start, end)
+        mock_fetch.assert_called_with("TSLA",start,end)
 
     @patch('app.models.today')
     def test_should_fetch_should_fetch(self, mock_today):
@@ -231,7 +256,7 @@ class TestStock(unittest.TestCase):
         assert(self.stock._should_fetch() == False)
 
     @patch('app.models.today')
-    @patch('app.models.Stock.fetch_ohlc_from_yahoo')
+    @patch('app.models.Stock.fetch_ohlc')
     def test_fetch_and_save_missing_ohlc(self, mock_fetch, mock_today):
         mock_today.return_value = dt.date(2014,10,10)
         df = SF.build_dataframe(end_date=dt.date(2014,10,7))
@@ -256,12 +281,12 @@ class TestStock(unittest.TestCase):
         self.stock.get_dataframe()
         assert(mock_fetch_missing.called)
 
-    @patch('app.models.DataReader')
-    def test_fetch_ohlc_from_yahoo_fails_gracefully_with_invalid_stock(self, mockDataReader):
-        mockDataReader.side_effect = IOError # raised when symbol isn't found
+    @patch('app.providers.YahooProvider.fetch')
+    def test_fetch_ohlc_fails_gracefully_with_invalid_stock(self, mock_fetch):
+        mock_fetch.side_effect = IOError # raised when the fetch fails
         self.stock.symbol = 'This is an invalid symbol'
         start = end = dt.date.today() - dt.timedelta(days=1)
-        df = self.stock.fetch_ohlc_from_yahoo(start,end)
+        df = self.stock.fetch_ohlc(start,end)
         assert(df is None)
 
     def test_saving_bad_df_to_database(self):
@@ -272,6 +297,15 @@ class TestStock(unittest.TestCase):
         print df
         assert(StockPoint.query.count() == 2)
 
+    def test_saving_df_with_missing_values(self):
+        ''' Rows with a NaN or None in an OHLCV column are skipped '''
+        df = SF.build_dataframe(values={'Close': [1, float('nan'), 2, 3],
+                                        'Volume': [1, 2, None, 4]})
+        self.stock._save_dataframe(df)
+        assert([p.date for p in self.stock.stockpoints] ==
+               [df.index[0].date(), df.index[3].date()])
+        assert(self.stock.stockpoints[1].volume == 4)
+
     def test_update_dataframe(self):
         ''' Should update the RSI, MACD, MACD-Signal, SMAs, and Adj values '''
         df = SF.build_dataframe(values={'RSI':[1],'MACD':[2],'MACD-Signal':[3],
@@ -294,3 +328,101 @@ class TestStock(unittest.TestCase):
         assert(self.stock.stockpoints[0].adj_low == 7)
         assert(self.stock.stockpoints[0].high_52_weeks == 8)
         assert(self.stock.stockpoints[0].low_52_weeks == 9)
+
+    def test_incremental_calculate_indicators_only_updates_new_points(self):
+        ''' After the first full calculation, an incremental run should
+        only fill in the new point, matching a full recalculation. '''
+        closes = [20 + (x % 17) * .5 - (x % 5) * .75 for x in range(501)]
+        end = dt.date(2014,12,1)
+        self.stock._save_dataframe(SF.build_dataframe(
+            values={'Adj Close': closes[:-1], 'Close': closes[:-1]},
+            end_date=end - dt.timedelta(days=1)))
+        self.stock.calculate_indicators()
+        assert(self.stock._pending_point_count() == 0)
+        self.stock._save_dataframe(SF.build_dataframe(
+            values={'Adj Close': closes[-1:], 'Close': closes[-1:]},
+            end_date=end))
+        assert(self.stock._pending_point_count() == 1)
+        with patch('app.models.Stock.update_dataframe') as mock_update:
+            self.stock.calculate_indicators(incremental=True)
+            assert(len(mock_update.call_args[0][0]) == 1)
+        self.stock.calculate_indicators(incremental=True)
+        assert(self.stock._pending_point_count() == 0)
+        incremental = self.stock.load_dataframe_from_db().iloc[-1]
+        self.stock.calculate_indicators()
+        full = self.stock.load_dataframe_from_db().iloc[-1]
+        for col in ['RSI', 'MACD', 'MACD-Signal', 'SMA-50', 'SMA-200',
+                    '52-Week-High', '52-Week-Low']:
+            self.assertAlmostEqual(float(incremental[col]), float(full[col]), 6)
+
+    def test_incremental_calculate_indicators_with_nothing_new(self):
+        self.stock._save_dataframe(SF.build_dataframe(days=30))
+        self.stock.calculate_indicators()
+        with patch('app.models.Stock.load_dataframe_from_db') as mock_load:
+            self.stock.calculate_indicators(incremental=True)
+            assert(not mock_load.called)
+
+    def test_load_dataframe_from_db_with_limit(self):
+        self.stock._save_dataframe(SF.build_dataframe(days=10))
+        df = self.stock.load_dataframe_from_db(limit=3)
+        assert(len(df) == 3)
+        assert(df.index[-1].date() == dt.date.today())
+        assert(df.index.is_monotonic)
+
+    def test_update_dataframe_only_touches_rows_in_df(self):
+        ''' Points are matched by date, and missing values become NULL '''
+        df = SF.build_dataframe(days=3)
+        self.stock._save_dataframe(df)
+        for col in [df_col for col, df_col in Stock.UPDATE_COLUMNS]:
+            df[col] = 7.
+        df.ix[2, 'RSI'] = float('nan')
+        self.stock.update_dataframe(df[1:])
+        points = self.stock.stockpoints
+        assert(points[0].macd is None)
+        assert(points[1].macd == 7 and points[1].rsi == 7)
+        assert(points[2].macd == 7 and points[2].rsi is None)
+
+    def _save_closes(self, closes, end_date):
+        self.stock._save_dataframe(SF.build_dataframe(
+            values={'Adj Close': closes, 'Close': closes}, end_date=end_date))
+
+    def test_calculate_indicators_saves_indicator_states(self):
+        self._save_closes([10 + x % 7 for x in range(100)], dt.date(2014,12,1))
+        self.stock.calculate_indicators()
+        states = IndicatorState.query.filter_by(stock_id=self.stock.id).all()
+        assert(sorted(s.indicator for s in states) == ['52-Week-High',
+            '52-Week-Low', 'MACD', 'RSI', 'SMA-200', 'SMA-50'])
+        assert(all(s.last_date == dt.date(2014,12,1) for s in states))
+        assert(len(self.stock.indicator_states[0].values) > 0)
+
+    def test_incremental_calculate_indicators_without_states(self):
+        ''' Without saved states, the new points come from the warm-up
+        window and the states get rebuilt '''
+        closes = [20 + (x % 13) * .5 for x in range(400)]
+        self._save_closes(closes[:-2], dt.date(2014,11,29))
+        self.stock.calculate_indicators()
+        self.stock.indicator_states = []
+        db.session.commit()
+        self._save_closes(closes[-2:], dt.date(2014,12,1))
+        self.stock.calculate_indicators(incremental=True)
+        assert(len(self.stock.indicator_states) == 6)
+        incremental = self.stock.load_dataframe_from_db()
+        self.stock.calculate_indicators()
+        full = self.stock.load_dataframe_from_db()
+        for i in (-2, -1):
+            self.assertAlmostEqual(float(incremental['MACD'][i]),
+                                   float(full['MACD'][i]), 6)
+
+    def test_restated_history_recalculates_everything(self):
+        ''' If the closes under the states change (e.g. an adjusted close
+        restatement), the whole history should be recalculated '''
+        closes = [20 + (x % 13) * .5 for x in range(100)]
+        self._save_closes(closes[:-1], dt.date(2014,11,30))
+        self.stock.calculate_indicators()
+        db.engine.execute("UPDATE stock_point SET adj_close = adj_close / 2")
+        self._save_closes([c / 2 for c in closes[-1:]], dt.date(2014,12,1))
+        self.stock.calculate_indicators(incremental=True)
+        df = self.stock.load_dataframe_from_db()
+        for i in (60, 99):
+            self.assertAlmostEqual(float(df['SMA-50'][i]),
+                                   sum(closes[i-49:i+1]) / 100., 6)
@@ -0,0 +1,116 @@
+import unittest
+import datetime as dt
+import shutil
+import tempfile
+import numpy as np
+from mock import patch
+from app.models import Stock, StockPoint, fetch_arrays
+from app.store import PointStore
+from app import app, db, panel
+import StockFactory as SF
+
+class TestPointStore(unittest.TestCase):
+
+    def setUp(self):
+        db.create_all()
+        self.directory = tempfile.mkdtemp()
+        app.config['POINT_STORE'] = self.directory
+        self.stock = SF.build_stock()
+        self.stock._save_dataframe(SF.build_dataframe(
+            days=40, values={'Adj Close': [50. + x % 7 for x in range(40)],
+                             'Volume': range(1000, 1040)},
+            end_date=dt.date(2014,12,1)))
+        self.stock.calculate_indicators()
+
+    def tearDown(self):
+        del app.config['POINT_STORE']
+        shutil.rmtree(self.directory)
+        db.drop_all()
+
+    def assertSameFrame(self, left, right):
+        assert(list(left.columns) == list(right.columns))
+        assert(list(left.dtypes) == list(right.dtypes))
+        assert((left.index == right.index).all())
+        x, y = left.values.astype(float), right.values.astype(float)
+        assert((np.isnan(x) == np.isnan(y)).all())
+        assert((x[~np.isnan(x)] == y[~np.isnan(y)]).all())
+
+    @patch('app.models.fetch_arrays', side_effect=fetch_arrays)
+    def test_reads_match_the_database(self, fetch):
+        for kwargs in [{}, {'limit': 5}, {'limit': 100},
+                       {'start_date': dt.date(2014,11,20)},
+                       {'start_date': dt.date(2014,11,20), 'limit': 3}]:
+            fetch.reset_mock()
+            df = self.stock.load_dataframe_from_db(from_store=True, **kwargs)
+            assert(not fetch.called)
+            self.assertSameFrame(df, self.stock.load_dataframe_from_db(
+                **kwargs))
+
+    def test_changing_a_read_leaves_the_store_alone(self):
+        df = self.stock.load_from_store()
+        df['Close'] = 0.
+        df = self.stock.load_from_store()
+        assert((df['Close'] > 0).all())
+
+    @patch('app.models.fetch_arrays', side_effect=fetch_arrays)
+    def test_store_behind_the_database_isnt_read(self, fetch):
+        self.stock._save_dataframe(SF.build_dataframe(
+            days=1, end_date=dt.date(2014,12,2)))
+        assert(self.stock.load_from_store() is None)
+        df = self.stock.load_dataframe_from_db(from_store=True)
+        assert(fetch.called)
+        assert(df.index[-1].date() == dt.date(2014,12,2))
+
+    def test_a_filled_gap_makes_the_store_stale(self):
+        gap = dt.date(2014,11,20)
+        filled = self.stock.load_dataframe_from_db()[gap:gap]
+        StockPoint.query.filter(StockPoint.stock_id == self.stock.id,
+                                StockPoint.date == gap)\
+            .delete(synchronize_session=False)
+        db.session.commit()
+        self.stock.save_to_store()
+        self.stock._save_dataframe(filled)
+        # same last point, but not the same history
+        assert(self.stock.load_from_store() is None)
+        panel.calculate_indicators()
+        self.assertSameFrame(self.stock.load_from_store(),
+                             self.stock.load_dataframe_from_db())
+
+    def test_restated_points_make_the_store_stale(self):
+        row = dict((col, 1.) for col, name in Stock.UPDATE_COLUMNS)
+        Stock.update_points([dict(row, b_stock_id=self.stock.id,
+                                  b_date=dt.date(2014,11,20))])
+        db.session.commit()
+        assert(self.stock.load_from_store() is None)
+
+    def test_new_points_are_appended(self):
+        store = Stock.point_store()
+        before = store.version(self.stock.id)
+        self.stock._save_dataframe(SF.build_dataframe(
+            days=2, end_date=dt.date(2014,12,3)))
+        with patch.object(PointStore, '_write') as write:
+            panel.calculate_indicators()
+        assert(not write.called)
+        assert(store.version(self.stock.id) > before)
+        self.assertSameFrame(self.stock.load_from_store(),
+                             self.stock.load_dataframe_from_db())
+
+    def test_panel_writes_the_store(self):
+        self.stock._save_dataframe(SF.build_dataframe(
+            days=1, end_date=dt.date(2014,12,2)))
+        panel.calculate_indicators()
+        self.assertSameFrame(self.stock.load_from_store(),
+                             self.stock.load_dataframe_from_db())
+
+    def test_no_store_without_the_setting(self):
+        del app.config['POINT_STORE']
+        try:
+            assert(Stock.point_store() is None)
+            assert(self.stock.load_from_store() is None)
+        finally:
+            app.config['POINT_STORE'] = self.directory
+
+    def test_store_with_other_columns_isnt_read(self):
+        store = PointStore(self.directory, ['Open', 'Close'])
+        assert(store.read(self.stock.id) is None)
+        assert(store.last_date(self.stock.id) is None)
@@ -0,0 +1,116 @@
+import unittest
+import json
+from mock import patch
+from sqlalchemy import event
+from app.models import Publication
+from app.symbols import SymbolIndex, symbol_index
+from app import app, db
+import StockFactory as SF
+
+STOCKS = [('A', 'Agilent Technologies Inc', 'NYSE'),
+          ('AA', 'Alcoa Inc', 'NYSE'),
+          ('AAPL', 'Apple Inc', 'NASDAQ'),
+          ('APLE', 'Apple Hospitality REIT Inc', 'NYSE'),
+          ('GOOG', 'Google Inc', 'NASDAQ'),
+          ('TSLA', 'Tesla Motors Inc', 'NASDAQ')]
+
+class TestSymbolIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = SymbolIndex()
+        self.index.build(STOCKS)
+
+    def symbols(self, query, limit=10):
+        return [symbol for symbol, name, market in
+                self.index.search(query, limit)]
+
+    def test_symbols_exact_match_first_then_shortest(self):
+        assert(self.symbols('a') == ['A', 'AA', 'AAPL', 'APLE'])
+        assert(self.symbols('aa') == ['AA', 'AAPL'])
+        assert(self.symbols('A', limit=2) == ['A', 'AA'])
+
+    def test_name_words_after_symbols(self):
+        assert(self.symbols('alc') == ['AA'])
+        assert(self.symbols('appl') == ['AAPL', 'APLE'])
+        assert(self.symbols('mot') == ['TSLA'])
+
+    def test_every_word_of_the_query_has_to_match(self):
+        assert(self.symbols('apple hosp') == ['APLE'])
+        assert(self.symbols('apple motors') == [])
+        # stop words match nothing on their own and are ignored otherwise
+        assert(self.symbols('inc') == [])
+        assert(self.symbols('tesla inc') == ['TSLA'])
+
+    def test_word_being_typed_can_look_like_a_stop_word(self):
+        self.index.build(STOCKS + [('KO', 'Coca-Cola Co', 'NYSE'),
+                                   ('TRMK', 'Trustmark Corp', 'NASDAQ'),
+                                   ('GRPN', 'Groupon Inc', 'NASDAQ')])
+        assert(self.symbols('co') == ['KO'])
+        assert(self.symbols('trust') == ['TRMK'])
+        assert(self.symbols('group') == ['GRPN'])
+        # but not once it's done
+        assert(self.symbols('the coca') == ['KO'])
+        assert(self.symbols('coca co') == ['KO'])
+
+    def test_narrow_first_word_with_a_common_prefix(self):
+        # many more names with an h word than apple ones
+        self.index.build(STOCKS + [('H%03d' % i, 'Hotel %d' % i, 'NYSE')
+                                   for i in range(100)])
+        assert(self.symbols('apple h') == ['APLE'])
+        assert(len(self.symbols('h')) == 10)
+
+    def test_nothing_for_an_empty_query(self):
+        assert(self.symbols('  ') == [])
+        assert(self.symbols('zzz') == [])
+
+class TestSymbolsApi(unittest.TestCase):
+
+    def setUp(self):
+        db.create_all()
+        self.app = app.test_client()
+        for symbol, name, market in STOCKS[:3]:
+            db.session.add(SF.build_stock(symbol, name, market))
+        db.session.commit()
+        symbol_index.generation = None
+        symbol_index.checked = 0
+
+    def tearDown(self):
+        db.drop_all()
+
+    def get(self, query):
+        return json.loads(self.app.get('/api/symbols?q=' + query).data)
+
+    def test_results_have_what_the_search_box_shows(self):
+        assert(self.get('alco') == {'results': [
+            {'Symbol': 'AA', 'Name': 'Alcoa Inc', 'Exchange': 'NYSE'}]})
+
+    def test_searches_dont_touch_the_database(self):
+        self.get('a')
+        statements = []
+        def record(*args):
+            statements.append(args)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            for query in ['a', 'aa', 'aap', 'apple']:
+                assert(self.get(query)['results'])
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert(statements == [])
+
+    def test_index_reloads_when_new_data_is_published(self):
+        assert(self.get('goog') == {'results': []})
+        db.session.add(SF.build_stock(*STOCKS[4]))
+        db.session.commit()
+        # not until the generation changes
+        symbol_index.checked = 0
+        assert(self.get('goog') == {'results': []})
+        Publication.bump()
+        with patch('app.symbols.GENERATION_CHECK', 0):
+            assert(self.get('goog')['results'][0]['Symbol'] == 'GOOG')
+
+    def test_inactive_stocks_are_left_out(self):
+        stock = SF.build_stock(*STOCKS[5])
+        stock.active = False
+        db.session.add(stock)
+        db.session.commit()
+        assert(self.get('tsla') == {'results': []})
@@ -1,10 +1,354 @@
 import unittest
+import datetime as dt
 import tasks
+from app import app, db
+from app.models import Stock, Publication
+from mock import patch
+from sqlalchemy import event
+import StockFactory as SF
+
+def fail_on_bad(symbol, name, market, calculate=True, df=None,
+                directory=None):
+    ''' Stand-in for create_or_update_stock '''
+    if symbol.startswith('BAD'):
+        raise ValueError('no data for %s' % symbol)
+
+class FailOnce(object):
+    ''' Stand-in for create_or_update_stock failing the first try of
+    each symbol starting with FLAKY '''
+    def __init__(self):
+        self.tried = set()
+
+    def __call__(self, symbol, name, market, calculate=True, df=None,
+                 directory=None):
+        if symbol.startswith('FLAKY') and symbol not in self.tried:
+            self.tried.add(symbol)
+            raise IOError('timed out')
+        fail_on_bad(symbol, name, market)
+
+def no_prefetch(symbols, directory):
+    ''' Stand-in for prefetch_ohlc that leaves the fetching to
+    create_or_update_stock '''
+    return ((symbol, None) for symbol in symbols)
 
 class TestTasks(unittest.TestCase):
-    
+
+    def setUp(self):
+        db.create_all()
+        self.prefetch = patch('tasks.prefetch_ohlc', no_prefetch)
+        self.prefetch.start()
+        self.symbols = [('S%s' % i, 'Stock %s' % i, 'NASDAQ')
+                        for i in range(10)] + [('BAD1', 'Bad', 'NYSE')]
+
+    def tearDown(self):
+        self.prefetch.stop()
+        db.drop_all()
+
+    @patch('tasks.publish')
+    def test_calculate_indicators_skips_stocks_without_new_data(self,
+                                                                publish):
+        for symbol in ['NEW', 'OLD', 'GONE']:
+            stock = Stock(symbol=symbol, name=symbol, market='NASDAQ')
+            stock._save_dataframe(SF.build_dataframe(days=30))
+        Stock.query.filter(Stock.symbol != 'NEW')\
+            .update({'pending_since': None}, synchronize_session=False)
+        db.session.commit()
+        with patch('app.models.Stock.calculate_indicators',
+                   autospec=True) as calculate:
+            summary = tasks.calculate_indicators(per_stock=True)
+        assert([call[0][0].symbol for call in calculate.call_args_list] ==
+               ['NEW'])
+        assert(summary == {'stocks': 1, 'skipped': 2})
+        summary = tasks.calculate_indicators()
+        assert((summary['stocks'], summary['skipped']) == (1, 2))
+        assert(Stock.query.filter(Stock.pending_since != None).count() == 0)
+        assert(publish.call_count == 2)
+
+    def test_shard_splits_round_robin(self):
+        shards = tasks.shard(range(7), 3)
+        assert(shards == [[0, 3, 6], [1, 4], [2, 5]])
+
+    def test_shard_skips_empty_shards(self):
+        assert(tasks.shard(range(2), 4) == [[0], [1]])
+        assert(tasks.shard([], 4) == [])
+
+    def test_failed_writes_count_as_failed_symbols(self):
+        ''' A point that's already in the table fails the whole insert,
+        which used to be rolled back and left out of the errors '''
+        stock = Stock(symbol='DUP', name='Dup', market='NASDAQ')
+        stock._save_dataframe(SF.build_dataframe(
+            days=5, end_date=dt.date(2014,11,28)))
+        df = SF.build_dataframe(days=3, end_date=dt.date(2014,11,30))
+        symbols = [('DUP', 'Dup', 'NASDAQ')]
+        with patch('tasks.prefetch_ohlc',
+                   lambda symbols, directory: [(symbols[0], df)]):
+            result = tasks.run_shard((0, symbols), calculate=False)
+        assert(result['failed'] == symbols)
+        assert([symbol for symbol, error in result['errors']] == ['DUP'])
+        assert('UNIQUE' in result['errors'][0][1])
+        assert(len(stock.load_dataframe_from_db()) == 5)
+
+    @patch('tasks.create_or_update_stock')
+    def test_run_pipeline_in_process(self, create_or_update_stock):
+        create_or_update_stock.side_effect = fail_on_bad
+        summary = tasks.run_pipeline(self.symbols, workers=1)
+        assert(create_or_update_stock.call_count == 11)
+        assert(summary['symbols'] == 11)
+        assert(summary['errors'] == [('BAD1', 'no data for BAD1')])
+
+    @patch('tasks.StockDirectory.load', lambda self, symbols: self)
+    @patch('tasks.create_or_update_stock', side_effect=fail_on_bad)
+    def test_run_pipeline_merges_worker_results(self, create_or_update_stock):
+        ''' Worker processes fork with the patches in place (and without
+        the in-memory database), so this runs the real pool '''
+        self.symbols.append(('BAD2', 'Bad', 'NYSE'))
+        summary = tasks.run_pipeline(self.symbols, workers=3)
+        assert(summary['symbols'] == 12)
+        assert(summary['errors'] == [('BAD1', 'no data for BAD1'),
+                                     ('BAD2', 'no data for BAD2')])
+
+class TestFanOut(unittest.TestCase):
+
+    def setUp(self):
+        db.create_all()
+        self.prefetch = patch('tasks.prefetch_ohlc', no_prefetch)
+        self.prefetch.start()
+        tasks.celery.conf.CELERY_ALWAYS_EAGER = True
+        self.symbols = [('S%s' % i, 'Stock %s' % i, 'NASDAQ')
+                        for i in range(120)]
+
+    def tearDown(self):
+        tasks.celery.conf.CELERY_ALWAYS_EAGER = False
+        self.prefetch.stop()
+        db.drop_all()
+
+    @patch('tasks.calculate_indicators')
+    @patch('tasks.create_or_update_stock')
+    def test_fan_out_batches_symbols(self, create_or_update_stock,
+                                     calculate_indicators):
+        with patch('tasks.update_stocks_task.s',
+                   wraps=tasks.update_stocks_task.s) as batch:
+            tasks.fan_out(self.symbols)
+        assert([len(call[0][1]) for call in batch.call_args_list] ==
+               [50, 50, 20])
+        assert(create_or_update_stock.call_count == 120)
+        # indicators are left for the callback
+        assert(all(call[0][3] == False
+                   for call in create_or_update_stock.call_args_list))
+        calculate_indicators.assert_called_once_with(session=None)
+
+    @patch('tasks.calculate_indicators')
+    @patch('tasks.create_or_update_stock', new_callable=FailOnce)
+    def test_fan_out_retries_failed_symbols(self, create_or_update_stock,
+                                            calculate_indicators):
+        self.symbols += [('FLAKY1', 'Flaky', 'NYSE'), ('BAD1', 'Bad', 'NYSE')]
+        with patch('tasks.finish_stocks_task.run',
+                   wraps=tasks.finish_stocks_task.run) as finish:
+            tasks.fan_out(self.symbols, session=dt.date(2014,11,21))
+        assert([call[1]['attempt'] for call in finish.call_args_list] ==
+               [1, 2, 3])
+        # only the failures go out again
+        assert([sum(len(result['failed']) for result in call[0][0])
+                for call in finish.call_args_list] == [2, 1, 1])
+        # BAD1 never made it, so the session isn't published as fetched
+        calculate_indicators.assert_called_once_with(session=None)
+
+    @patch('tasks.calculate_indicators')
+    @patch('tasks.create_or_update_stock', new_callable=FailOnce)
+    def test_fan_out_publishes_the_session_once_retries_work(
+            self, create_or_update_stock, calculate_indicators):
+        self.symbols += [('FLAKY1', 'Flaky', 'NYSE')]
+        tasks.fan_out(self.symbols, session=dt.date(2014,11,21))
+        calculate_indicators.assert_called_once_with(
+            session=dt.date(2014,11,21))
+
+    @patch('tasks.calculate_indicators')
+    def test_finish_stocks_task_merges_results(self, calculate_indicators):
+        results = [{'symbols': 3, 'errors': [['BAD1', 'no data']],
+                    'failed': [['BAD1', 'Bad', 'NYSE']],
+                    'cache': {'hits': 2, 'partial': 0, 'misses': 1}},
+                   {'symbols': 2, 'errors': [], 'failed': [],
+                    'cache': {'hits': 0, 'partial': 1, 'misses': 2}}]
+        summary = tasks.finish_stocks_task(results,
+                                           attempt=tasks.SYMBOL_ATTEMPTS,
+                                           done=4,
+                                           cache={'hits': 4, 'partial': 0,
+                                                  'misses': 0})
+        assert(summary == {'symbols': 8, 'errors': [('BAD1', 'no data')],
+                           'cache': {'hits': 6, 'partial': 1,
+                                     'misses': 3}})
+
+class TestSyncSymbols(unittest.TestCase):
+
     def setUp(self):
         db.create_all()
+        self.symbols = [('S%s' % i, 'Stock %s' % i, 'NASDAQ')
+                        for i in range(5)] + [('N1', 'NYSE One', 'NYSE')]
 
     def tearDown(self):
         db.drop_all()
+
+    def stocks(self):
+        return dict((stock.symbol, (stock.name, stock.active))
+                    for stock in Stock.query.all())
+
+    def test_first_sync_adds_everything(self):
+        symbols, counts, fresh = tasks.sync_symbols(self.symbols +
+                                                    self.symbols[:1])
+        assert(symbols == fresh == self.symbols)
+        assert(counts == {'added': 6, 'removed': 0, 'relisted': 0,
+                          'renamed': 0, 'unchanged': 0})
+        assert(self.stocks()['N1'] == ('NYSE One', True))
+        # kept under NASDAQ like create_or_update_stock does
+        assert(set(stock.market for stock in Stock.query) == set(['NASDAQ']))
+
+    def test_sync_diffs_against_the_table(self):
+        tasks.sync_symbols(self.symbols)
+        listed = self.symbols[1:4] + [('S4', 'Stock Four', 'NASDAQ'),
+                                      ('NEW', 'New Listing', 'NYSE')]
+        symbols, counts, fresh = tasks.sync_symbols(listed)
+        assert(symbols == listed)
+        assert(fresh == [('NEW', 'New Listing', 'NYSE')])
+        assert(counts == {'added': 1, 'removed': 2, 'relisted': 0,
+                          'renamed': 1, 'unchanged': 3})
+        stocks = self.stocks()
+        assert(stocks['S0'] == ('Stock 0', False))
+        assert(stocks['N1'] == ('NYSE One', False))
+        assert(stocks['S4'] == ('Stock Four', True))
+        assert(stocks['NEW'] == ('New Listing', True))
+        # and back again
+        symbols, counts, fresh = tasks.sync_symbols(self.symbols)
+        assert((counts['relisted'], counts['removed'], counts['added']) ==
+               (2, 1, 0))
+        assert(fresh == [self.symbols[0], self.symbols[5]])
+        assert(all(active for name, active in self.stocks().values()
+                   if name != 'New Listing'))
+
+    def test_unchanged_sync_writes_nothing(self):
+        tasks.sync_symbols(self.symbols)
+        statements = []
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            symbols, counts, fresh = tasks.sync_symbols(self.symbols)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert(counts['unchanged'] == 6)
+        assert([s for s in statements if not s.startswith('SELECT')] == [])
+        assert(len(statements) == 1)
+
+    def test_many_delistings_are_chunked(self):
+        many = [('X%s' % i, 'X', 'NASDAQ') for i in range(1200)]
+        tasks.sync_symbols(many)
+        symbols, counts, fresh = tasks.sync_symbols(self.symbols)
+        assert(counts['removed'] == 1200)
+        assert(Stock.query.filter(Stock.active == False).count() == 1200)
+
+    @patch('tasks.publish')
+    @patch('tasks.run_pipeline')
+    def test_parse_stock_files_fetches_the_listed_symbols(self, run_pipeline,
+                                                          publish):
+        run_pipeline.return_value = {'symbols': 6, 'errors': []}
+        with patch('tasks.read_nasdaq', return_value=self.symbols[:5]), \
+                patch('tasks.read_other', return_value=self.symbols[5:]):
+            summary = tasks.parse_stock_files(workers=1)
+        run_pipeline.assert_called_once_with(self.symbols, 1)
+        assert(summary['universe']['added'] == 6)
+        assert(publish.called)
+
+    def parse(self, symbols):
+        with patch('tasks.read_nasdaq', return_value=symbols[:5]), \
+                patch('tasks.read_other', return_value=symbols[5:]):
+            return tasks.parse_stock_files(workers=1)
+
+    @patch('tasks.today')
+    @patch('tasks.publish')
+    @patch('tasks.run_pipeline')
+    def test_only_new_listings_once_the_session_is_in(self, run_pipeline,
+                                                      publish, today):
+        run_pipeline.return_value = {'symbols': 0, 'errors': []}
+        # Thanksgiving: the 26th is still the last session on the 28th
+        Publication.bump(dt.date(2014,11,26))
+        today.return_value = dt.date(2014,11,27)
+        summary = self.parse(self.symbols)
+        # the new listings are fetched and published all the same
+        run_pipeline.assert_called_with(self.symbols, 1)
+        assert(summary['universe']['added'] == 6)
+        publish.assert_called_once_with()
+        publish.reset_mock()
+        today.return_value = dt.date(2014,11,28)
+        self.parse(self.symbols)
+        run_pipeline.assert_called_with([], 1)
+        assert(not publish.called)
+        # a delisting changes the symbol index
+        self.parse(self.symbols[1:])
+        run_pipeline.assert_called_with([], 1)
+        publish.assert_called_once_with()
+        publish.reset_mock()
+        # the 28th's half day counts, once it's over
+        today.return_value = dt.date(2014,11,30)
+        self.parse(self.symbols)
+        run_pipeline.assert_called_with(self.symbols, 1)
+        publish.assert_called_once_with(dt.date(2014,11,28))
+
+    @patch('tasks.today')
+    @patch('tasks.publish', side_effect=lambda session=None:
+           Publication.bump(session))
+    @patch('tasks.run_pipeline')
+    def test_a_run_with_errors_is_fetched_again(self, run_pipeline, publish,
+                                                today):
+        today.return_value = dt.date(2014,12,2)
+        # the provider was down
+        run_pipeline.return_value = {'symbols': 6, 'errors': [
+            (symbol, 'timed out') for symbol, name, market in self.symbols]}
+        self.parse(self.symbols)
+        publish.assert_called_once_with(None)
+        run_pipeline.return_value = {'symbols': 6, 'errors': []}
+        self.parse(self.symbols)
+        run_pipeline.assert_called_with(self.symbols, 1)
+        publish.assert_called_with(dt.date(2014,12,1))
+        # and once that one's in, the next run has nothing to fetch
+        self.parse(self.symbols)
+        run_pipeline.assert_called_with([], 1)
+
+    @patch('tasks.today')
+    @patch('tasks.publish')
+    @patch('tasks.run_pipeline')
+    def test_a_new_day_is_published_without_fetching(self, run_pipeline,
+                                                     publish, today):
+        run_pipeline.return_value = {'symbols': 0, 'errors': []}
+        tasks.sync_symbols(self.symbols)
+        Publication.bump(dt.date(2014,11,26))
+        Publication.current().published_at = dt.datetime(2014,11,27,21)
+        db.session.commit()
+        today.return_value = dt.date(2014,11,27)
+        self.parse(self.symbols)
+        assert(not publish.called)
+        # signals expire overnight
+        today.return_value = dt.date(2014,11,28)
+        self.parse(self.symbols)
+        run_pipeline.assert_called_with([], 1)
+        publish.assert_called_once_with()
+
+    @patch('tasks.today')
+    @patch('tasks.publish')
+    @patch('tasks.fan_out')
+    def test_parse_stock_files_task_skips_the_fan_out(self, fan_out, publish,
+                                                      today):
+        today.return_value = dt.date(2014,11,28)
+        tasks.sync_symbols(self.symbols[:5])
+        Publication.bump(dt.date(2014,11,26))
+        with patch('tasks.read_nasdaq', return_value=self.symbols[:5]), \
+                patch('tasks.read_other', return_value=[]):
+            tasks.parse_stock_files_task()
+        assert(not fan_out.called and not publish.called)
+        with patch('tasks.read_nasdaq', return_value=self.symbols[:5]), \
+                patch('tasks.read_other', return_value=self.symbols[5:]):
+            # only the new listing
+            tasks.parse_stock_files_task()
+            fan_out.assert_called_once_with(self.symbols[5:])
+            today.return_value = dt.date(2014,12,2)
+            tasks.parse_stock_files_task()
+        fan_out.assert_called_with(self.symbols,
+                                   session=dt.date(2014,12,1))
@@ -0,0 +1,85 @@
+import unittest
+import datetime as dt
+import numpy as np
+from mock import patch
+from app.trading_calendar import TradingCalendar, exchange_holidays, easter
+from app.models import Stock
+import StockFactory as SF
+from app import db
+
+class TestTradingCalendar(unittest.TestCase):
+
+    def setUp(self):
+        self.calendar = TradingCalendar(['2014-12-24'], last_year=2015)
+
+    def test_holidays_follow_the_exchange_rules(self):
+        assert(sorted(exchange_holidays(2014)) ==
+               [dt.date(2014,1,1), dt.date(2014,1,20), dt.date(2014,2,17),
+                dt.date(2014,4,18), dt.date(2014,5,26), dt.date(2014,7,4),
+                dt.date(2014,9,1), dt.date(2014,11,27), dt.date(2014,12,25)])
+        # a Saturday New Year's Day isn't taken on the Friday, and July
+        # 4th on a Saturday is
+        assert(dt.date(2021,12,31) not in exchange_holidays(2022))
+        assert(dt.date(2020,7,3) in exchange_holidays(2020))
+        assert(dt.date(2022,6,20) in exchange_holidays(2022))
+        assert(easter(2019) == dt.date(2019,4,21))
+
+    def test_sessions(self):
+        assert(not self.calendar.is_session(dt.date(2014,11,27)))
+        assert(self.calendar.is_session(dt.date(2014,11,28)))
+        # a closing from the config and one that isn't in the rules
+        assert(not self.calendar.is_session(dt.date(2014,12,24)))
+        assert(not self.calendar.is_session(dt.date(2012,10,29)))
+        assert(self.calendar.sessions_between(dt.date(2014,11,24),
+                                              dt.date(2014,11,30)) == 4)
+        assert(self.calendar.sessions_between(dt.date(2014,11,30),
+                                              dt.date(2014,11,24)) == 0)
+        # a whole array at once
+        starts = np.array(['2014-01-01', '2014-12-22'], dtype='M8[D]')
+        assert(list(self.calendar.sessions_between(
+            starts, dt.date(2014,12,31))) == [251, 6])
+
+    def test_last_completed_session(self):
+        calendar = self.calendar
+        assert(calendar.last_completed_session(dt.date(2014,11,28)) ==
+               dt.date(2014,11,26))
+        assert(calendar.last_completed_session(dt.date(2014,12,1)) ==
+               dt.date(2014,11,28))
+        assert(calendar.previous_session(dt.date(2014,11,30)) ==
+               dt.date(2014,11,28))
+        assert(calendar.next_session(dt.date(2014,11,27)) ==
+               dt.date(2014,11,28))
+
+    def test_missing_range_is_the_completed_sessions(self):
+        calendar = self.calendar
+        assert(calendar.missing_range(dt.date(2014,11,26),
+                                      dt.date(2014,11,28)) is None)
+        assert(calendar.missing_range(dt.date(2014,11,26),
+                                      dt.date(2014,12,2)) ==
+               (dt.date(2014,11,28), dt.date(2014,12,1)))
+        assert(calendar.missing_range(dt.date(2014,12,19),
+                                      dt.date(2014,12,29)) ==
+               (dt.date(2014,12,22), dt.date(2014,12,26)))
+
+class TestStockFetchWindow(unittest.TestCase):
+
+    def setUp(self):
+        db.create_all()
+        self.stock = SF.build_stock('TSLA', 'Tesla')
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+
+    @patch('app.models.today')
+    @patch('app.models.Stock.fetch_ohlc')
+    def test_nothing_is_fetched_over_a_holiday(self, fetch, today):
+        self.stock._save_dataframe(SF.build_dataframe(
+            end_date=dt.date(2014,11,26)))
+        today.return_value = dt.date(2014,11,28)
+        assert(self.stock._should_fetch() == False)
+        self.stock.fetch_and_save_missing_ohlc()
+        assert(not fetch.called)
+        today.return_value = dt.date(2014,12,2)
+        self.stock.fetch_and_save_missing_ohlc()
+        fetch.assert_called_once_with(dt.date(2014,11,28), dt.date(2014,12,1))
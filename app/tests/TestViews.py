@@ -1,6 +1,6 @@
 from app import app, db
 import unittest
-from app.models import Stock
+from app.models import Stock, StockSnapshot
 from mock import patch
 from pandas import DataFrame, DatetimeIndex
 import datetime as dt
@@ -15,8 +15,8 @@ class TestViews(unittest.TestCase):
     def tearDown(self):
         db.drop_all()
 
-    @patch('app.models.Stock.find_buy_stocks')
-    @patch('app.models.Stock.find_sell_stocks')
+    @patch('app.models.ScreenerRow.buy_stocks')
+    @patch('app.models.ScreenerRow.sell_stocks')
     def test_home_page(self, mock_sell, mock_buy):
         rv = self.app.get('/')
         assert('Welcome to ChartFlux' in rv.data)
@@ -32,5 +32,6 @@ class TestViews(unittest.TestCase):
         self.stock = SF.build_stock()
         df = SF.build_dataframe()
         self.stock._save_dataframe(df)
+        StockSnapshot.refresh()
         rv = self.app.get('/chart?symbol=TSLA')
         assert('404' not in rv.data)
@@ -0,0 +1,139 @@
+''' The NYSE/NASDAQ trading calendar: weekdays that aren't exchange
+holidays. Holidays come from the exchange's rules plus the unscheduled
+closings, and MARKET_HOLIDAYS in the config adds any others (dates or
+'YYYY-MM-DD' strings). Everything is precomputed into a numpy
+busdaycalendar, so counting the sessions between two dates or finding
+the last one before a date is a lookup rather than a walk over the days
+in Python, and works on arrays of dates as well as single ones.
+'''
+import datetime as dt
+import numpy as np
+from app import app
+
+WEEKMASK = '1111100'
+# Years the holidays are worked out for. Past LAST_YEARS_AHEAD years from
+# now only weekends are known.
+FIRST_YEAR = 1990
+LAST_YEARS_AHEAD = 2
+# Closings that aren't in the rules
+SPECIAL_CLOSINGS = [dt.date(1994, 4, 27),    # Nixon's funeral
+                    dt.date(2001, 9, 11), dt.date(2001, 9, 12),
+                    dt.date(2001, 9, 13), dt.date(2001, 9, 14),
+                    dt.date(2004, 6, 11),    # Reagan's funeral
+                    dt.date(2007, 1, 2),     # Ford's funeral
+                    dt.date(2012, 10, 29), dt.date(2012, 10, 30),  # Sandy
+                    dt.date(2018, 12, 5),    # Bush's funeral
+                    dt.date(2025, 1, 9)]     # Carter's funeral
+
+def easter(year):
+    ''' Easter Sunday of year (the anonymous Gregorian algorithm) '''
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return dt.date(year, month, day + 1)
+
+def nth_weekday(year, month, weekday, n):
+    ''' The nth weekday (0 is Monday) of the month, or the last one if n
+    is -1 '''
+    if n > 0:
+        first = dt.date(year, month, 1)
+        return first + dt.timedelta(days=(weekday - first.weekday()) % 7
+                                    + 7 * (n - 1))
+    last = dt.date(year + month // 12, month % 12 + 1, 1) - \
+        dt.timedelta(days=1)
+    return last - dt.timedelta(days=(last.weekday() - weekday) % 7)
+
+def observed(date):
+    ''' A holiday on a Saturday is taken the Friday before, one on a
+    Sunday the Monday after '''
+    if date.weekday() == 5:
+        return date - dt.timedelta(days=1)
+    if date.weekday() == 6:
+        return date + dt.timedelta(days=1)
+    return date
+
+def exchange_holidays(year):
+    ''' The exchange's holidays in year, by its rules '''
+    holidays = [nth_weekday(year, 2, 0, 3),              # Washington's Birthday
+                easter(year) - dt.timedelta(days=2),     # Good Friday
+                nth_weekday(year, 5, 0, -1),             # Memorial Day
+                observed(dt.date(year, 7, 4)),
+                nth_weekday(year, 9, 0, 1),              # Labor Day
+                nth_weekday(year, 11, 3, 4),             # Thanksgiving
+                observed(dt.date(year, 12, 25))]
+    # New Year's Day on a Saturday isn't taken on the Friday, which is in
+    # the year before
+    if dt.date(year, 1, 1).weekday() != 5:
+        holidays.append(observed(dt.date(year, 1, 1)))
+    if year >= 1998:
+        holidays.append(nth_weekday(year, 1, 0, 3))      # Martin Luther King
+    if year >= 2022:
+        holidays.append(observed(dt.date(year, 6, 19)))  # Juneteenth
+    return holidays
+
+def to_date(date):
+    ''' date as a datetime.date, from a date, datetime64 or string '''
+    if isinstance(date, basestring):
+        return dt.datetime.strptime(date, '%Y-%m-%d').date()
+    if isinstance(date, dt.datetime):
+        return date.date()
+    if isinstance(date, np.datetime64):
+        return date.astype('M8[D]').astype(dt.date)
+    return date
+
+class TradingCalendar(object):
+    ''' The sessions (trading days) of the exchange between FIRST_YEAR
+    and last_year, as a numpy busdaycalendar '''
+
+    def __init__(self, holidays=(), first_year=FIRST_YEAR, last_year=None):
+        if last_year is None:
+            last_year = dt.date.today().year + LAST_YEARS_AHEAD
+        days = set(SPECIAL_CLOSINGS)
+        days.update(to_date(date) for date in holidays)
+        for year in range(first_year, last_year + 1):
+            days.update(exchange_holidays(year))
+        self.holidays = sorted(day for day in days if day.weekday() < 5)
+        self.busdaycal = np.busdaycalendar(weekmask=WEEKMASK,
+                                           holidays=self.holidays)
+
+    def is_session(self, date):
+        return bool(np.is_busday(date, busdaycal=self.busdaycal))
+
+    def sessions_between(self, start_date, end_date):
+        ''' The number of sessions from start_date to end_date, both
+        included. Either can be an array of dates. '''
+        end = np.asarray(end_date, dtype='M8[D]') + np.timedelta64(1, 'D')
+        return np.maximum(np.busday_count(start_date, end,
+                                          busdaycal=self.busdaycal), 0)
+
+    def previous_session(self, date):
+        ''' The last session on or before date '''
+        return to_date(np.busday_offset(date, 0, roll='backward',
+                                        busdaycal=self.busdaycal))
+
+    def next_session(self, date):
+        ''' The first session on or after date '''
+        return to_date(np.busday_offset(date, 0, roll='forward',
+                                        busdaycal=self.busdaycal))
+
+    def last_completed_session(self, today):
+        ''' The last session before today. Today's isn't over when the
+        nightly run goes. '''
+        return self.previous_session(today - dt.timedelta(days=1))
+
+    def missing_range(self, last_date, today):
+        ''' The (first, last) sessions after last_date that have
+        completed by today, or None if there aren't any '''
+        first = self.next_session(last_date + dt.timedelta(days=1))
+        last = self.last_completed_session(today)
+        if first > last:
+            return None
+        return first, last
+
+trading_calendar = TradingCalendar(app.config.get('MARKET_HOLIDAYS', []))
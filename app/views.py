@@ -1,9 +1,12 @@
 from app import app, db
-from app.models import Stock, StockPoint, today
+from app.models import Stock, StockSnapshot, ScreenerRow
+from app.response_cache import response_cache
+from app import series
+from app.symbols import symbol_index
 import datetime as dt
 import locale
+import json
 from flask import render_template, request, abort, jsonify
-from collections import defaultdict
 
 locale.setlocale(locale.LC_ALL, 'en_US') # for grouping large numbers with commas
 
@@ -12,11 +15,13 @@ def page_not_found(e):
     return render_template('404.html', error=e), 404
 
 @app.route('/')
+@response_cache.cached
 def index():
     #fifty_two_high = Stock.find_52_week_highs()
     #fifty_two_low = Stock.find_52_week_lows()
-    buy_stocks = Stock.find_buy_stocks()
-    sell_stocks = Stock.find_sell_stocks()
+    # precomputed by the nightly run, see ScreenerRow
+    buy_stocks = ScreenerRow.buy_stocks()
+    sell_stocks = ScreenerRow.sell_stocks()
     return render_template('index.html',
                            buy_stocks=buy_stocks,
                            sell_stocks=sell_stocks)
@@ -33,24 +38,15 @@ def number_filter(val):
     return locale.format("%d", val, grouping=True) if val is not None else 'N/A'
 
 @app.route('/chart')
+@response_cache.cached
 def chart():
-    symbol = request.args.get('symbol').upper()
-    try:
-        stock = Stock.query.filter(Stock.symbol == symbol).first()
-        point = stock.stockpoints[-1]
-    except:
-        abort(404, 'Something went wrong retrieving the data for %s' % symbol)
-    if point is None:
-        abort(404, 'Uh, we know that symbol, but don\'t have any data for it...')
-    # group signals by whether they are buy or sell
-    signals = defaultdict(list)
-    for sig in stock.signals:
-        if sig.expiration_date >= today():
-            signals[sig.is_buy_signal].append(sig)
-    signals['Buy'] = signals[True]
-    signals['Sell'] = signals[False]
-    del signals[True]
-    del signals[False]
+    symbol = request.args.get('symbol', '').upper()
+    # kept up to date by the nightly run, see StockSnapshot
+    snapshot = StockSnapshot.query\
+        .filter(StockSnapshot.symbol == symbol).first()
+    if snapshot is None:
+        abort(404, 'Uh, we don\'t have any data for %s...' % symbol)
+    signals = snapshot.live_signals()
     if len(signals['Buy']) == len(signals['Sell']):
         recommend = 'None'
     elif len(signals['Buy']) > len(signals['Sell']):
@@ -58,8 +54,53 @@ def chart():
     else:
         recommend = 'Sell'
     return render_template('chart.html',
-                           stock=stock,
-                           point=point,
+                           stock=snapshot,
+                           point=snapshot,
                            signals=signals,
                            recommend=recommend
                            )
+
+@app.route('/cache-stats')
+def cache_stats():
+    ''' Hits, misses, 304s and the hit ratio of the response cache since
+    this process started '''
+    return jsonify(response_cache.stats())
+
+@app.route('/api/series/<symbol>')
+@response_cache.cached
+def api_series(symbol):
+    ''' A stock's points as columnar arrays. Query args, all optional:
+    start and end (YYYY-MM-DD, both included), columns (comma separated
+    stock_point column names, OHLCV by default) and points (the most
+    points to return, downsampling the range if it has more). '''
+    def error(message, status):
+        return jsonify(error=message), status
+    columns = request.args.get('columns')
+    columns = columns.split(',') if columns else series.DEFAULT_COLUMNS
+    unknown = [col for col in columns if col not in series.COLUMNS]
+    if unknown:
+        return error('Unknown columns: %s' % ', '.join(unknown), 400)
+    try:
+        start, end = [dt.datetime.strptime(request.args[arg], '%Y-%m-%d')
+                      .date() if request.args.get(arg) else None
+                      for arg in ('start', 'end')]
+        points = int(request.args.get('points', 0))
+    except ValueError:
+        return error('Dates are YYYY-MM-DD and points is a number', 400)
+    stock = Stock.query.filter(Stock.symbol == symbol.upper()).first()
+    if stock is None:
+        return error('Unknown symbol %s' % symbol.upper(), 404)
+    dates, values = series.load_series(stock, columns, start, end)
+    dates, values = series.downsample(dates, values, points)
+    body = json.dumps(series.to_json(stock.symbol, dates, values),
+                      separators=(',', ':'))
+    return app.response_class(body, mimetype='application/json')
+
+@app.route('/api/symbols')
+def api_symbols():
+    ''' The stocks whose symbol or name starts with q, for the search
+    box. Served from the in-process symbol index. '''
+    symbol_index.refresh()
+    return jsonify(results=[dict(Symbol=symbol, Name=name, Exchange=market)
+                            for symbol, name, market in
+                            symbol_index.search(request.args.get('q', ''))])
@@ -0,0 +1,127 @@
+''' Benchmark for the nightly run's StockDirectory. Seeds stocks whose
+points stop a week ago, with the rest of their points waiting in a local
+provider, and runs a shard over them twice: looking each stock up on its
+own the way create_or_update_stock did (and with _save_dataframe's
+existence count), and through the directory. Reports the statements sent
+per symbol, split into stock lookups and the rest, and the time taken.
+
+The tables are created and dropped again, so point it at a scratch
+database:
+
+    python -m benchmarks.bench_directory [database_url] [stocks]
+
+The url defaults to a SQLite file in the temp directory.
+'''
+import datetime as dt
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from sqlalchemy import event
+from app import app, db
+
+if len(sys.argv) > 1:
+    URL = sys.argv[1]
+else:
+    URL = 'sqlite:///%s' % os.path.join(tempfile.gettempdir(),
+                                        'cf2_bench_directory.db')
+STOCKS = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+POINTS = 100
+app.config['SQLALCHEMY_DATABASE_URI'] = URL
+
+import tasks
+from app.models import Stock, StockPoint
+from app.providers import LocalProvider
+
+def seed(provider):
+    ''' Points up to a week ago in the table, and up to yesterday in
+    provider '''
+    today = dt.date.today()
+    dates = pd.date_range(end=today - dt.timedelta(days=1), periods=POINTS)
+    closes = 50 + np.random.RandomState(0).randn(POINTS).cumsum()
+    df = pd.DataFrame({'Open': closes, 'High': closes + 1, 'Low': closes - 1,
+                       'Close': closes, 'Adj Close': closes,
+                       'Volume': np.arange(POINTS) + 1000}, index=dates)
+    db.engine.execute(Stock.__table__.insert(), [
+        dict(id=i, symbol='B%05d' % i, name='Bench %s' % i, market='NASDAQ',
+             active=True) for i in range(1, STOCKS + 1)])
+    old = df[:today - dt.timedelta(days=7)]
+    rows = [dict(date=date.date(), open=row[0], high=row[1], low=row[2],
+                 close=row[3], adj_close=row[4], volume=int(row[5]))
+            for date, row in zip(old.index, old[['Open', 'High', 'Low',
+                                                  'Close', 'Adj Close',
+                                                  'Volume']].values)]
+    for i in range(1, STOCKS + 1):
+        db.engine.execute(StockPoint.__table__.insert(),
+                          [dict(row, stock_id=i) for row in rows])
+        provider.save('B%05d' % i, df)
+
+def reset():
+    ''' Drops the points the last run saved '''
+    db.engine.execute(StockPoint.__table__.delete()
+                      .where(StockPoint.date >
+                             dt.date.today() - dt.timedelta(days=7)))
+
+def without_directory(symbols):
+    ''' run_shard as it was: a lookup per symbol '''
+    directory = tasks.StockDirectory().load(symbol for symbol, name, market
+                                            in symbols)
+    for (symbol, name, market), df in tasks.prefetch_ohlc(symbols, directory):
+        stock = Stock.query.filter(Stock.symbol == symbol,
+                                   Stock.market == 'NASDAQ').first()
+        Stock.query.filter(Stock.symbol == stock.symbol,
+                           Stock.market == stock.market).count()
+        stock._save_dataframe(df)
+        stock.load_dataframe_from_db()
+
+def counted(function, symbols):
+    ''' (stock lookups, other statements, seconds) of function '''
+    statements = []
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    start = time.time()
+    try:
+        function(symbols)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    seconds = time.time() - start
+    lookups = sum(1 for s in statements if 'FROM stock \n' in s
+                  or 'FROM stock LEFT' in s)
+    return lookups, len(statements) - lookups, seconds
+
+def main():
+    db.drop_all()
+    db.create_all()
+    directory = tempfile.mkdtemp()
+    app.config['OHLC_PROVIDER'] = 'local'
+    app.config['OHLC_DIRECTORY'] = directory
+    symbols = [('B%05d' % i, 'Bench %s' % i, 'NASDAQ')
+               for i in range(1, STOCKS + 1)]
+    results = []
+    try:
+        seed(LocalProvider(directory))
+        results.append(('lookup per symbol', counted(without_directory,
+                                                     symbols)))
+        reset()
+        db.session.remove()
+        results.append(('StockDirectory', counted(
+            lambda symbols: tasks.run_shard((0, symbols), calculate=False),
+            symbols)))
+    finally:
+        del app.config['OHLC_PROVIDER']
+        del app.config['OHLC_DIRECTORY']
+        shutil.rmtree(directory)
+        db.session.remove()
+        db.drop_all()
+    print('%s: %d stocks' % (db.engine.url, STOCKS))
+    for label, (lookups, others, seconds) in results:
+        print('  %-18s %5.2f stock lookups and %5.2f other statements per '
+              'symbol, %.2f s' % (label, float(lookups) / STOCKS,
+                                  float(others) / STOCKS, seconds))
+
+if __name__ == '__main__':
+    main()
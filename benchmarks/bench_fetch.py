@@ -0,0 +1,79 @@
+''' Benchmark for the concurrent OHLC fetcher. Serves a canned 2000 day
+CSV from a local HTTP server that adds a fixed latency to every response
+(standing in for the round trip to Yahoo), and times downloading it for
+many symbols one at a time with urllib2 (a new connection per request,
+like DataReader) and with OHLCFetcher at a few in-flight limits.
+
+    python -m benchmarks.bench_fetch [symbols] [latency_ms]
+'''
+import BaseHTTPServer
+import SocketServer
+import datetime as dt
+import sys
+import threading
+import time
+import urllib2
+import numpy as np
+import pandas as pd
+from app.fetcher import OHLCFetcher, parse_csv
+
+SYMBOLS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+LATENCY = (float(sys.argv[2]) if len(sys.argv) > 2 else 50) / 1000.
+
+def canned_csv(rows=2000):
+    closes = 50 + np.random.RandomState(0).randn(rows).cumsum()
+    dates = pd.date_range(end='2014-12-01', periods=rows)[::-1]
+    return 'Date,Open,High,Low,Close,Volume,Adj Close\n' + ''.join(
+        '%s,%.2f,%.2f,%.2f,%.2f,1000,%.2f\n' % (date.date(), close,
+                                                close + 1, close - 1,
+                                                close, close)
+        for date, close in zip(dates, closes[::-1]))
+
+CSV = canned_csv()
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        time.sleep(LATENCY)
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(CSV)))
+        self.end_headers()
+        self.wfile.write(CSV)
+
+    def log_message(self, *args):
+        pass
+
+def main():
+    server = Server(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = 'http://127.0.0.1:%s/table.csv' % server.server_port
+    start_date, end_date = dt.date(2009,6,1), dt.date(2014,12,1)
+    jobs = [('B%04d' % i, start_date, end_date) for i in range(SYMBOLS)]
+    print('%d symbols, %d ms latency' % (SYMBOLS, LATENCY * 1000))
+
+    fetcher = OHLCFetcher(url)
+    start = time.time()
+    for job in jobs:
+        parse_csv(urllib2.urlopen('http://127.0.0.1:%s%s' % (
+            server.server_port, fetcher.query(*job))).read())
+    sequential = time.time() - start
+    print('  one at a time:  %6.2f s, %6.1f symbols/s'
+          % (sequential, SYMBOLS / sequential))
+    for in_flight in (1, 8, 32):
+        fetcher = OHLCFetcher(url, max_in_flight=in_flight, host_rate=None)
+        start = time.time()
+        for job, df in fetcher.fetch_many(jobs):
+            assert(len(df) == 2000)
+        seconds = time.time() - start
+        print('  %2d in flight:   %6.2f s, %6.1f symbols/s, %.1fx'
+              % (in_flight, seconds, SYMBOLS / seconds, sequential / seconds))
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+''' Benchmark for the gap planner. Seeds stocks with a full LOOKBACK_DAYS
+history of sessions, knocks holes of a few sessions into some of them,
+then times GapPlan.load over the whole table and prints its report: the
+requests and rows the plan fetches, next to fetching a session at a time
+or each stock's history again.
+
+The tables are created and dropped again, so point it at a scratch
+database:
+
+    python -m benchmarks.bench_gaps [database_url] [stocks]
+
+The url defaults to a SQLite file in the temp directory.
+'''
+import datetime as dt
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from app import app, db
+
+if len(sys.argv) > 1:
+    URL = sys.argv[1]
+else:
+    URL = 'sqlite:///%s' % os.path.join(tempfile.gettempdir(),
+                                        'cf2_bench_gaps.db')
+STOCKS = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+# Share of the stocks with holes, and how many each of those has
+HOLEY = 0.2
+HOLES = 3
+app.config['SQLALCHEMY_DATABASE_URI'] = URL
+
+from app.models import Stock, StockPoint, today
+from app.gaps import GapPlan
+from app.trading_calendar import trading_calendar
+
+def seed(random):
+    end = trading_calendar.last_completed_session(today())
+    days = np.arange(np.datetime64(end - dt.timedelta(
+        days=Stock.LOOKBACK_DAYS)), np.datetime64(end) + 1)
+    sessions = days[np.is_busday(days, busdaycal=trading_calendar.busdaycal)]
+    db.engine.execute(Stock.__table__.insert(), [
+        dict(id=i, symbol='G%05d' % i, name='Gappy %s' % i, market='NASDAQ',
+             active=True) for i in range(1, STOCKS + 1)])
+    holes = 0
+    for i in range(1, STOCKS + 1):
+        keep = np.ones(len(sessions), dtype=bool)
+        if random.rand() < HOLEY:
+            for start in random.randint(1, len(sessions) - 10, HOLES):
+                keep[start:start + random.randint(1, 6)] = False
+            holes += 1
+        db.engine.execute(StockPoint.__table__.insert(), [
+            dict(stock_id=i, date=date, open=1., high=1., low=1., close=1.,
+                 adj_close=1., volume=1)
+            for date in sessions[keep].astype(dt.date)])
+    return holes
+
+def main():
+    db.drop_all()
+    db.create_all()
+    try:
+        holey = seed(np.random.RandomState(0))
+        points = StockPoint.query.count()
+        start = time.time()
+        plan = GapPlan().load()
+        seconds = time.time() - start
+        report = plan.report()
+    finally:
+        db.session.remove()
+        db.drop_all()
+    print('%s: %d stocks, %d points, %d with holes. Plan built in %.2f s.'
+          % (db.engine.url, STOCKS, points, holey, seconds))
+    print('  gap plan            %6d requests %9d rows'
+          % (report['requests'], report['rows']))
+    print('  session at a time   %6d requests %9d rows'
+          % (report['daily_requests'], report['rows']))
+    print('  refetch histories   %6d requests %9d rows'
+          % (report['refetch_requests'], report['refetch_rows']))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+''' Benchmark for the stock, stock_point and signal indexes. Seeds a
+universe of stocks x points (10M stock_point rows by default) with a few
+live signals per stock, then times the hot queries with only the primary
+keys (the initial schema), with the old non-unique stock_point index, and
+with the indexes of eec17527f7c8:
+
+- loading one stock's last 100 points (load_dataframe_from_db)
+- looking a stock up by symbol and market (create_or_update_stock)
+- the buy/sell screener (find_buy_stocks, find_sell_stocks)
+- loading one stock's signals (Stock.signals)
+
+The tables are created and dropped again, so point it at a scratch
+database:
+
+    python -m benchmarks.bench_indexes [database_url] [stocks] [points]
+    python -m benchmarks.bench_indexes postgresql://localhost/cf2_bench
+
+The url defaults to a SQLite file in the temp directory.
+'''
+import datetime as dt
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from app import app, db
+
+if len(sys.argv) > 1:
+    URL = sys.argv[1]
+else:
+    URL = 'sqlite:///%s' % os.path.join(tempfile.gettempdir(),
+                                        'cf2_bench_indexes.db')
+STOCKS = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+POINTS = int(sys.argv[3]) if len(sys.argv) > 3 else 2000
+SIGNALS = 4     # live signals per stock
+INSERT_CHUNK = 50000
+app.config['SQLALCHEMY_DATABASE_URI'] = URL
+
+from app.models import Stock, StockPoint, Signal
+
+INDEXES = [index for table in (Stock, StockPoint, Signal)
+           for index in table.__table__.indexes]
+
+def seed():
+    ''' Fills the tables in big executemany chunks, with no indexes but
+    the primary keys '''
+    db.engine.execute(Stock.__table__.insert(), [
+        dict(id=i, symbol='B%05d' % i, name='Bench %s' % i, market='NASDAQ')
+        for i in range(1, STOCKS + 1)])
+    dates = [dt.date.today() - dt.timedelta(days=d)
+             for d in range(POINTS, 0, -1)]
+    closes = (50 + np.random.RandomState(0).randn(POINTS).cumsum()).tolist()
+    rows = []
+    for stock_id in range(1, STOCKS + 1):
+        rows.extend(dict(stock_id=stock_id, date=date, open=close,
+                         high=close, low=close, close=close,
+                         adj_close=close, volume=1000)
+                    for date, close in zip(dates, closes))
+        if len(rows) >= INSERT_CHUNK:
+            db.engine.execute(StockPoint.__table__.insert(), rows)
+            rows = []
+    if rows:
+        db.engine.execute(StockPoint.__table__.insert(), rows)
+    today = dt.date.today()
+    db.engine.execute(Signal.__table__.insert(), [
+        dict(stock_id=stock_id, expiration_date=today + dt.timedelta(days=d),
+             created_date=today, weight=0.5,
+             is_buy_signal=(stock_id + d) % 3 == 0, signal_type='RSI')
+        for stock_id in range(1, STOCKS + 1) for d in range(-20, SIGNALS)])
+
+def timed(function, runs):
+    ''' Milliseconds per run of function, after a run to warm up '''
+    function(runs)
+    start = time.time()
+    for i in range(runs):
+        function(i)
+    db.session.remove()
+    return (time.time() - start) * 1000. / runs
+
+def run_queries(runs):
+    stocks = dict((i, Stock.query.get(i % STOCKS + 1))
+                  for i in range(runs + 1))
+    db.session.expunge_all()
+    def load(i):
+        stock = stocks[i]
+        stock.load_dataframe_from_db(limit=100)
+    def lookup(i):
+        Stock.query.filter(Stock.symbol == 'B%05d' % (i % STOCKS + 1),
+                           Stock.market == 'NASDAQ').first()
+    def screen(i):
+        Stock.find_buy_stocks() if i % 2 else Stock.find_sell_stocks()
+    def signals(i):
+        list(Signal.query.filter(Signal.stock_id == i % STOCKS + 1)
+             .order_by(Signal.expiration_date.desc()))
+    return [('load last 100 points', timed(load, runs)),
+            ('stock by symbol', timed(lookup, runs)),
+            ('screener', timed(screen, max(runs // 10, 1))),
+            ('stock signals', timed(signals, runs))]
+
+def main():
+    db.drop_all()
+    db.create_all()
+    results = []
+    try:
+        for index in INDEXES:
+            index.drop(db.engine)
+        start = time.time()
+        seed()
+        print('%s: seeded %d stock_point rows in %.0f s'
+              % (db.engine.url, STOCKS * POINTS, time.time() - start))
+        results.append(('primary keys only', run_queries(5)))
+        db.engine.execute('CREATE INDEX ix_old ON stock_point (stock_id, date)')
+        results.append(('old stock_point index', run_queries(50)))
+        db.engine.execute('DROP INDEX ix_old')
+        start = time.time()
+        for index in INDEXES:
+            index.create(db.engine)
+        print('created the indexes in %.0f s' % (time.time() - start))
+        results.append(('new indexes', run_queries(50)))
+    finally:
+        db.session.remove()
+        db.drop_all()
+    for label, timings in results:
+        print('  %s: %s' % (label, ', '.join('%s %.2f ms' % timing
+                                             for timing in timings)))
+
+if __name__ == '__main__':
+    main()
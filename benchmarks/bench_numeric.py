@@ -0,0 +1,79 @@
+''' Benchmark for the NUMERIC_ASDECIMAL setting. Times loading a full
+history through the ORM and through Core, and rendering the chart page,
+with the price columns coming back as Decimals and as floats.
+
+The mode is fixed when app.models is imported, so each one runs in its
+own process. The tables are created and dropped again, so point it at a
+scratch database:
+
+    python -m benchmarks.bench_numeric [database_url]
+
+The url defaults to a SQLite file in the temp directory.
+'''
+import os
+import subprocess
+import sys
+import tempfile
+import timeit
+import numpy as np
+import pandas as pd
+from app import app, db
+
+REPEAT = 20
+
+def run(url, mode):
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['NUMERIC_ASDECIMAL'] = (mode == 'decimal')
+    from app.models import Stock, StockPoint
+    db.drop_all()
+    db.create_all()
+    try:
+        stock = Stock(symbol='BENCH', name='Bench', market='NASDAQ')
+        closes = 50 + np.random.RandomState(0).randn(Stock.LOOKBACK_DAYS).cumsum()
+        stock._save_dataframe(pd.DataFrame(
+            {'Open': closes, 'High': closes + 1, 'Low': closes - 1,
+             'Close': closes, 'Adj Close': closes, 'Volume': 1000},
+            index=pd.date_range(end=pd.Timestamp('today'),
+                                periods=Stock.LOOKBACK_DAYS)))
+        stock.calculate_indicators()
+        stock_id = stock.id
+        client = app.test_client()
+
+        def orm_load():
+            Stock.query.get(stock_id).stockpoints
+            db.session.expunge_all()
+
+        def core_load():
+            db.session.execute(StockPoint.__table__.select()
+                               .where(StockPoint.stock_id == stock_id))\
+                .fetchall()
+
+        def chart():
+            client.get('/chart?symbol=BENCH')
+            db.session.remove()
+
+        print('%s (%s mode), %d points' % (url, mode, Stock.LOOKBACK_DAYS))
+        for name, func in [('ORM history load', orm_load),
+                           ('Core history load', core_load),
+                           ('/chart render', chart)]:
+            seconds = min(timeit.repeat(func, number=1, repeat=REPEAT))
+            print('  %-18s %8.2f ms' % (name, seconds * 1000))
+    finally:
+        db.session.remove()
+        db.drop_all()
+
+def main():
+    if len(sys.argv) > 1:
+        url = sys.argv[1]
+    else:
+        url = 'sqlite:///%s' % os.path.join(tempfile.gettempdir(),
+                                            'cf2_bench.db')
+    if len(sys.argv) > 2:
+        run(url, sys.argv[2])
+    else:
+        for mode in ('decimal', 'float'):
+            subprocess.check_call([sys.executable, '-m',
+                                   'benchmarks.bench_numeric', url, mode])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+''' Benchmark for the panel engine. Times indicator runs done one Stock
+at a time (Stock.calculate_indicators, as tasks.calculate_indicators
+used to) against app.panel, both for the nightly case (one new point per
+stock) and for calculating everything, and reports the panel's array
+memory per 1000 symbols. Writing every point back dominates the full run,
+so that one is mostly a measure of the database. Last is a nightly run
+where only a tenth of the stocks got a new point, which skips the rest.
+
+The tables are created and dropped again, so point it at a scratch
+database:
+
+    python -m benchmarks.bench_panel [database_url] [stocks]
+    python -m benchmarks.bench_panel postgresql://localhost/cf2_bench 500
+
+The url defaults to a SQLite file in the temp directory.
+'''
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from app import app, db
+
+if len(sys.argv) > 1:
+    URL = sys.argv[1]
+else:
+    URL = 'sqlite:///%s' % os.path.join(tempfile.gettempdir(), 'cf2_bench.db')
+STOCKS = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+app.config['SQLALCHEMY_DATABASE_URI'] = URL
+
+from app.models import Stock, StockPoint
+from app import panel
+
+def seed(stocks, rows):
+    ''' Creates stocks with rows points each, no indicators yet. Returns
+    each stock's last close. '''
+    dates = pd.date_range(end=pd.Timestamp('today'), periods=rows).date
+    random = np.random.RandomState(0)
+    last_closes = {}
+    for i in range(stocks):
+        stock = Stock(symbol='B%04d' % i, name='Bench %s' % i, market='NASDAQ')
+        db.session.add(stock)
+        db.session.commit()
+        closes = 50 + random.randn(rows).cumsum()
+        insert_points(stock.id, dates, closes)
+        last_closes[stock.id] = closes[-1]
+    return last_closes
+
+def insert_points(stock_id, dates, closes):
+    db.engine.execute(StockPoint.__table__.insert(), [
+        dict(stock_id=stock_id, date=date, open=close, high=close + 1,
+             low=close - 1, close=close, adj_close=close, volume=1000)
+        for date, close in zip(dates, closes.tolist())])
+
+def add_day(last_closes):
+    ''' Gives every stock one more point, without indicators '''
+    date = pd.Timestamp('today').date() + pd.Timedelta(days=1)
+    random = np.random.RandomState(1)
+    for stock_id, close in sorted(last_closes.items()):
+        insert_points(stock_id, [date], close + random.randn(1))
+    return date
+
+def per_stock(incremental):
+    start = time.time()
+    for stock in Stock.query.all():
+        stock.calculate_indicators(incremental=incremental)
+    db.session.remove()
+    return time.time() - start
+
+def main():
+    db.drop_all()
+    db.create_all()
+    try:
+        last_closes = seed(STOCKS, Stock.LOOKBACK_DAYS)
+        full_loop = per_stock(incremental=False)
+        date = add_day(last_closes)
+        nightly_loop = per_stock(incremental=True)
+        StockPoint.query.filter(StockPoint.date == date)\
+            .update({'macd': None})
+        # the points went in around _save_dataframe, which marks them
+        Stock.query.update({'pending_since': date})
+        db.session.commit()
+        nightly = panel.calculate_indicators(incremental=True)
+        full = panel.calculate_indicators(incremental=False)
+        StockPoint.query.filter(StockPoint.date == date)\
+            .update({'macd': None})
+        Stock.query.filter(Stock.id % 10 == 0)\
+            .update({'pending_since': date}, synchronize_session=False)
+        db.session.commit()
+        stale = panel.calculate_indicators(incremental=True)
+    finally:
+        db.session.remove()
+        db.drop_all()
+    print('%s: %d stocks x %d points' % (db.engine.url, STOCKS,
+                                         Stock.LOOKBACK_DAYS))
+    for name, loop, summary in [('nightly', nightly_loop, nightly),
+                                ('full', full_loop, full)]:
+        print('  %s: per stock %7.2f s, panel %7.2f s, %.1fx, '
+              '%.0f MB of arrays per 1000 stocks'
+              % (name, loop, summary['seconds'], loop / summary['seconds'],
+                 summary['bytes_per_1000'] / 1e6))
+    print('  nightly, a tenth with new points: panel %7.2f s, %d stocks '
+          'calculated, %d skipped' % (stale['seconds'], stale['stocks'],
+                                      stale['skipped']))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+''' Benchmark for the sharded nightly pipeline. Runs tasks.run_pipeline
+over a made-up symbol list with 1, 2, 4 ... worker processes, each symbol
+standing in for a fetch + save + calculate with the indicator calculation
+over a random 2000 point history (no network or database), and reports
+the wall-clock time and speedup for each worker count.
+
+    python -m benchmarks.bench_pipeline [symbols] [max_workers]
+'''
+import multiprocessing
+import sys
+import numpy as np
+import pandas as pd
+import tasks
+from app.models import Stock
+
+SYMBOLS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+MAX_WORKERS = int(sys.argv[2]) if len(sys.argv) > 2 \
+    else multiprocessing.cpu_count()
+
+class NoDirectory(object):
+    ''' Stand-in for StockDirectory, since there's no database '''
+    def load(self, symbols):
+        return self
+
+    def __contains__(self, symbol):
+        return False
+
+def calculate(symbol, name, market, *args, **kwargs):
+    ''' Stand-in for create_or_update_stock '''
+    random = np.random.RandomState(int(symbol[1:]))
+    closes = 50 + random.randn(Stock.LOOKBACK_DAYS).cumsum()
+    df = pd.DataFrame({'Open': closes, 'High': closes + 1,
+                       'Low': closes - 1, 'Close': closes,
+                       'Adj Close': closes},
+                      index=pd.date_range(end='2014-12-01',
+                                          periods=len(closes)))
+    stock = Stock(symbol=symbol, name=name, market=market)
+    df, states = stock._calculate_indicators(
+        stock.calculate_adjusted_ohlc(df))
+    stock._evaluate_signals(df)
+
+def main():
+    tasks.create_or_update_stock = calculate
+    tasks.StockDirectory = NoDirectory
+    tasks.prefetch_ohlc = lambda symbols, directory: \
+        ((symbol, None) for symbol in symbols)
+    symbols = [('B%04d' % i, 'Bench %s' % i, 'NASDAQ')
+               for i in range(SYMBOLS)]
+    workers = 1
+    baseline = None
+    print('%d symbols, %d cores' % (SYMBOLS, multiprocessing.cpu_count()))
+    while workers <= MAX_WORKERS:
+        seconds = tasks.run_pipeline(symbols, workers)['seconds']
+        baseline = baseline or seconds
+        print('  %2d workers: %6.2f s, %.1fx' % (workers, seconds,
+                                                 baseline / seconds))
+        workers *= 2
+
+if __name__ == '__main__':
+    main()
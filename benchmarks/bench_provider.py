@@ -0,0 +1,46 @@
+''' Benchmark for LocalProvider. Writes the same 2000 day history for many
+symbols as Yahoo CSVs and as .npy files, then times replaying them: the
+whole history (a backfill) and the last month (a nightly run).
+
+    python -m benchmarks.bench_provider [symbols]
+'''
+import datetime as dt
+import shutil
+import sys
+import tempfile
+import time
+from app.providers import LocalProvider
+from app.fetcher import parse_csv
+from benchmarks.bench_fetch import CSV
+
+SYMBOLS = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+def replay(provider, start_date, end_date):
+    jobs = [('S%s' % i, start_date, end_date) for i in range(SYMBOLS)]
+    started = time.time()
+    rows = sum(len(df) for job, df in provider.fetch_many(jobs))
+    return time.time() - started, rows
+
+def main():
+    csv_dir, npy_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+    try:
+        df = parse_csv(CSV)
+        npy = LocalProvider(npy_dir)
+        for i in range(SYMBOLS):
+            with open(LocalProvider(csv_dir).path('S%s' % i, 'csv'), 'w') as f:
+                f.write(CSV)
+            npy.save('S%s' % i, df)
+        end = df.index[-1].date()
+        for label, start in [('full history', df.index[0].date()),
+                             ('last month', end - dt.timedelta(days=30))]:
+            csv_time, rows = replay(LocalProvider(csv_dir), start, end)
+            npy_time, rows = replay(npy, start, end)
+            print('%s, %d symbols, %d rows' % (label, SYMBOLS, rows))
+            print('  csv: %.2fs  npy: %.2fs  (%.1fx)'
+                  % (csv_time, npy_time, csv_time / npy_time))
+    finally:
+        shutil.rmtree(csv_dir)
+        shutil.rmtree(npy_dir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+''' Micro-benchmark for RSI.calculate. Compares the vectorized Wilder
+smoothing against the old iterrows() implementation, reporting rows/sec
+for a history the size of Stock.LOOKBACK_DAYS.
+
+Run from the project root:  python -m benchmarks.bench_rsi
+'''
+import timeit
+import numpy as np
+import pandas as pd
+from app.models import RSI, Stock
+
+ROWS = Stock.LOOKBACK_DAYS
+
+def legacy_rsi(df):
+    ''' The row-by-row implementation RSI.calculate used to have '''
+    rsi_df = pd.DataFrame({'Change': df['Adj Close'].diff(),
+                           'Gain': 0, 'Loss': 0,
+                           'Avg Gain': 0, 'Avg Loss': 0})
+    rsi_df.index.name = 'Date'
+    rsi_df.reset_index(inplace=True)
+    rsi_df['Gain'] = rsi_df['Change'][rsi_df['Change'] > 0]
+    rsi_df['Loss'] = rsi_df['Change'][rsi_df['Change'] < 0] * -1
+    rsi_df.fillna(value=0, inplace=True)
+    rsi_df.loc[RSI.LOOKBACK, 'Avg Gain'] = rsi_df['Gain'][1:RSI.LOOKBACK+1].mean()
+    rsi_df.loc[RSI.LOOKBACK, 'Avg Loss'] = rsi_df['Loss'][1:RSI.LOOKBACK+1].mean()
+    for index, row in rsi_df.iterrows():
+        if index > RSI.LOOKBACK:
+            rsi_df.loc[index, 'Avg Gain'] = (rsi_df['Avg Gain'][index-1] * (RSI.LOOKBACK - 1) + rsi_df['Gain'][index]) / RSI.LOOKBACK
+            rsi_df.loc[index, 'Avg Loss'] = (rsi_df['Avg Loss'][index-1] * (RSI.LOOKBACK - 1) + rsi_df['Loss'][index]) / RSI.LOOKBACK
+    rsi_df['RS'] = rsi_df['Avg Gain'] / rsi_df['Avg Loss']
+    rsi_df.set_index(keys='Date', drop=True, inplace=True)
+    df['RSI'] = 100 - (100 / (1 + rsi_df['RS']))
+    return df
+
+def build_history(rows):
+    dates = pd.date_range(end=pd.Timestamp('today'), periods=rows)
+    closes = 50 + np.random.RandomState(0).randn(rows).cumsum()
+    return pd.DataFrame({'Adj Close': closes}, index=dates)
+
+def rows_per_second(func, rows, number):
+    df = build_history(rows)
+    seconds = timeit.timeit(lambda: func(df.copy()), number=number) / number
+    return rows / seconds
+
+def main():
+    df = build_history(ROWS)
+    old, new = legacy_rsi(df.copy())['RSI'], RSI(df.copy()).calculate()['RSI']
+    assert (old.isnull() == new.isnull()).all()
+    assert np.allclose(old.dropna().values, new.dropna().values)
+    before = rows_per_second(legacy_rsi, ROWS, 3)
+    after = rows_per_second(lambda df: RSI(df).calculate(), ROWS, 200)
+    print('RSI over %d rows' % ROWS)
+    print('  iterrows:   %12.0f rows/sec' % before)
+    print('  vectorized: %12.0f rows/sec' % after)
+    print('  speedup:    %12.1fx' % (after / before))
+
+if __name__ == '__main__':
+    main()
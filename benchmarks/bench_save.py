@@ -0,0 +1,84 @@
+''' Benchmark for a first-time backfill through Stock._save_dataframe.
+Compares the old path (float() on every cell, one StockPoint per row
+appended through the relationship) with the vectorized validation and
+bulk insert (COPY on PostgreSQL), reporting rows/sec.
+
+The tables are created and dropped again, so point it at a scratch
+database:
+
+    python -m benchmarks.bench_save [database_url] [stocks]
+
+The url defaults to a SQLite file in the temp directory.
+'''
+import logging
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from app import app, db
+
+if len(sys.argv) > 1:
+    URL = sys.argv[1]
+else:
+    URL = 'sqlite:///%s' % os.path.join(tempfile.gettempdir(), 'cf2_bench.db')
+STOCKS = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+app.config['SQLALCHEMY_DATABASE_URI'] = URL
+
+from app.models import Stock, StockPoint
+
+def legacy_save_dataframe(stock, df):
+    ''' The per-row implementation _save_dataframe used to have '''
+    if Stock.query.filter(Stock.symbol==stock.symbol,
+                          Stock.market==stock.market).count() == 0:
+        db.session.add(stock)
+    for index, row in df.iterrows():
+        try:
+            [float(val) for ix,val in enumerate(row)]
+        except:
+            logging.warning('Skipping row %s', index)
+        else:
+            stock.stockpoints.append(StockPoint(date=index.date(), open=row['Open'],
+                                                high=row['High'], low=row['Low'],
+                                                close=row['Close'], adj_close=row['Adj Close'],
+                                                volume=row['Volume']))
+    db.session.commit()
+
+def build_frame(rows, random):
+    ''' A DataFrame shaped like the ones DataReader returns '''
+    closes = 50 + random.randn(rows).cumsum()
+    return pd.DataFrame({'Open': closes, 'High': closes + 1,
+                         'Low': closes - 1, 'Close': closes,
+                         'Adj Close': closes,
+                         'Volume': random.randint(1000, 100000, rows)},
+                        index=pd.date_range(end=pd.Timestamp('today'),
+                                            periods=rows, name='Date'))
+
+def rows_per_second(save, prefix):
+    random = np.random.RandomState(0)
+    frames = [build_frame(Stock.LOOKBACK_DAYS, random) for i in range(STOCKS)]
+    start = time.time()
+    for i, df in enumerate(frames):
+        save(Stock(symbol='%s%04d' % (prefix, i), name='Bench', market='NASDAQ'), df)
+        db.session.expunge_all()
+    return STOCKS * Stock.LOOKBACK_DAYS / (time.time() - start)
+
+def main():
+    db.drop_all()
+    db.create_all()
+    try:
+        before = rows_per_second(legacy_save_dataframe, 'A')
+        after = rows_per_second(lambda stock, df: stock._save_dataframe(df), 'B')
+        assert StockPoint.query.count() == 2 * STOCKS * Stock.LOOKBACK_DAYS
+    finally:
+        db.session.remove()
+        db.drop_all()
+    print('%s: backfill of %d stocks x %d points' % (db.engine.url, STOCKS,
+                                                     Stock.LOOKBACK_DAYS))
+    print('  per-row ORM: %9.0f rows/sec' % before)
+    print('  bulk:        %9.0f rows/sec' % after)
+    print('  speedup:     %9.1fx' % (after / before))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+''' Benchmark for the screener table. Grows the signal table (mostly
+expired signals, as it is after a while in production, with a few live
+ones per stock) and times the index page's queries both ways: grouping
+the signal table (Stock.find_buy_stocks/find_sell_stocks, with and
+without the index covering them) and reading the screener
+(ScreenerRow.buy_stocks/sell_stocks). Also times the nightly
+ScreenerRow.refresh.
+
+The tables are created and dropped again, so point it at a scratch
+database:
+
+    python -m benchmarks.bench_screener [database_url] [stocks]
+
+The url defaults to a SQLite file in the temp directory.
+'''
+import datetime as dt
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from app import app, db
+
+if len(sys.argv) > 1:
+    URL = sys.argv[1]
+else:
+    URL = 'sqlite:///%s' % os.path.join(tempfile.gettempdir(),
+                                        'cf2_bench_screener.db')
+STOCKS = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+RUNS = 20
+app.config['SQLALCHEMY_DATABASE_URI'] = URL
+
+from app.models import Stock, StockPoint, Signal, ScreenerRow
+
+SCREEN_INDEX = [index for index in Signal.__table__.indexes
+                if index.name == 'ix_signal_screen'][0]
+
+def seed_stocks():
+    db.engine.execute(Stock.__table__.insert(), [
+        dict(id=i, symbol='B%05d' % i, name='Bench %s' % i, market='NASDAQ')
+        for i in range(1, STOCKS + 1)])
+    db.engine.execute(StockPoint.__table__.insert(), [
+        dict(stock_id=i, date=dt.date.today(), open=10., high=10., low=10.,
+             close=10., adj_close=10., volume=1000)
+        for i in range(1, STOCKS + 1)])
+
+def add_signals(days, random):
+    ''' A day's worth of signals for each of days more days, expired but
+    for the last few: each stock fires one with a chance of 1 in 10 '''
+    today = dt.date.today()
+    rows = []
+    for day in days:
+        for stock_id in np.nonzero(random.rand(STOCKS) < 0.1)[0] + 1:
+            rows.append(dict(stock_id=int(stock_id),
+                             expiration_date=today - dt.timedelta(days=day - 5),
+                             created_date=today - dt.timedelta(days=day),
+                             weight=0.5, is_buy_signal=random.rand() < 0.5,
+                             signal_type='RSI'))
+    db.engine.execute(Signal.__table__.insert(), rows)
+
+def timed(function):
+    ''' Milliseconds per call of function, after a call to warm up '''
+    function()
+    start = time.time()
+    for i in range(RUNS):
+        function()
+        db.session.remove()
+    return (time.time() - start) * 1000. / RUNS
+
+def main():
+    db.drop_all()
+    db.create_all()
+    random = np.random.RandomState(0)
+    results = []
+    try:
+        seed_stocks()
+        days = 0
+        for total_days in [10, 100, 1000]:
+            add_signals(range(total_days, days, -1), random)
+            days = total_days
+            signals = Signal.query.count()
+            start = time.time()
+            rows = ScreenerRow.refresh()
+            refresh = time.time() - start
+            grouped = timed(lambda: (Stock.find_buy_stocks(),
+                                     Stock.find_sell_stocks()))
+            SCREEN_INDEX.drop(db.engine)
+            unindexed = timed(lambda: (Stock.find_buy_stocks(),
+                                       Stock.find_sell_stocks()))
+            SCREEN_INDEX.create(db.engine)
+            screener = timed(lambda: (ScreenerRow.buy_stocks(),
+                                      ScreenerRow.sell_stocks()))
+            results.append((signals, rows, refresh, unindexed, grouped,
+                            screener))
+    finally:
+        db.session.remove()
+        db.drop_all()
+    print('%s: %d stocks' % (db.engine.url, STOCKS))
+    for signals, rows, refresh, unindexed, grouped, screener in results:
+        print('  %8d signals: grouping signal %7.1f ms (%.1f ms without '
+              'ix_signal_screen), screener (%d rows) %.1f ms, refresh '
+              '%.2f s' % (signals, grouped, unindexed, rows, screener,
+                          refresh))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+''' Benchmark for /api/series. Seeds a stock with a 2000 bar history and
+times requests through the test client (p50 and p99 over the runs, with
+the response cache off), from the database and from the point store,
+next to serializing the stock's StockPoints through the ORM the way a
+client would have to get the series before. Also prints the payload
+sizes, raw and gzipped.
+
+The tables are created and dropped again, so point it at a scratch
+database:
+
+    python -m benchmarks.bench_series [database_url] [runs]
+
+The url defaults to a SQLite file in the temp directory.
+'''
+import datetime as dt
+import gzip
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from StringIO import StringIO
+import numpy as np
+from app import app, db
+
+if len(sys.argv) > 1:
+    URL = sys.argv[1]
+else:
+    URL = 'sqlite:///%s' % os.path.join(tempfile.gettempdir(),
+                                        'cf2_bench_series.db')
+RUNS = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+BARS = 2000
+app.config['SQLALCHEMY_DATABASE_URI'] = URL
+
+from app.models import Stock, StockPoint
+from app.response_cache import response_cache
+
+QUERIES = [('ohlcv', '/api/series/BENCH'),
+           ('ohlcv + 4 indicators',
+            '/api/series/BENCH?columns=open,high,low,close,volume,'
+            'rsi,macd,sma_50,sma_200'),
+           ('ohlcv, last year', '/api/series/BENCH?start=%s'
+            % (dt.date.today() - dt.timedelta(days=365))),
+           ('ohlcv, 500 points', '/api/series/BENCH?points=500')]
+
+def seed():
+    random = np.random.RandomState(0)
+    closes = 50 + random.randn(BARS).cumsum()
+    stock = Stock('BENCH', 'Bench Inc', 'NASDAQ')
+    db.session.add(stock)
+    db.session.commit()
+    today = dt.date.today()
+    db.engine.execute(StockPoint.__table__.insert(), [
+        dict(stock_id=stock.id, date=today - dt.timedelta(days=BARS - i),
+             open=close, high=close + 1, low=close - 1, close=close,
+             adj_close=close, volume=int(random.randint(1000, 100000)),
+             rsi=50., macd=0.1, macd_signal=0.2, sma_50=close,
+             sma_200=close)
+        for i, close in enumerate(closes.tolist())])
+    return stock
+
+def gzipped(body):
+    out = StringIO()
+    with gzip.GzipFile(fileobj=out, mode='wb') as f:
+        f.write(body)
+    return len(out.getvalue())
+
+def percentiles(function):
+    ''' p50 and p99 of function in milliseconds, after a warm up call '''
+    function()
+    times = []
+    for i in range(RUNS):
+        start = time.time()
+        function()
+        times.append((time.time() - start) * 1000.)
+    return np.percentile(times, 50), np.percentile(times, 99)
+
+def orm_series(stock_id):
+    ''' The whole history through the Stock.stockpoints relationship '''
+    db.session.expire_all()
+    stock = Stock.query.get(stock_id)
+    body = json.dumps([dict(date=str(p.date), open=float(p.open),
+                            high=float(p.high), low=float(p.low),
+                            close=float(p.close), volume=p.volume)
+                       for p in stock.stockpoints])
+    db.session.remove()
+    return body
+
+def main():
+    response_cache.backend = None
+    client = app.test_client()
+    db.drop_all()
+    db.create_all()
+    directory = tempfile.mkdtemp()
+    results = []
+    try:
+        stock_id = seed().id
+        body = orm_series(stock_id)
+        results.append(('ORM StockPoints', len(body), gzipped(body),
+                        percentiles(lambda: orm_series(stock_id))))
+        for source in ['database', 'point store']:
+            if source == 'point store':
+                app.config['POINT_STORE'] = directory
+                Stock.query.get(stock_id).save_to_store()
+            for label, url in QUERIES:
+                body = client.get(url).data
+                results.append(('%s from the %s' % (label, source),
+                                len(body), gzipped(body),
+                                percentiles(lambda: client.get(url))))
+    finally:
+        app.config.pop('POINT_STORE', None)
+        shutil.rmtree(directory)
+        db.session.remove()
+        db.drop_all()
+    print('%s: %d bars, %d runs' % (db.engine.url, BARS, RUNS))
+    for label, size, zipped, (p50, p99) in results:
+        print('  %-40s %7d bytes (%6d gzipped)  p50 %6.2f ms  p99 %6.2f ms'
+              % (label, size, zipped, p50, p99))
+
+if __name__ == '__main__':
+    main()
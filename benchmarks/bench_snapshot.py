@@ -0,0 +1,97 @@
+''' Benchmark for the chart page. Seeds stocks with longer and longer
+histories and times how the page got its data before (the Stock by
+symbol, its last point through the stockpoints relationship, and its
+live signals out of all of them) next to the StockSnapshot lookup it
+makes now, then the whole /chart request with the response cache off.
+
+The tables are created and dropped again, so point it at a scratch
+database:
+
+    python -m benchmarks.bench_snapshot [database_url] [runs]
+
+The url defaults to a SQLite file in the temp directory.
+'''
+import datetime as dt
+import os
+import sys
+import tempfile
+import time
+from app import app, db
+
+if len(sys.argv) > 1:
+    URL = sys.argv[1]
+else:
+    URL = 'sqlite:///%s' % os.path.join(tempfile.gettempdir(),
+                                        'cf2_bench_snapshot.db')
+RUNS = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+HISTORIES = [250, 1000, 2000, 5000]
+app.config['SQLALCHEMY_DATABASE_URI'] = URL
+
+from app.models import Stock, StockPoint, Signal, StockSnapshot, today
+from app.response_cache import response_cache
+
+def seed():
+    today_ = dt.date.today()
+    for i, bars in enumerate(HISTORIES):
+        stock = Stock('B%d' % bars, 'Bench %d' % bars, 'NASDAQ')
+        db.session.add(stock)
+        db.session.commit()
+        db.engine.execute(StockPoint.__table__.insert(), [
+            dict(stock_id=stock.id, date=today_ - dt.timedelta(days=d),
+                 open=10., high=11., low=9., close=10.5, adj_close=10.5,
+                 volume=1000)
+            for d in range(bars)])
+        # a signal every 20 days, all but the last few expired
+        db.engine.execute(Signal.__table__.insert(), [
+            dict(stock_id=stock.id, created_date=today_,
+                 expiration_date=today_ + dt.timedelta(days=5 - d),
+                 weight=0.5, is_buy_signal=d % 40 == 0, signal_type='RSI',
+                 description='Signal %d' % d)
+            for d in range(0, bars, 20)])
+
+def old_lookup(symbol):
+    stock = Stock.query.filter(Stock.symbol == symbol).first()
+    point = stock.stockpoints[-1]
+    signals = [sig for sig in stock.signals if sig.expiration_date >= today()]
+    return point, signals
+
+def new_lookup(symbol):
+    snapshot = StockSnapshot.query\
+        .filter(StockSnapshot.symbol == symbol).first()
+    return snapshot, snapshot.live_signals()
+
+def timed(function, symbol):
+    ''' Milliseconds per call of function, after a call to warm up '''
+    function(symbol)
+    db.session.remove()
+    start = time.time()
+    for i in range(RUNS):
+        function(symbol)
+        db.session.remove()
+    return (time.time() - start) * 1000. / RUNS
+
+def main():
+    response_cache.backend = None
+    client = app.test_client()
+    db.drop_all()
+    db.create_all()
+    results = []
+    try:
+        seed()
+        StockSnapshot.refresh()
+        for bars in HISTORIES:
+            symbol = 'B%d' % bars
+            results.append((bars, timed(old_lookup, symbol),
+                            timed(new_lookup, symbol),
+                            timed(lambda s: client.get('/chart?symbol=' + s),
+                                  symbol)))
+    finally:
+        db.session.remove()
+        db.drop_all()
+    print('%s: %d runs' % (db.engine.url, RUNS))
+    for bars, old, new, page in results:
+        print('  %5d bars: stockpoints[-1] %7.2f ms, snapshot %5.2f ms, '
+              '/chart %5.2f ms' % (bars, old, new, page))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+''' Benchmark for the point store. Times reading every stock's full
+history, and its last 100 points (about what a chart or the signals look
+at), with load_dataframe_from_db from the database and from the store.
+
+The tables are created and dropped again, so point it at a scratch
+database:
+
+    python -m benchmarks.bench_store [database_url] [stocks]
+
+The url defaults to a SQLite file in the temp directory.
+'''
+import os
+import shutil
+import sys
+import tempfile
+import time
+from app import app, db
+
+if len(sys.argv) > 1:
+    URL = sys.argv[1]
+else:
+    URL = 'sqlite:///%s' % os.path.join(tempfile.gettempdir(), 'cf2_bench.db')
+STOCKS = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+app.config['SQLALCHEMY_DATABASE_URI'] = URL
+app.config['POINT_STORE'] = tempfile.mkdtemp()
+
+from app.models import Stock
+from benchmarks.bench_panel import seed
+
+def read_all(stocks, **kwargs):
+    start = time.time()
+    rows = sum(len(stock.load_dataframe_from_db(**kwargs))
+               for stock in stocks)
+    return time.time() - start, rows
+
+def main():
+    db.drop_all()
+    db.create_all()
+    try:
+        seed(STOCKS, Stock.LOOKBACK_DAYS)
+        stocks = Stock.query.all()
+        for stock in stocks:
+            stock.save_to_store()
+        results = []
+        for label, kwargs in [('full history', {}),
+                              ('last 100', {'limit': 100})]:
+            db_time, rows = read_all(stocks, **kwargs)
+            store_time, store_rows = read_all(stocks, from_store=True,
+                                              **kwargs)
+            assert(rows == store_rows)
+            results.append((label, rows, db_time, store_time))
+    finally:
+        db.session.remove()
+        db.drop_all()
+        shutil.rmtree(app.config['POINT_STORE'])
+    print('%s: %d stocks x %d points' % (db.engine.url, STOCKS,
+                                         Stock.LOOKBACK_DAYS))
+    for label, rows, db_time, store_time in results:
+        print('  %s (%d rows): database %.2f s, store %.2f s, %.1fx'
+              % (label, rows, db_time, store_time, db_time / store_time))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+''' Benchmark for the symbol search. Seeds a universe the size of the
+NASDAQ and NYSE listings with made up symbols and names, then times
+building the SymbolIndex from the stock table and searching it for each
+prefix of a few queries as they'd be typed (p50 and p99), next to the
+LIKE query the database would need for the same search.
+
+The tables are created and dropped again, so point it at a scratch
+database:
+
+    python -m benchmarks.bench_symbols [database_url] [stocks]
+
+The url defaults to a SQLite file in the temp directory.
+'''
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from sqlalchemy import or_
+from app import app, db
+
+if len(sys.argv) > 1:
+    URL = sys.argv[1]
+else:
+    URL = 'sqlite:///%s' % os.path.join(tempfile.gettempdir(),
+                                        'cf2_bench_symbols.db')
+STOCKS = int(sys.argv[2]) if len(sys.argv) > 2 else 8000
+app.config['SQLALCHEMY_DATABASE_URI'] = URL
+
+from app.models import Stock
+from app.symbols import SymbolIndex
+
+WORDS = ['american', 'global', 'capital', 'energy', 'bio', 'pharma',
+         'systems', 'financial', 'first', 'national', 'technologies',
+         'resources', 'international', 'medical', 'networks', 'partners',
+         'realty', 'mining', 'semiconductor', 'software', 'therapeutics',
+         'bancorp', 'airlines', 'motors', 'apple', 'alpha', 'pacific']
+QUERIES = ['aapl', 'apple', 'global ene', 'x', 'semic']
+
+def seed(random):
+    letters = np.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ'))
+    symbols = set(['AAPL'])
+    while len(symbols) < STOCKS:
+        symbols.add(''.join(random.choice(letters, random.randint(1, 6))))
+    db.engine.execute(Stock.__table__.insert(), [
+        dict(symbol=symbol, market='NASDAQ' if i % 2 else 'NYSE',
+             name=' '.join(random.choice(WORDS, 3)).title() + ' Inc')
+        for i, symbol in enumerate(sorted(symbols))])
+
+def like(query):
+    return Stock.query.filter(or_(Stock.symbol.like(query.upper() + '%'),
+                                  Stock.name.like('%' + query + '%')))\
+        .limit(10).all()
+
+def percentiles(function, runs):
+    ''' p50 and p99 in microseconds of function over each prefix of each
+    query '''
+    times = []
+    for i in range(runs):
+        for query in QUERIES:
+            for end in range(1, len(query) + 1):
+                start = time.time()
+                function(query[:end])
+                times.append((time.time() - start) * 1e6)
+    return np.percentile(times, 50), np.percentile(times, 99)
+
+def main():
+    db.drop_all()
+    db.create_all()
+    try:
+        seed(np.random.RandomState(0))
+        index = SymbolIndex()
+        start = time.time()
+        index.load()
+        build = (time.time() - start) * 1000.
+        searched = percentiles(index.search, 100)
+        liked = percentiles(like, 5)
+    finally:
+        db.session.remove()
+        db.drop_all()
+    print('%s: %d stocks, %d name words, index built in %.0f ms'
+          % (db.engine.url, STOCKS, len(index.word_keys), build))
+    print('  SymbolIndex.search  p50 %8.1f us  p99 %8.1f us' % searched)
+    print('  LIKE query          p50 %8.1f us  p99 %8.1f us' % liked)
+
+if __name__ == '__main__':
+    main()
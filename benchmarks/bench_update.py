@@ -0,0 +1,95 @@
+''' Benchmark for writing calculated indicators back to stock_point.
+Compares the old ORM path (setting attributes on every StockPoint in the
+relationship) with the bulk executemany UPDATE in Stock.update_dataframe,
+and projects both onto a full-universe run.
+
+The tables are created and dropped again, so point it at a scratch
+database:
+
+    python -m benchmarks.bench_update [database_url] [stocks]
+    python -m benchmarks.bench_update postgresql://localhost/cf2_bench 20
+
+The url defaults to a SQLite file in the temp directory.
+'''
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from app import app, db
+
+UNIVERSE = 8000     # about how many NASDAQ/NYSE symbols get processed
+
+if len(sys.argv) > 1:
+    URL = sys.argv[1]
+else:
+    URL = 'sqlite:///%s' % os.path.join(tempfile.gettempdir(), 'cf2_bench.db')
+STOCKS = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+app.config['SQLALCHEMY_DATABASE_URI'] = URL
+
+from app.models import Stock, StockPoint
+
+def legacy_update_dataframe(stock, df):
+    ''' The per-row ORM implementation update_dataframe used to have '''
+    df = df.reset_index()
+    for row_index, row in df.iterrows():
+        stock.stockpoints[row_index].rsi = df.loc[row_index]['RSI']
+        stock.stockpoints[row_index].macd = df.loc[row_index]['MACD']
+        stock.stockpoints[row_index].macd_signal = df.loc[row_index]['MACD-Signal']
+        stock.stockpoints[row_index].sma_50 = df.loc[row_index]['SMA-50']
+        stock.stockpoints[row_index].sma_200 = df.loc[row_index]['SMA-200']
+        stock.stockpoints[row_index].adj_open = df.loc[row_index]['Adj Open']
+        stock.stockpoints[row_index].adj_high = df.loc[row_index]['Adj High']
+        stock.stockpoints[row_index].adj_low = df.loc[row_index]['Adj Low']
+        stock.stockpoints[row_index].high_52_weeks = df.loc[row_index]['52-Week-High']
+        stock.stockpoints[row_index].low_52_weeks = df.loc[row_index]['52-Week-Low']
+    db.session.commit()
+
+def seed(stocks, rows):
+    ''' Creates stocks with rows points each, and returns each Stock with
+    its indicators calculated (but not written) '''
+    dates = pd.date_range(end=pd.Timestamp('today'), periods=rows).date
+    random = np.random.RandomState(0)
+    seeded = []
+    for i in range(stocks):
+        stock = Stock(symbol='B%04d' % i, name='Bench %s' % i, market='NASDAQ')
+        db.session.add(stock)
+        db.session.commit()
+        closes = 50 + random.randn(rows).cumsum()
+        db.engine.execute(StockPoint.__table__.insert(), [
+            dict(stock_id=stock.id, date=date, open=close, high=close + 1,
+                 low=close - 1, close=close, adj_close=close, volume=1000)
+            for date, close in zip(dates, closes.tolist())])
+        df = stock.calculate_adjusted_ohlc(stock.load_dataframe_from_db())
+        df, states = stock._calculate_indicators(df)
+        seeded.append((stock.id, df))
+    return seeded
+
+def time_per_stock(update, seeded):
+    start = time.time()
+    for stock_id, df in seeded:
+        update(Stock.query.get(stock_id), df)
+        db.session.expunge_all()
+    return (time.time() - start) / len(seeded)
+
+def main():
+    db.drop_all()
+    db.create_all()
+    try:
+        seeded = seed(STOCKS, Stock.LOOKBACK_DAYS)
+        db.session.expunge_all()
+        orm = time_per_stock(legacy_update_dataframe, seeded)
+        bulk = time_per_stock(lambda stock, df: stock.update_dataframe(df),
+                              seeded)
+    finally:
+        db.session.remove()
+        db.drop_all()
+    print('%s: %d stocks x %d points' % (db.engine.url, STOCKS,
+                                         Stock.LOOKBACK_DAYS))
+    print('  ORM:  %7.3f s/stock, %8.0f s for %d stocks' % (orm, orm * UNIVERSE, UNIVERSE))
+    print('  bulk: %7.3f s/stock, %8.0f s for %d stocks' % (bulk, bulk * UNIVERSE, UNIVERSE))
+    print('  speedup: %.1fx' % (orm / bulk))
+
+if __name__ == '__main__':
+    main()
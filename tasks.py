@@ -3,21 +3,53 @@ from celery.schedules import crontab
 import datetime as dt
 
 import time
-from celery import Celery
+import multiprocessing
+from celery import Celery, chord
 from ftplib import FTP
 celery = Celery('tasks')
 
-from app.models import Stock
+from app import app as flask_app, db
+from app.models import Stock, ScreenerRow, StockSnapshot, Publication, \
+    EmptyGap, today
+from app.trading_calendar import trading_calendar
+from app.fetcher import MAX_IN_FLIGHT
+from app.providers import get_provider, CACHE_COUNTERS
+from app.directory import StockDirectory
+from app.gaps import GapPlan
+from app import panel
+import pandas as pd
+from sqlalchemy import select, bindparam
 import os, sys
 
-celery.conf.CELERY_BROKER = 'amqp://'
-celery.conf.CELERY_BACKEND = 'amqp'
+# Chords need a result backend. For local runs without RabbitMQ, set
+# CELERY_BROKER_URL = 'filesystem://' with CELERY_BROKER_TRANSPORT_OPTIONS =
+# {'data_folder_in': <dir>, 'data_folder_out': <same dir>} and
+# CELERY_RESULT_BACKEND = 'db+sqlite:///<file>', or CELERY_ALWAYS_EAGER =
+# True to run everything in the calling process.
+celery.conf.BROKER_URL = flask_app.config.get('CELERY_BROKER_URL', 'amqp://')
+celery.conf.BROKER_TRANSPORT_OPTIONS = \
+    flask_app.config.get('CELERY_BROKER_TRANSPORT_OPTIONS', {})
+celery.conf.CELERY_RESULT_BACKEND = \
+    flask_app.config.get('CELERY_RESULT_BACKEND', 'amqp')
+celery.conf.CELERY_ALWAYS_EAGER = flask_app.config.get('CELERY_ALWAYS_EAGER', False)
 celery.conf.CELERY_TIMEZONE = 'UTC'
 
 # THIS IS UTC TIME, which is +4 hours of EST
 HOUR = 16  
 MINUTE = 10
 
+# Worker processes the nightly run is spread across. 1 runs it all in the
+# calling process.
+WORKERS = flask_app.config.get('PIPELINE_WORKERS', multiprocessing.cpu_count())
+# Each shard logs its progress every this many symbols
+PROGRESS_EVERY = 100
+# Symbols per Celery task when the parse step fans out
+TASK_BATCH = flask_app.config.get('CELERY_SYMBOL_BATCH', 50)
+# Times a symbol is tried before the fan-out gives up on it
+SYMBOL_ATTEMPTS = 3
+# Stock ids per UPDATE when sync_symbols marks stocks (in)active
+SYNC_CHUNK = 500
+
 # READ THIS...
 #
 # Start the broker.
@@ -29,12 +61,16 @@ MINUTE = 10
 
 celery.conf.CELERYBEAT_SCHEDULE =  {
     'download_stock_files': {
-        'task': 'tasks.download_stock_files',
+        'task': 'tasks.download_stock_files_task',
         'schedule': crontab(hour=HOUR,minute=MINUTE)
     },
     'parse_stock_files': {
-        'task': 'tasks.parse_stock_files',
+        'task': 'tasks.parse_stock_files_task',
         'schedule': crontab(hour=HOUR,minute=MINUTE+1)
+    },
+    'repair_gaps': {
+        'task': 'tasks.repair_gaps_task',
+        'schedule': crontab(hour=HOUR,minute=MINUTE,day_of_week='sunday')
     }
     #'calculate_indicators': {
     #    'task': 'tasks.calculate_indicators',
@@ -60,68 +96,472 @@ def download_stock_files():
 
 @celery.task
 def parse_stock_files_task():
-    parse_stock_files()
+    ''' Syncs the stock table with the files, then fans the listed
+    symbols out to update_stocks_task, TASK_BATCH at a time, with
+    finish_stocks_task as the chord's callback. When the last run
+    already fetched the last completed session, only the new and relisted
+    symbols go out, and if there aren't any the data is still published
+    again when the sync changed something or it's a new day. '''
+    symbols, counts, fresh = sync_symbols(read_nasdaq('NASDAQ') +
+                                          read_other('NYSE'))
+    session = trading_calendar.last_completed_session(today())
+    if fetched_through(session):
+        if fresh:
+            fan_out(fresh)
+        elif needs_publishing(counts):
+            publish()
+        return
+    logging.info('Begin fanning out the stock data refresh.')
+    fan_out(symbols, session=session)
+
+def fan_out(symbols, attempt=1, done=0, cache=None, session=None):
+    ''' Queues a chord of update_stocks_task over batches of symbols.
+    attempt, done (symbols that already made it in earlier attempts),
+    cache (the earlier attempts' cache counters) and session (the one
+    being fetched) are handed on to the callback. '''
+    batches = [symbols[i:i+TASK_BATCH]
+               for i in range(0, len(symbols), TASK_BATCH)]
+    return chord(update_stocks_task.s(index, batch)
+                 for index, batch in enumerate(batches))(
+        finish_stocks_task.s(attempt=attempt, done=done, cache=cache,
+                             session=session))
+
+@celery.task
+def update_stocks_task(index, symbols):
+    ''' Fetches and saves a batch of (symbol, name, market). The
+    indicators are left for finish_stocks_task. '''
+    return run_shard((index, [tuple(symbol) for symbol in symbols]),
+                     calculate=False)
 
-def parse_stock_files():
-    '''File information here: http://www.nasdaqtrader.com/trader.aspx?id=symboldirdefs'''
+@celery.task
+def finish_stocks_task(results, attempt=1, done=0, cache=None,
+                       session=None):
+    ''' Runs once every batch of a fan_out is done. Symbols that failed
+    go out again on their own, up to SYMBOL_ATTEMPTS times. After that,
+    the indicators of everything that got new points are calculated. The
+    session is only published as fetched if no symbol was given up on, so
+    a rerun goes over everything again. '''
+    failed = [tuple(symbol) for result in results
+              for symbol in result['failed']]
+    done += sum(result['symbols'] for result in results) - len(failed)
+    cache = add_counters(results, cache)
+    if failed and attempt < SYMBOL_ATTEMPTS:
+        logging.info('Retrying %d failed symbols (attempt %d of %d).',
+                     len(failed), attempt + 1, SYMBOL_ATTEMPTS)
+        fan_out(failed, attempt + 1, done, cache, session)
+        return
+    errors = sorted(tuple(error) for result in results
+                    for error in result['errors'])
+    for symbol, error in errors:
+        logging.warning('Gave up on %s after %d attempts: %s',
+                        symbol, attempt, error)
+    logging.info('Finished refreshing stock data: %d symbols, %d errors. '
+                 'Cache: %d hits, %d partial, %d misses.', done, len(errors),
+                 cache['hits'], cache['partial'], cache['misses'])
+    calculate_indicators(session=None if errors else session)
+    return {'symbols': done, 'errors': errors, 'cache': cache}
+
+def parse_stock_files(workers=WORKERS):
+    '''File information here: http://www.nasdaqtrader.com/trader.aspx?id=symboldirdefs
+    Returns run_pipeline's summary, with the sync's counts under
+    'universe'. When the last run already fetched the last completed
+    session, nothing can be new for the stocks it had, so only the new and
+    relisted symbols are fetched, and the data is published again (without
+    a session) if the sync changed something or it's a new day. A run with
+    errors doesn't publish its session either, so the next one fetches
+    every symbol again rather than skipping the ones that failed. '''
     logging.info('Begin parsing the files and refreshing stock data.')
-    parse_nasdaq('NASDAQ')
-    parse_other('NYSE')
+    symbols, counts, fresh = sync_symbols(read_nasdaq('NASDAQ') +
+                                          read_other('NYSE'))
+    session = trading_calendar.last_completed_session(today())
+    if fetched_through(session):
+        summary = run_pipeline(fresh, workers)
+        if fresh or needs_publishing(counts):
+            publish()
+    else:
+        summary = run_pipeline(symbols, workers)
+        publish(None if summary['errors'] else session)
+    summary['universe'] = counts
     logging.info('Finished parsing the files and refreshing stock data.')
+    return summary
+
+def fetched_through(session):
+    ''' True if a run has already fetched session (and with it everything
+    that can be out) '''
+    fetched = Publication.fetched_through()
+    if fetched is None or fetched < session:
+        return False
+    logging.info('Nothing new to fetch: the last run fetched through the '
+                 '%s session, the last one completed.', fetched)
+    return True
+
+def needs_publishing(counts):
+    ''' Whether a run with nothing new to fetch still has to publish: the
+    sync changed the universe, which the symbol index only reloads with a
+    new generation, or the last publication was before today, so signals
+    have expired since the screener and snapshots were built '''
+    if any(counts[key] for key in ['added', 'removed', 'relisted',
+                                   'renamed']):
+        return True
+    current = Publication.current()
+    return current is None or current.published_at.date() < today()
+
+def sync_symbols(symbols):
+    ''' Brings the stock table in line with symbols, the (symbol, name,
+    market) of everything in the files: new listings are inserted, stocks
+    that aren't listed any more are marked inactive (and active again if
+    they come back) and renamed ones get their new name. The table is read
+    in one query, as the universe of the last sync, and written in bulk.
+    Returns the symbols to fetch, which are the listed ones, the counts
+    of what was added, removed, relisted, renamed and unchanged, and the
+    symbols of the added and relisted stocks. '''
+    listed = {}
+    for symbol, name, market in symbols:
+        listed.setdefault(symbol.upper(), (symbol, name, market))
+    table = Stock.__table__
+    # like create_or_update_stock, every stock is kept under NASDAQ
+    known = dict((row.symbol, row) for row in db.session.execute(
+        select([table.c.id, table.c.symbol, table.c.name, table.c.active])
+        .where(table.c.market == 'NASDAQ')))
+    added = [dict(symbol=symbol, name=listed[symbol][1], market='NASDAQ',
+                  active=True)
+             for symbol in listed if symbol not in known]
+    removed = [row.id for symbol, row in known.items()
+               if row.active and symbol not in listed]
+    relisted = [row.id for symbol, row in known.items()
+                if not row.active and symbol in listed]
+    renamed = [{'_id': row.id, 'name': listed[symbol][1]}
+               for symbol, row in known.items()
+               if symbol in listed and row.name != listed[symbol][1]]
+    try:
+        if added:
+            db.session.execute(table.insert(), added)
+        for ids, active in [(removed, False), (relisted, True)]:
+            # chunked to stay under the bound parameter limits
+            for i in range(0, len(ids), SYNC_CHUNK):
+                db.session.execute(table.update()
+                                   .where(table.c.id.in_(ids[i:i+SYNC_CHUNK]))
+                                   .values(active=active))
+        if renamed:
+            db.session.execute(table.update()
+                               .where(table.c.id == bindparam('_id'))
+                               .values(name=bindparam('name')), renamed)
+        db.session.commit()
+    except:
+        db.session.rollback()
+        raise
+    counts = {'added': len(added), 'removed': len(removed),
+              'relisted': len(relisted), 'renamed': len(renamed),
+              'unchanged': sum(1 for symbol, row in known.items()
+                               if row.active and symbol in listed and
+                               row.name == listed[symbol][1])}
+    logging.info('Synced the symbols: %d added, %d removed, %d relisted, '
+                 '%d renamed, %d unchanged.', counts['added'],
+                 counts['removed'], counts['relisted'], counts['renamed'],
+                 counts['unchanged'])
+    seen = set()
+    to_fetch = []
+    for symbol in symbols:
+        if symbol[0].upper() not in seen:
+            seen.add(symbol[0].upper())
+            to_fetch.append(symbol)
+    fresh = set(row['symbol'] for row in added) | \
+        set(symbol for symbol, row in known.items()
+            if not row.active and symbol in listed)
+    return to_fetch, counts, [symbol for symbol in to_fetch
+                              if symbol[0].upper() in fresh]
 
 def parse_nasdaq(market):
     logging.info('Begin parsing %s file.', market)
+    for symbol, name, market in read_nasdaq(market):
+        logging.info('Fetching data. Market: %s, Symbol: %s, Company Name: %s', market, symbol, name)
+        create_or_update_stock(symbol, name, market)
+    logging.info('Finished parsing %s file.', market)
+
+def read_nasdaq(market):
+    ''' Returns a (symbol, name, market) tuple for each stock listed in
+    the NASDAQ file '''
+    symbols = []
     path = os.path.join(os.path.dirname(__file__),'app/static/symbols/nasdaqlisted.txt')
     with open(path, 'r') as inFile:        
         next(inFile) # ignore header
         for line in inFile:
-            #time.sleep(1)
             split= line.strip('\r\n').split('|')
             # if it's not a test stock and not the last line
             if split[3] != "Y" and "File Creation Time" not in split[0]:
-                symbol = split[0]
-                name = split[1]
-                logging.info('Fetching data. Market: %s, Symbol: %s, Company Name: %s', market, symbol, name)
-                create_or_update_stock(symbol, name, market)
-    logging.info('Finished parsing %s file.', market)
+                symbols.append((split[0], split[1], market))
+    return symbols
+
+def shard(symbols, shards):
+    ''' Splits symbols into (at most) shards lists, round robin, so a run
+    of slow symbols next to each other in the files gets spread out '''
+    return [symbols[i::shards] for i in range(shards) if symbols[i::shards]]
+
+def run_pipeline(symbols, workers=WORKERS):
+    ''' Runs create_or_update_stock for each (symbol, name, market) in
+    symbols, sharded across workers processes. Each worker connects to the
+    database on its own. A symbol that fails is logged and skipped rather
+    than stopping its shard. Returns the merged results: the number of
+    symbols done, the (symbol, error) pairs of the ones that failed, the
+    seconds the run took and the download cache's hits and misses. '''
+    start = time.time()
+    shards = shard(symbols, max(workers, 1))
+    results = []
+    if workers <= 1:
+        results = [run_shard(job) for job in enumerate(shards)]
+    elif shards:
+        # forked workers mustn't share the connections already open here
+        db.session.remove()
+        db.engine.dispose()
+        pool = multiprocessing.Pool(min(workers, len(shards)),
+                                    initializer=init_worker)
+        try:
+            for result in pool.imap_unordered(run_shard, enumerate(shards)):
+                results.append(result)
+                logging.info('Shard %d finished %d symbols (%d errors) in '
+                             '%.1f seconds. %d of %d shards done.',
+                             result['shard'], result['symbols'],
+                             len(result['errors']), result['seconds'],
+                             len(results), len(shards))
+        finally:
+            pool.close()
+            pool.join()
+    summary = {'symbols': sum(result['symbols'] for result in results),
+               'errors': sorted(error for result in results
+                                for error in result['errors']),
+               'seconds': time.time() - start,
+               'cache': add_counters(results)}
+    logging.info('Finished %d symbols across %d shards in %.1f seconds, '
+                 '%d errors. Cache: %d hits, %d partial, %d misses.',
+                 summary['symbols'], len(shards), summary['seconds'],
+                 len(summary['errors']), summary['cache']['hits'],
+                 summary['cache']['partial'], summary['cache']['misses'])
+    for symbol, error in summary['errors']:
+        logging.warning('Error processing %s: %s', symbol, error)
+    return summary
 
-def create_or_update_stock(symbol, name, market):
-    stock = Stock.query.filter(Stock.symbol == symbol,
-                               Stock.market=='NASDAQ').first()
+def init_worker():
+    ''' Gives a worker process its own session and connection pool '''
+    db.session.remove()
+    db.engine.dispose()
+
+def run_shard(job, calculate=True):
+    ''' Runs create_or_update_stock for each symbol of a shard. job is
+    an (index, symbols) pair. The shard's stocks are looked up in bulk
+    first, see StockDirectory. The results list
+    the failed symbols both as (symbol, error) pairs and as the tuples
+    they came in as, and the download cache's hits and misses are
+    counted. '''
+    index, symbols = job
+    start = time.time()
+    counters = dict(CACHE_COUNTERS)
+    errors = []
+    failed = []
+    directory = StockDirectory().load(symbol for symbol, name, market
+                                      in symbols)
+    for done, ((symbol, name, market), df) in \
+            enumerate(prefetch_ohlc(symbols, directory), 1):
+        logging.info('Fetching data. Market: %s, Symbol: %s, Company Name: %s', market, symbol, name)
+        try:
+            if isinstance(df, Exception):
+                raise df
+            create_or_update_stock(symbol, name, market, calculate, df,
+                                   directory=directory)
+        except Exception as e:
+            db.session.rollback()
+            errors.append((symbol, str(e)))
+            failed.append((symbol, name, market))
+        if done % PROGRESS_EVERY == 0 or done == len(symbols):
+            logging.info('Shard %d: %d of %d symbols done, %d errors.',
+                         index, done, len(symbols), len(errors))
+    return {'shard': index, 'symbols': len(symbols), 'errors': errors,
+            'failed': failed, 'seconds': time.time() - start,
+            'cache': dict((key, CACHE_COUNTERS[key] - counters[key])
+                          for key in counters)}
+
+def add_counters(results, counters=None):
+    ''' Sums the download cache's counters of results (onto counters) '''
+    counters = dict(counters or {'hits': 0, 'partial': 0, 'misses': 0})
+    for result in results:
+        for key, count in result.get('cache', {}).items():
+            counters[key] = counters.get(key, 0) + count
+    return counters
+
+def prefetch_ohlc(symbols, directory):
+    ''' Fetches the points the stocks of symbols are missing (going by
+    the last dates in directory) in one batch from the configured provider
+    (Yahoo downloads run up to MAX_IN_FLIGHT at once), and yields
+    ((symbol, name, market), df) for each symbol as its fetch finishes.
+    df is None when there was nothing to fetch, empty when the symbol
+    wasn't found and the exception when the fetch failed. With
+    MAX_IN_FLIGHT at 1 nothing is prefetched and every df is None. '''
+    if MAX_IN_FLIGHT <= 1:
+        for symbol in symbols:
+            yield symbol, None
+        return
+    jobs = {}
+    for symbol, name, market in symbols:
+        last_date = directory.last_date(symbol) if symbol in directory \
+            else None
+        date_range = Stock.missing_ohlc_range(last_date)
+        if date_range is None:
+            yield (symbol, name, market), None
+        else:
+            jobs[(symbol,) + date_range] = (symbol, name, market)
+    for job, df in get_provider().fetch_many(jobs.keys()):
+        yield jobs[job], pd.DataFrame() if df is None else df
+
+def create_or_update_stock(symbol, name, market, calculate=True, df=None,
+                           directory=None):
+    ''' Saves the new points of symbol (fetching them, unless they're
+    given as df) and calculates its indicators. With a StockDirectory,
+    the stock and the dates it's missing come from the directory instead
+    of the database, and a symbol it doesn't have is a new stock. If the
+    points can't be written, the error is raised. '''
+    if directory is not None:
+        stock = directory.stock(symbol) if symbol in directory else None
+        if df is None:
+            last_date = directory.last_date(symbol) if stock else None
+            date_range = Stock.missing_ohlc_range(last_date)
+            if date_range is not None:
+                df = (stock or Stock(symbol, name, 'NASDAQ'))\
+                    .fetch_ohlc(*date_range)
+            if df is None:
+                df = pd.DataFrame()
+    else:
+        stock = Stock.query.filter(Stock.symbol == symbol,
+                                   Stock.market=='NASDAQ').first()
     if stock is None:
         logging.info('New stock (not currently in our database): Market: %s, Symbol: %s, Company Name: %s', market, symbol, name)
         stock = Stock(symbol=symbol,name=name,market="NASDAQ")
-    df = stock.get_dataframe()
+    if df is None:
+        df = stock.get_dataframe()
+    else:
+        if len(df) > 0:
+            # a failed write goes to run_shard, to be retried
+            stock._save_dataframe(df, raise_errors=True)
+            if directory is not None and symbol in directory:
+                # the commit expired it, which would cost a query to refresh
+                stock = directory.stock(symbol)
+        df = stock.load_dataframe_from_db()
     if df is None or len(df) == 0:
         logging.warning('Error retrieving Stock from the database (DataFrame is empty...): Stock.id: %s, Market: %s, Symbol: %s, Company Name: %s', stock.id, market, symbol, name)
-    else:
-        stock.calculate_indicators()
+    elif calculate:
+        stock.calculate_indicators(incremental=True)
 
 
+@celery.task
+def repair_gaps_task():
+    repair_gaps()
+
+def repair_gaps(calculate=True):
+    ''' Fetches the sessions missing from the middle of the stocks'
+    histories, one request per gap (see GapPlan), and saves them. Then the
+    indicators are calculated again from the first new point on, unless
+    calculate is off. Returns the plan's report, with the number of points
+    saved. The gaps are fetched past the OHLC cache, which would only give
+    back the hole it has on disk. One the provider has nothing for (a
+    halted stock, say) is recorded as an EmptyGap so it isn't asked for
+    again, while one that failed stays in the plan. EmptyGaps older than
+    EmptyGap.TTL_DAYS are pruned first, so those get asked for again. '''
+    pruned = EmptyGap.prune()
+    db.session.commit()
+    if pruned:
+        logging.info('Pruned %d expired empty gaps.', pruned)
+    plan = GapPlan().load()
+    report = plan.report()
+    logging.info('Found %d gaps (%d sessions) in %d stocks. That would be '
+                 '%d requests a session at a time, or %d requests for %d '
+                 'points fetching the histories again.', report['requests'],
+                 report['rows'], report['stocks'], report['daily_requests'],
+                 report['refetch_requests'], report['refetch_rows'])
+    report['saved'] = 0
+    report['empty'] = 0
+    if not len(plan):
+        return report
+    table = Stock.__table__
+    symbols = dict(tuple(row) for row in db.session.execute(
+        select([table.c.id, table.c.symbol]).where(table.c.market == 'NASDAQ')))
+    jobs = dict(((symbols[stock_id], start, end), stock_id)
+                for stock_id, start, end in plan.ranges()
+                if stock_id in symbols)
+    directory = StockDirectory().load(symbol for symbol, start, end in jobs)
+    provider = get_provider(cached=False)
+    for (symbol, start, end), df in provider.fetch_many(jobs.keys()):
+        if df is None or isinstance(df, Exception):
+            continue
+        df = df[(df.index >= pd.Timestamp(start)) &
+                (df.index <= pd.Timestamp(end))]
+        if len(df) == 0:
+            db.session.add(EmptyGap(jobs[(symbol, start, end)], start, end))
+            db.session.commit()
+            report['empty'] += 1
+            continue
+        report['saved'] += directory.stock(symbol)._save_dataframe(df)
+    logging.info('Saved %d points into the gaps, and %d gaps came back '
+                 'empty.', report['saved'], report['empty'])
+    if calculate and report['saved']:
+        calculate_indicators()
+    return report
+
 @celery.task
 def calculate_indicators_task():
     calculate_indicators()
 
-def calculate_indicators():
+def calculate_indicators(per_stock=False, session=None):
+    ''' Calculates the indicators of the stocks that got new points (see
+    Stock.pending_since), skipping the rest. They're done a batch of
+    stocks at a time by the panel engine, unless per_stock is set. Then
+    the new data gets published, as fetched through session if it's given.
+    Returns the counts of stocks processed and skipped. '''
     logging.info('Begin Calculating indicators for all stocks.')
-    for stock in Stock.query.all():
-        logging.info('Updating indicators for %s [%s]', stock.symbol, stock.name)
-        stock.calculate_indicators()
+    if not per_stock:
+        summary = panel.calculate_indicators(incremental=True)
+    else:
+        pending = Stock.query.filter(Stock.pending_since != None)\
+            .order_by(Stock.id).all()
+        summary = {'stocks': len(pending),
+                   'skipped': Stock.query.count() - len(pending)}
+        for stock in pending:
+            logging.info('Updating indicators for %s [%s]', stock.symbol, stock.name)
+            stock.calculate_indicators(incremental=True)
+        logging.info('Calculated indicators for %d stocks, skipped %d with '
+                     'no new data.', summary['stocks'], summary['skipped'])
+    publish(session)
+    return summary
+
+def publish(session=None):
+    ''' Rebuilds the screener and snapshot tables the index and chart
+    pages read, once the night's signals are in, then bumps the data
+    generation so the cached pages get rendered again. session is the
+    last completed session the run fetched, if it was a fetching run. '''
+    start = time.time()
+    rows = ScreenerRow.refresh()
+    logging.info('Refreshed the screener: %d stocks in %.1f seconds.',
+                 rows, time.time() - start)
+    start = time.time()
+    rows = StockSnapshot.refresh()
+    logging.info('Refreshed the snapshots: %d stocks in %.1f seconds.',
+                 rows, time.time() - start)
+    logging.info('Published data generation %d.', Publication.bump(session))
 
 def parse_other(market):
     logging.info('Begin parsing %s file.', market)
+    for symbol, name, market in read_other(market):
+        logging.info('Fetching data. Market: %s, Symbol: %s, Company Name: %s', market, symbol, name)
+        create_or_update_stock(symbol, name, market)
+    logging.info('Finished parsing %s file.', market)
+
+def read_other(market):
+    ''' Returns a (symbol, name, market) tuple for each NYSE stock listed
+    in the other file '''
+    symbols = []
     path = os.path.join(os.path.dirname(__file__),'app/static/symbols/otherlisted.txt')
     with open(path, 'r') as inFile:        
         next(inFile) # ignore header
         for line in inFile:
-            #time.sleep(1)
             split = line.strip('\r\n').split('|')
             # if it's not a test stock and not the last line
             if 'File Creation Time' not in split[0] and split[2] == 'N' and split[6] != 'Y':
-                symbol = split[7]
-                name = split[1]
-                logging.info('Fetching data. Market: %s, Symbol: %s, Company Name: %s', market, symbol, name)
-                create_or_update_stock(symbol, name, market)
-    logging.info('Finished parsing %s file.', market)
-
-
+                symbols.append((split[7], split[1], market))
+    return symbols